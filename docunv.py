@@ -9,13 +9,22 @@ Copyright (c) 2009 David Peckham. All rights reserved.
 Enhanced by Sanjay Sharma (indoos@gmail.com) 2025-10-17.
 """
 
+import os
 import sys
+import glob
+import time
 import getopt
 
 import pyunv
 from pyunv.universe import Universe
 from pyunv.reader import Reader
+from pyunv.tracing import PrintTracer
 from pyunv.manifest import Manifest
+from pyunv.cache import ParseCache
+from pyunv.batch import run_batch
+from pyunv.watch import Watcher
+from pyunv.server import make_server
+from pyunv.inventory import scan_inventories, write_inventory
 
 __version__ = "0.1.0"
 
@@ -24,19 +33,54 @@ Create a text manifest for your BusinessObjects XI R2 universe.
 Copyright (c) 2009 David Peckham. All rights reserved
 
 pyunv options universe.unv
+pyunv options universe.unv|directory|pattern ...
 
     where options are:
 
     -m  --manifest   manifest output file 
     -t  --template   manifest template
+    -c  --cache      parse cache directory (reuses unchanged universes)
+    -v               report derived tables, prompts and other details
     -h  --help       show this help
 
+    batch options (used with several universes, directories or patterns):
+
+    -w  --workers    number of worker processes (default: one per CPU)
+    -o  --output-dir write outputs under this directory
+    -f  --format     manifest, csv or both (default: manifest)
+    -s  --summary    write a JSON summary of timings and errors
+
+    watch options (keep running and re-document universes as they change):
+
+        --watch      watch the universes, directories or patterns
+    -i  --interval   seconds between checks for changes (default: 1)
+
+    server options (serve the universes in a directory as JSON):
+
+        --serve      [host:]port to listen on (default host: 127.0.0.1)
+
+    inventory options (summarise universes from their headers only):
+
+        --inventory  write a CSV row per universe to this file (- for stdout)
+
 Examples:
   docunv universe.unv
   docunv --manifest manifest.txt universe.unv 
   docunv --manifest manifest.txt --template manifest.mako universe.unv 
+  docunv --cache ~/.cache/pyunv universe.unv
+  docunv --workers 8 --format both --output-dir docs universes/
+  docunv --summary summary.json "archive/**/*.unv"
+  docunv --watch --format both universes/
+  docunv --serve 8080 universes/
+  docunv --inventory catalog.csv "archive/**/*.unv"
 '''
 
+_FORMATS = {
+    'manifest': ('manifest',),
+    'csv': ('csv',),
+    'both': ('manifest', 'csv'),
+}
+
 def version():
     return ' %s (pyunv %s)' % (__version__, pyunv.__version__)
 
@@ -51,7 +95,10 @@ def main(argv=None):
         argv = sys.argv
     try:
         try:
-            opts, args = getopt.getopt(argv[1:], "hm:t:v", ["help", "manifest=", "template="])
+            opts, args = getopt.getopt(argv[1:], "hm:t:c:vw:o:f:s:i:",
+                ["help", "manifest=", "template=", "cache=", "workers=",
+                "output-dir=", "format=", "summary=", "watch", "interval=", "serve=",
+                "inventory="])
         except getopt.error as msg:
             raise Usage(msg)
         
@@ -61,6 +108,16 @@ def main(argv=None):
         verbose = False
         manifest = None
         template = None
+        cache = None
+        cache_dir = None
+        workers = None
+        output_dir = None
+        outputs = None
+        summary = None
+        watch = False
+        interval = 1.0
+        serve = None
+        inventory = None
             
         # option processing
         for option, value in opts:
@@ -74,12 +131,75 @@ def main(argv=None):
                     raise Usage(help_message)
             if option in ("-t", "--template"):
                 template = value
+            if option in ("-c", "--cache"):
+                cache = ParseCache(value)
+                cache_dir = value
+            if option in ("-w", "--workers"):
+                try:
+                    workers = int(value)
+                except ValueError:
+                    raise Usage('--workers must be a number')
+                if workers < 1:
+                    raise Usage('--workers must be at least 1')
+            if option in ("-o", "--output-dir"):
+                output_dir = value
+            if option in ("-f", "--format"):
+                if value not in _FORMATS:
+                    raise Usage('--format must be manifest, csv or both')
+                outputs = _FORMATS[value]
+            if option in ("-s", "--summary"):
+                summary = value
+            if option == "--watch":
+                watch = True
+            if option in ("-i", "--interval"):
+                try:
+                    interval = float(value)
+                except ValueError:
+                    raise Usage('--interval must be a number of seconds')
+            if option == "--serve":
+                host, _, port = value.rpartition(':')
+                try:
+                    serve = (host or '127.0.0.1', int(port))
+                except ValueError:
+                    raise Usage('--serve must be [host:]port')
+            if option == "--inventory":
+                inventory = value
+
+        if inventory is not None:
+            return inventory_universes(args, inventory)
+
+        if serve is not None:
+            if len(args) != 1 or not os.path.isdir(args[0]):
+                raise Usage('--serve needs one directory of universes')
+            return serve_universes(args[0], *serve)
+
+        if watch:
+            if manifest is not None:
+                raise Usage('--manifest names one file; use --output-dir '
+                    'with --watch')
+            return watch_universes(args, outputs or ('manifest',),
+                output_dir, template, interval, verbose)
+
+        batch = len(args) > 1 or os.path.isdir(args[0]) or \
+            glob.has_magic(args[0]) or workers is not None or \
+            output_dir is not None or outputs is not None or \
+            summary is not None
+        if batch:
+            if manifest is not None:
+                raise Usage('--manifest names one file; use --output-dir '
+                    'with several universes')
+            return document_batch(args, workers, outputs or ('manifest',),
+                output_dir, template, cache_dir, summary, verbose)
         
         universe_filename = args[0]
-        reader = None
+        universe = None
         try:
-            with open(universe_filename, 'rb') as universe_file:
-                reader = Reader(universe_file)
+            if cache is not None:
+                universe = cache.read(universe_filename)
+            else:
+                with open(universe_filename, 'rb') as universe_file:
+                    tracer = PrintTracer() if verbose else None
+                    universe = Reader(universe_file, tracer=tracer).universe
                 
             if manifest is None:
                 manifest_filename = universe_filename+'.txt'
@@ -87,7 +207,7 @@ def main(argv=None):
                 manifest_filename = manifest
                 
             with open(manifest_filename, 'w') as manifest_file:
-                Manifest(reader.universe, template).save(manifest_file)
+                Manifest(universe, template).save(manifest_file)
         except IOError as error:
             print("Unable to open %s: %s (error %d)" % (
                 error.filename, error.strerror, error.errno), file=sys.stderr)
@@ -102,5 +222,95 @@ def main(argv=None):
         return 2
 
 
+def document_batch(paths, workers, outputs, output_dir, template, cache_dir,
+        summary_path, verbose=False):
+    """document the universes named by paths and return the exit status"""
+    def progress(result):
+        if result['status'] == 'ok':
+            if verbose:
+                print('%s (%.2fs)' % (result['path'],
+                    result['timings']['total']))
+        else:
+            print('Unable to document %s: %s' % (result['path'],
+                result['error']), file=sys.stderr)
+
+    summary = run_batch(paths, workers=workers, outputs=outputs,
+        output_dir=output_dir, template=template, cache_dir=cache_dir,
+        summary_path=summary_path, progress=progress)
+    if summary['universes'] == 0:
+        print('No universes found', file=sys.stderr)
+        return 1
+    print('Documented %d of %d universes in %.2fs' % (summary['succeeded'],
+        summary['universes'], summary['elapsed']))
+    return 1 if summary['failed'] else 0
+
+
+def watch_universes(paths, outputs, output_dir, template, interval,
+        verbose=False):
+    """re-document the universes named by paths as they change, until
+    interrupted"""
+    def progress(result):
+        if result['status'] == 'ok':
+            print('%s %s (%.2fs)' % (time.strftime('%H:%M:%S'),
+                result['path'], result['timings']['total']))
+        elif result['status'] == 'removed':
+            if verbose:
+                print('%s %s removed' % (time.strftime('%H:%M:%S'),
+                    result['path']))
+        else:
+            print('Unable to document %s: %s' % (result['path'],
+                result['error']), file=sys.stderr)
+
+    watcher = Watcher(paths, outputs=outputs, output_dir=output_dir,
+        template=template, interval=interval, progress=progress)
+    print('Watching %s (press Ctrl-C to stop)' % ', '.join(paths))
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 0
+
+
+def inventory_universes(paths, output):
+    """write an inventory of the universes named by paths to output and
+    return the exit status"""
+    failed = []
+    def rows():
+        for row in scan_inventories(paths):
+            if row['error']:
+                failed.append(row)
+                print('Unable to scan %s: %s' % (row['path'], row['error']),
+                    file=sys.stderr)
+            yield row
+
+    if output == '-':
+        count = write_inventory(rows(), sys.stdout)
+    else:
+        with open(output, 'w', newline='') as f:
+            count = write_inventory(rows(), f)
+    if count == 0:
+        print('No universes found', file=sys.stderr)
+        return 1
+    if output != '-':
+        print('Scanned %d universes into %s' % (count, output))
+    return 1 if failed else 0
+
+
+def serve_universes(root, host, port):
+    """serve the universes under root as JSON until interrupted"""
+    server = make_server(root, host, port)
+    print('Serving %s on http://%s:%d/universes (press Ctrl-C to stop)' % (
+        root, host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
 if __name__ == "__main__":
     sys.exit(main())
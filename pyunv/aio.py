@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+aio.py
+
+Parse universes from asyncio code without blocking the event loop.
+
+Reader does its file I/O, decoding and analysis in one blocking call.
+AsyncReader runs that call in a worker pool and bounds how many parses
+run at once, so an asyncio service can parse many universes concurrently
+and stay responsive.
+
+    universe = await read_universe('sample.unv')
+
+    reader = AsyncReader(max_concurrency=4, processes=True)
+    universes = await asyncio.gather(*[reader.read(p) for p in paths])
+    reader.close()
+
+With processes=True the universes are parsed in worker processes (in
+parallel, on several CPUs) and sent back as snapshots. Otherwise they
+are parsed in threads, which frees the event loop but shares one CPU.
+
+Cancelling a read that is still waiting for a worker removes it from the
+queue. A parse that has already started can't be interrupted: it runs to
+the end in its worker, keeps its concurrency slot until then, and its
+result is discarded.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+
+from pyunv import snapshot
+from pyunv.reader import Reader
+from pyunv.decoder import source_buffer
+
+
+def _read(source, options):
+    """parse source in a worker and return the universe"""
+    return Reader(source, **options).universe
+
+
+def _read_snapshot(source, options):
+    """parse source in a worker process and return a snapshot of the
+    universe"""
+    reader = Reader(source, **options)
+    universe = reader.universe
+    if reader.lazy:
+        # a snapshot can't carry the reader, so load everything now
+        for name in universe.pending:
+            getattr(universe, name)
+        reader.close()
+    return snapshot.dumps(universe)
+
+
+class AsyncReader(object):
+
+    """Parse universes in a worker pool for asyncio code
+
+    executor is the concurrent.futures executor to parse in; by default
+    the reader makes a thread pool (or a process pool when processes is
+    true) and shuts it down in close(). max_concurrency limits the
+    number of parses submitted at once (default: one per CPU).
+    """
+
+    def __init__(self, executor=None, max_concurrency=None,
+            processes=False):
+        super(AsyncReader, self).__init__()
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.processes = processes
+        self.owned = executor is None
+        if executor is None:
+            if processes:
+                executor = concurrent.futures.ProcessPoolExecutor(
+                    self.max_concurrency)
+            else:
+                executor = concurrent.futures.ThreadPoolExecutor(
+                    self.max_concurrency, thread_name_prefix='pyunv')
+        self.executor = executor
+        self._loop = None
+        self._semaphore = None
+
+    def _slots(self):
+        # an asyncio.Semaphore belongs to the loop it is first used in
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return loop, self._semaphore
+
+    async def read(self, source, **options):
+        """return the Universe in source (a path, or the universe contents
+        as bytes, bytearray, memoryview or io.BytesIO). options are passed
+        on to Reader."""
+        if self.processes:
+            buffer = source_buffer(source)
+            if buffer is not None:
+                source = buffer
+            elif not isinstance(source, (str, os.PathLike)):
+                raise TypeError('universes parsed in worker processes must '
+                    'be paths or in-memory contents, not %s'
+                    % type(source).__name__)
+            function = _read_snapshot
+        else:
+            function = _read
+        loop, semaphore = self._slots()
+        await semaphore.acquire()
+        try:
+            future = self.executor.submit(function, source, options)
+        except:
+            semaphore.release()
+            raise
+
+        def release(f):
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                pass    # the loop has been closed
+        # release the slot when the worker is really done with the parse,
+        # not when the awaiting task gives up on it
+        future.add_done_callback(release)
+        result = await asyncio.wrap_future(future)
+        if self.processes:
+            result = snapshot.loads(result)
+        return result
+
+    def close(self, wait=True):
+        """shut down the worker pool, if the reader made it"""
+        if self.owned:
+            self.executor.shutdown(wait=wait)
+
+
+_default_reader = None
+
+
+async def read_universe(source, reader=None, **options):
+    """return the Universe in source without blocking the event loop
+
+    The universe is parsed by reader, an AsyncReader, or by a shared
+    thread pool reader when reader is None. options are passed on to
+    Reader.
+    """
+    global _default_reader
+    if reader is None:
+        if _default_reader is None:
+            _default_reader = AsyncReader()
+        reader = _default_reader
+    return await reader.read(source, **options)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+batch.py
+
+Document many universes in parallel.
+
+run_batch finds the universes in a list of files, directories and glob
+patterns and documents each one in a worker process. It writes a
+manifest, a CSV inventory, or both, for each universe. A universe that
+can't be documented is recorded in the summary with its error, and the
+rest of the batch carries on.
+
+    summary = run_batch(['universes/', 'archive/*.unv'], workers=8,
+        outputs=('manifest', 'csv'), output_dir='docs',
+        summary_path='docs/summary.json')
+"""
+
+import concurrent.futures
+import glob
+import json
+import os
+import time
+import traceback
+from concurrent.futures.process import BrokenProcessPool
+
+import pyunv
+from pyunv.reader import Reader
+from pyunv.cache import ParseCache
+from pyunv.manifest import Manifest
+from pyunv.csvwriter import CsvWriter
+
+
+OUTPUTS = ('manifest', 'csv')
+
+_EXTENSIONS = {'manifest': '.txt', 'csv': '.csv'}
+
+
+def find_universes(paths):
+    """return the sorted universe files named by paths
+
+    Each path may be a universe file, a directory (searched recursively
+    for *.unv files) or a glob pattern.
+    """
+    found = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in files:
+                    if name.lower().endswith('.unv'):
+                        found.add(os.path.join(root, name))
+        elif glob.has_magic(path):
+            for match in glob.glob(path, recursive=True):
+                if os.path.isfile(match):
+                    found.add(match)
+        else:
+            found.add(path)
+    return sorted(found)
+
+
+def output_paths(path, outputs, output_dir=None, root=None):
+    """return {output: filename} for the universe at path
+
+    Outputs go next to the universe (universe.unv.txt, universe.unv.csv)
+    unless output_dir is given. Then they go to the same relative path
+    under output_dir as the universe has under root.
+    """
+    if output_dir is None:
+        base = path
+    else:
+        relative = os.path.relpath(path, root) if root else \
+            os.path.basename(path)
+        base = os.path.join(output_dir, relative)
+    return dict((output, base + _EXTENSIONS[output]) for output in outputs)
+
+
+def write_output(universe, output, filename, template=None):
+    """write one output ('manifest' or 'csv') of universe to filename"""
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+    if output == 'manifest':
+        with open(filename, 'w') as f:
+            Manifest(universe, template).save(f)
+    else:
+        with open(filename, 'w', newline='') as f:
+            CsvWriter(universe, f)
+
+
+def document_universe(path, outputs=('manifest',), output_dir=None,
+        root=None, template=None, cache_dir=None):
+    """parse the universe at path and write its outputs
+
+    Return a result dictionary with the universe path, its status ('ok'
+    or 'error'), the files written, the time taken by each phase in
+    seconds and, on failure, the error and its traceback. Exceptions are
+    never raised, so one bad universe can't stop a batch.
+    """
+    result = {'path': path, 'status': 'ok', 'outputs': {}, 'timings': {},
+        'error': None}
+    timings = result['timings']
+    start = time.perf_counter()
+    phase = 'parse'
+    try:
+        if cache_dir:
+            universe = ParseCache(cache_dir).read(path)
+        else:
+            universe = Reader(path).universe
+        timings['parse'] = time.perf_counter() - start
+        files = output_paths(path, outputs, output_dir, root)
+        for output in outputs:
+            phase = output
+            phase_start = time.perf_counter()
+            write_output(universe, output, files[output], template)
+            result['outputs'][output] = files[output]
+            timings[output] = time.perf_counter() - phase_start
+    except Exception as error:
+        result['status'] = 'error'
+        result['error'] = '%s: %s' % (type(error).__name__, error)
+        result['phase'] = phase
+        result['traceback'] = traceback.format_exc()
+    timings['total'] = time.perf_counter() - start
+    return result
+
+
+def _worker_error(path, error):
+    """return the result of a universe whose worker failed"""
+    return {'path': path, 'status': 'error', 'outputs': {}, 'timings': {},
+        'error': '%s: %s' % (type(error).__name__, error), 'phase': 'worker'}
+
+
+def run_batch(paths, workers=None, outputs=('manifest',), output_dir=None,
+        template=None, cache_dir=None, summary_path=None, progress=None):
+    """document every universe named by paths and return a summary
+
+    workers is the number of worker processes (None means one per CPU,
+    1 documents the universes in this process). progress, if given, is
+    called with each result as it completes. The summary is also
+    written to summary_path as JSON when it is given.
+    """
+    for output in outputs:
+        if output not in OUTPUTS:
+            raise ValueError('unknown output %r (expected one of %s)'
+                % (output, ', '.join(OUTPUTS)))
+    universes = find_universes(paths)
+    root = None
+    if output_dir is not None and universes:
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(p))
+            for p in universes])
+    started = time.time()
+    start = time.perf_counter()
+    results = []
+
+    def done(result):
+        results.append(result)
+        if progress is not None:
+            progress(result)
+
+    def job(path):
+        if root is not None:
+            path = os.path.abspath(path)
+        return (path, outputs, output_dir, root, template, cache_dir)
+
+    if workers == 1:
+        for path in universes:
+            done(document_universe(*job(path)))
+    else:
+        # a worker process that dies (a crash, or killed for using too
+        # much memory) breaks the whole pool and fails every universe
+        # still queued, so those are documented again one at a time in a
+        # pool of their own, where a crash only fails the universe that
+        # caused it
+        retry = []
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            futures = dict((executor.submit(document_universe, *job(path)),
+                path) for path in universes)
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    retry.append(futures[future])
+                    continue
+                except Exception as error:
+                    # the result couldn't be sent back
+                    result = _worker_error(futures[future], error)
+                done(result)
+        executor = None
+        try:
+            for path in sorted(retry):
+                if executor is None:
+                    executor = concurrent.futures.ProcessPoolExecutor(1)
+                try:
+                    result = executor.submit(document_universe,
+                        *job(path)).result()
+                except BrokenProcessPool as error:
+                    executor.shutdown()
+                    executor = None
+                    result = _worker_error(path, error)
+                except Exception as error:
+                    result = _worker_error(path, error)
+                done(result)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+    results.sort(key=lambda r: r['path'])
+
+    summary = {
+        'pyunv_version': pyunv.__version__,
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S',
+            time.localtime(started)),
+        'elapsed': time.perf_counter() - start,
+        'workers': workers or os.cpu_count(),
+        'outputs': list(outputs),
+        'universes': len(results),
+        'succeeded': len([r for r in results if r['status'] == 'ok']),
+        'failed': len([r for r in results if r['status'] != 'ok']),
+        'results': results,
+    }
+    if summary_path:
+        directory = os.path.dirname(summary_path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        with open(summary_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return summary
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+benchmark.py
+
+Measure how long pyunv takes to document universes, and catch slowdowns.
+
+For each universe the benchmark records the time spent parsing sections,
+running analyses, rendering the manifest and writing the CSV inventory
+(the best of several runs), and the peak memory allocated while reading
+the universe. It runs on the universe files in a directory (the test
+fixtures by default) and on synthetic universes 10, 100 or 1000 times
+the size of a small reference universe (see synthetic.scaled).
+
+Results can be saved as a JSON baseline and later runs compared with it:
+
+    python -m pyunv.benchmark --output benchmarks/baseline.json
+    python -m pyunv.benchmark --baseline benchmarks/baseline.json
+
+The comparison exits with status 1 if any measurement is more than
+--tolerance (default 25%) slower or bigger than the baseline.
+"""
+
+import getopt
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import pyunv
+from pyunv import synthetic
+from pyunv.reader import Reader
+from pyunv.manifest import Manifest
+from pyunv.csvwriter import CsvWriter
+from pyunv.batch import find_universes
+from pyunv.tracing import Tracer
+
+
+DEFAULT_SCALES = (1, 10, 100)
+
+# measurements compared with the baseline; times are in seconds
+MEASUREMENTS = ('parse', 'analysis', 'manifest', 'csv', 'peak_memory')
+
+# differences smaller than these are noise, whatever the ratio
+_MINIMUM_DIFFERENCE = {'peak_memory': 256 * 1024}
+_MINIMUM_TIME_DIFFERENCE = 0.002
+
+
+class _PhaseTimer(Tracer):
+
+    """Add up the wall time of the reader's top-level phases by kind"""
+
+    def __init__(self):
+        super(_PhaseTimer, self).__init__()
+        self.times = {}
+        self.depth = 0
+        self.started = None
+
+    def start(self, name, kind):
+        if self.depth == 0:
+            self.started = time.perf_counter()
+        self.depth += 1
+
+    def end(self, name, kind, error=None):
+        self.depth -= 1
+        if self.depth == 0:
+            self.times[kind] = self.times.get(kind, 0.0) + \
+                time.perf_counter() - self.started
+
+
+def measure(source, repeat=3):
+    """return the measurements of one universe (a path or its contents)"""
+    best = {}
+    universe = None
+    for i in range(repeat):
+        timer = _PhaseTimer()
+        universe = Reader(source, tracer=timer).universe
+        times = {
+            # indexing the file and opening the archive are part of parsing
+            'parse': sum(t for kind, t in timer.times.items()
+                if kind != 'analysis'),
+            'analysis': timer.times.get('analysis', 0.0),
+        }
+        # the first manifest compiles the template; time the later ones
+        Manifest(universe).save(io.StringIO())
+        start = time.perf_counter()
+        Manifest(universe).save(io.StringIO())
+        times['manifest'] = time.perf_counter() - start
+        start = time.perf_counter()
+        CsvWriter(universe, io.StringIO())
+        times['csv'] = time.perf_counter() - start
+        for name, value in times.items():
+            best[name] = min(best.get(name, value), value)
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    start_size = tracemalloc.get_traced_memory()[0]
+    Reader(source)
+    peak = tracemalloc.get_traced_memory()[1] - start_size
+    if not tracing:
+        tracemalloc.stop()
+
+    result = dict(best)
+    result['total'] = sum(best[name] for name in ('parse', 'analysis',
+        'manifest', 'csv'))
+    result['peak_memory'] = peak
+    result['size'] = len(source) if isinstance(source, bytes) else \
+        os.path.getsize(source)
+    result['tables'] = len(universe.tables)
+    result['columns'] = len(universe.columns)
+    result['objects'] = len(universe.object_map)
+    result['joins'] = len(universe.joins)
+    result['contexts'] = len(universe.contexts)
+    return result
+
+
+def run(fixtures='tests/universes', scales=DEFAULT_SCALES, repeat=3,
+        progress=None):
+    """measure the universes in the fixtures directory (None for none)
+    and synthetic universes of each scale, and return the results"""
+    cases = []
+    if fixtures:
+        for path in find_universes([fixtures]):
+            cases.append((os.path.basename(path), path))
+    for scale in scales:
+        cases.append(('synthetic_x%d' % scale,
+            synthetic.generate(**synthetic.scaled(scale))))
+    results = {}
+    for name, source in cases:
+        results[name] = measure(source, repeat)
+        if progress is not None:
+            progress(name, results[name])
+    return {
+        'pyunv_version': pyunv.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat': repeat,
+        'cases': results,
+    }
+
+
+def compare(results, baseline, tolerance=0.25):
+    """return the measurements in results that are worse than baseline
+
+    Each regression is a dictionary with the case, the measurement, the
+    baseline and current values and their ratio. Cases missing from
+    either side are ignored.
+    """
+    regressions = []
+    for case, current in sorted(results['cases'].items()):
+        expected = baseline['cases'].get(case)
+        if expected is None:
+            continue
+        for name in MEASUREMENTS:
+            if name not in expected or name not in current:
+                continue
+            before, after = expected[name], current[name]
+            minimum = _MINIMUM_DIFFERENCE.get(name, _MINIMUM_TIME_DIFFERENCE)
+            if after - before > minimum and after > before * (1 + tolerance):
+                regressions.append({'case': case, 'measurement': name,
+                    'baseline': before, 'current': after,
+                    'ratio': after / before if before else float('inf')})
+    return regressions
+
+
+def format_results(results):
+    """return the results as a text table"""
+    lines = ['%-36s %9s %9s %9s %9s %9s %10s' % ('universe', 'parse ms',
+        'analy ms', 'manif ms', 'csv ms', 'total ms', 'peak KiB')]
+    for case, r in sorted(results['cases'].items()):
+        lines.append('%-36s %9.1f %9.1f %9.1f %9.1f %9.1f %10d' % (case,
+            r['parse'] * 1000, r['analysis'] * 1000, r['manifest'] * 1000,
+            r['csv'] * 1000, r['total'] * 1000, r['peak_memory'] // 1024))
+    return '\n'.join(lines)
+
+
+help_message = '''
+Benchmark pyunv on the test universes and on synthetic universes.
+
+python -m pyunv.benchmark [options]
+
+    -f  --fixtures   directory of universes to measure (default: tests/universes)
+    -n  --no-fixtures  measure synthetic universes only
+    -s  --scales     synthetic universe scales (default: 1,10,100)
+    -r  --repeat     runs per universe; the best time is kept (default: 3)
+    -o  --output     write the results as JSON (to use as a baseline)
+    -b  --baseline   compare with a JSON baseline; exit 1 on a regression
+    -t  --tolerance  allowed slowdown before a regression (default: 0.25)
+    -h  --help       show this help
+'''
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        opts, args = getopt.getopt(argv[1:], 'hf:ns:r:o:b:t:', ['help',
+            'fixtures=', 'no-fixtures', 'scales=', 'repeat=', 'output=',
+            'baseline=', 'tolerance='])
+        fixtures = 'tests/universes'
+        scales = DEFAULT_SCALES
+        repeat = 3
+        output = baseline = None
+        tolerance = 0.25
+        for option, value in opts:
+            if option in ('-h', '--help'):
+                print(help_message)
+                return 0
+            if option in ('-f', '--fixtures'):
+                fixtures = value
+            if option in ('-n', '--no-fixtures'):
+                fixtures = None
+            if option in ('-s', '--scales'):
+                scales = [int(s) for s in value.split(',') if s]
+            if option in ('-r', '--repeat'):
+                repeat = int(value)
+            if option in ('-o', '--output'):
+                output = value
+            if option in ('-b', '--baseline'):
+                baseline = value
+            if option in ('-t', '--tolerance'):
+                tolerance = float(value)
+    except (getopt.error, ValueError) as error:
+        print('benchmark: %s' % error, file=sys.stderr)
+        print(help_message, file=sys.stderr)
+        return 2
+
+    def progress(name, result):
+        print('%-36s %8.1f ms' % (name, result['total'] * 1000),
+            file=sys.stderr)
+
+    results = run(fixtures, scales, repeat, progress)
+    print(format_results(results))
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f), tolerance)
+        for r in regressions:
+            print('REGRESSION %s %s: %.4g -> %.4g (x%.2f)' % (r['case'],
+                r['measurement'], r['baseline'], r['current'], r['ratio']))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+cache.py
+
+A persistent on-disk cache of parsed universes.
+
+ParseCache stores each decoded Universe in a local directory, keyed by
+a hash of the universe file contents (or, with key='stat', by its path,
+size and modification time) and of the Reader options. Entries written
+by another version of pyunv are ignored. When the directory grows past
+max_size bytes, the least recently used entries are removed.
+
+    cache = ParseCache()
+    universe = cache.read('sample.unv')
+"""
+
+import hashlib
+import os
+import tempfile
+
+import pyunv
+from pyunv import snapshot
+from pyunv.reader import Reader
+
+
+# bump when the layout of cache entries changes
+CACHE_FORMAT = 3
+
+_MAGIC = b'PYUNV-CACHE'
+_ENTRY_SUFFIX = '.unvc'
+
+
+def default_cache_dir():
+    """return $PYUNV_CACHE_DIR, or pyunv under the user's cache directory"""
+    directory = os.environ.get('PYUNV_CACHE_DIR')
+    if directory:
+        return directory
+    base = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pyunv')
+
+
+class ParseCache(object):
+
+    """Cache of parsed universes in a local directory
+
+    key is 'content' (hash the universe file contents) or 'stat' (hash
+    the absolute path, size and modification time, which avoids reading
+    the file on a hit but trusts the file system timestamps).
+    """
+
+    keys = ('content', 'stat')
+
+    def __init__(self, directory=None, max_size=256*1024*1024,
+            key='content'):
+        super(ParseCache, self).__init__()
+        if key not in ParseCache.keys:
+            raise ValueError('unknown cache key %r (expected one of %s)'
+                % (key, ', '.join(ParseCache.keys)))
+        self.directory = directory or default_cache_dir()
+        self.max_size = max_size
+        self.key = key
+        self.version = '%s/%d' % (pyunv.__version__, CACHE_FORMAT)
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, path, **options):
+        """return the Universe in the file at path, from the cache if
+        possible. options are passed on to Reader.
+
+        A cached universe is fully loaded whatever lazy is, and only
+        sections and analyses are part of the key. profile and tracer
+        raise ValueError: a cached universe isn't parsed, so there would
+        be nothing to profile or trace.
+        """
+        for name in ('profile', 'tracer'):
+            if options.get(name):
+                raise ValueError('ParseCache.read does not support %s'
+                    % name)
+        key = self.key_for(path, **options)
+        universe = self.get(key)
+        if universe is None:
+            reader = Reader(path, **options)
+            universe = reader.universe
+            if reader.lazy:
+                # load everything so the universe no longer needs the reader
+                for name in universe.pending:
+                    getattr(universe, name)
+                reader.close()
+            self.put(key, universe)
+        return universe
+
+    def key_for(self, path, **options):
+        """return the cache key of the universe file at path read with
+        the Reader options"""
+        h = hashlib.sha256()
+        h.update(self.version.encode('utf-8'))
+        for name in ('sections', 'analyses'):
+            value = options.get(name)
+            # Reader takes a single name as a string
+            if isinstance(value, str):
+                value = (value,)
+            if isinstance(value, (list, tuple, set, frozenset)):
+                value = sorted(value)
+            h.update(('\0%s=%r' % (name, value)).encode('utf-8'))
+        if self.key == 'stat':
+            st = os.stat(path)
+            h.update(('\0%s\0%d\0%d' % (os.path.abspath(path), st.st_size,
+                st.st_mtime_ns)).encode('utf-8'))
+        else:
+            h.update(b'\0')
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024*1024), b''):
+                    h.update(chunk)
+        return h.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key + _ENTRY_SUFFIX)
+
+    def get(self, key):
+        """return the cached Universe for key, or None"""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                header = f.readline().rstrip(b'\n').split(b' ', 1)
+                if header != [_MAGIC, self.version.encode('utf-8')]:
+                    raise ValueError('cache entry from another version')
+                universe = self.load(f)
+        except snapshot.SnapshotError:
+            # a damaged entry (a truncated write, a bad disk) would miss
+            # every time; remove it so the next put replaces it
+            self.misses += 1
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            return None
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        try:
+            # the modification time orders entries for eviction
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return universe
+
+    def put(self, key, universe):
+        """store universe under key and evict old entries if the cache is
+        too big"""
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_MAGIC + b' ' + self.version.encode('utf-8') + b'\n')
+                self.dump(universe, f)
+            os.replace(tmp, self._entry_path(key))
+        except:
+            os.unlink(tmp)
+            raise
+        self.evict()
+
+    def load(self, f):
+        """read a universe written by dump from f"""
+        return snapshot.load(f)
+
+    def dump(self, universe, f):
+        """write universe to f"""
+        snapshot.dump(universe, f)
+
+    def entries(self):
+        """return (mtime, size, path) for each cache entry, least recently
+        used first"""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(_ENTRY_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, path))
+        entries.sort()
+        return entries
+
+    def size(self):
+        """return the total size of the cache entries in bytes"""
+        return sum(size for mtime, size, path in self.entries())
+
+    def evict(self):
+        """remove least recently used entries until the cache fits in
+        max_size"""
+        entries = self.entries()
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        """remove every cache entry"""
+        for mtime, size, path in self.entries():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
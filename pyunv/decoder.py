@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+decoder.py
+
+Low-level decoders used by reader.Reader to pull little-endian fields and
+length-prefixed strings out of a universe file.
+
+FileDecoder reads through a file object, one read() per field.
+BufferDecoder decodes in place from an in-memory or memory-mapped buffer
+with struct.unpack_from at a moving offset, so skipped fields never
+allocate and no read() calls are issued.
+
+open_decoder picks the decoder for a universe source, which may be a
+path, a file object, bytes, bytearray, memoryview or io.BytesIO.
+"""
+
+import io
+import mmap
+import os
+import struct
+
+
+_STRING_LENGTH = struct.Struct('<H')
+_STRUCTS = {}
+
+
+def get_struct(fmt):
+    """return a cached struct.Struct for fmt (fmt may already be a Struct)"""
+    if isinstance(fmt, struct.Struct):
+        return fmt
+    s = _STRUCTS.get(fmt)
+    if s is None:
+        s = _STRUCTS[fmt] = struct.Struct(fmt)
+    return s
+
+
+def clean_string(s):
+    """strip carriage returns and line feeds from a raw universe string"""
+    return s.translate(None, b'\x0d\x0a').decode('utf-8', errors='ignore')
+
+
+def source_buffer(source):
+    """return the contents of an in-memory universe source (bytes,
+    bytearray, memoryview or io.BytesIO), or None for paths and other
+    file objects"""
+    if isinstance(source, (bytes, bytearray)):
+        return source
+    if isinstance(source, memoryview):
+        return source.tobytes()
+    if isinstance(source, io.BytesIO):
+        # shares the buffer with the BytesIO until either one changes
+        return source.getvalue()
+    return None
+
+
+def open_decoder(source, engine='file', lazy=False):
+    """return a decoder for source
+
+    In-memory sources are always decoded in place. A path is opened
+    here, and closed as soon as the decoder no longer needs it (or by
+    the decoder's close() for the file engine). Other file objects
+    belong to the caller and are left open.
+    """
+    buf = source_buffer(source)
+    if buf is not None:
+        return BufferDecoder(buf)
+    owned = isinstance(source, (str, os.PathLike))
+    f = open(source, 'rb') if owned else source
+    if engine != 'mmap' and not lazy:
+        return FileDecoder(f, owned=owned)
+    try:
+        if engine == 'mmap':
+            return BufferDecoder.from_file(f)
+        return BufferDecoder(f.read())
+    finally:
+        if owned:
+            f.close()
+
+
+class FileDecoder(object):
+
+    """Decode fields by reading them from a file object"""
+
+    def __init__(self, f, owned=False):
+        super(FileDecoder, self).__init__()
+        self.file = f
+        self.owned = owned
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.file.seek(offset, whence)
+
+    def tell(self):
+        return self.file.tell()
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def skip(self, size):
+        self.file.seek(size, os.SEEK_CUR)
+
+    def unpack(self, fmt):
+        s = get_struct(fmt)
+        return s.unpack(self.file.read(s.size))
+
+    def read_string(self):
+        """read a variable-length string from the universe file"""
+        length, = _STRING_LENGTH.unpack(self.file.read(2))
+        if length:
+            s = self.file.read(length)
+            if len(s) < length:
+                raise struct.error('unpack requires a buffer of %d bytes'
+                    % length)
+            return clean_string(s)
+        else:
+            return None
+
+    def contents(self):
+        """return the rest of the file from the current position"""
+        return self.file.read()
+
+    def fileobj(self):
+        """return a seekable file object over the whole universe file"""
+        return self.file
+
+    def close(self):
+        """close the file if the decoder opened it"""
+        if self.owned:
+            self.file.close()
+
+
+class BufferDecoder(object):
+
+    """Decode fields in place from a bytes-like or memory-mapped buffer"""
+
+    def __init__(self, buf, mapped=None):
+        super(BufferDecoder, self).__init__()
+        self.buffer = buf
+        self.view = memoryview(buf)
+        self.size = len(self.view)
+        self.pos = 0
+        self._mapped = mapped
+
+    @classmethod
+    def from_file(cls, f):
+        """memory-map f if it has a file descriptor, otherwise read it
+        into memory"""
+        try:
+            fileno = f.fileno()
+        except (AttributeError, OSError, ValueError):
+            fileno = None
+        if fileno is not None:
+            try:
+                m = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # empty files and some special files can't be mapped
+                m = None
+            if m is not None:
+                return cls(m, mapped=m)
+        return cls(f.read())
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError('negative seek position %d' % offset)
+        self.pos = offset
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        start = min(self.pos, self.size)
+        if size is None or size < 0:
+            end = self.size
+        else:
+            end = min(start + size, self.size)
+        self.pos = max(self.pos, end)
+        return self.view[start:end].tobytes()
+
+    def skip(self, size):
+        self.pos += size
+
+    def unpack(self, fmt):
+        s = get_struct(fmt)
+        values = s.unpack_from(self.view, self.pos)
+        self.pos += s.size
+        return values
+
+    def read_string(self):
+        """read a variable-length string from the universe file"""
+        length, = _STRING_LENGTH.unpack_from(self.view, self.pos)
+        start = self.pos + 2
+        end = start + length
+        if end > self.size:
+            raise struct.error('unpack requires a buffer of %d bytes' % length)
+        self.pos = end
+        if length:
+            return clean_string(self.view[start:end].tobytes())
+        else:
+            return None
+
+    def contents(self):
+        """return the underlying buffer without copying it"""
+        return self.buffer
+
+    def fileobj(self):
+        """return a seekable file object over the buffer"""
+        return BufferFile(self.view)
+
+    def close(self):
+        """release the buffer and unmap the file"""
+        self.view.release()
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+
+
+class BufferFile(io.RawIOBase):
+
+    """Read-only file object over a memoryview, with its own position
+
+    Unlike io.BytesIO it never copies the buffer, and unlike mmap it is
+    seekable() on every Python version (zipfile needs that).
+    """
+
+    def __init__(self, view):
+        super(BufferFile, self).__init__()
+        self.view = view
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += len(self.view)
+        if offset < 0:
+            raise ValueError('negative seek position %d' % offset)
+        self.pos = offset
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        start = min(self.pos, len(self.view))
+        if size is None or size < 0:
+            end = len(self.view)
+        else:
+            end = min(start + size, len(self.view))
+        self.pos = max(self.pos, end)
+        return self.view[start:end].tobytes()
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+inventory.py
+
+Summarise universes from their section headers alone.
+
+scan_inventory() finds a handful of section markers with a direct
+search of the (memory-mapped) file and decodes only the fixed fields at
+the start of each section: the Parameters; block for the universe name,
+revision, dates and database, and the counts that open the Tables;,
+Virtual Tables;, Columns Id;, Joins;, Contexts;, Links;, Hierarchies;
+and Objects; sections. No table, class or object records are read and
+no analyses run, so it is many times faster than a full Reader.
+
+    >>> scan_inventory('tests/universes/eFashion.unv')['dbms_engine']
+    'MS Access 2007'
+
+The counts are the ones recorded in the section headers, not counts of
+the records a Reader finds: tables includes aliases and derived tables,
+classes includes subclasses, and Designer's classes, objects and
+conditions counts can include items that have since been deleted
+(eFashion's header counts 509 objects; 41 remain). root_classes and the
+other counts match the records. A count whose section is missing is
+None.
+"""
+
+import csv
+import datetime
+
+from pyunv import records
+from pyunv.decoder import open_decoder
+from pyunv.sections import DirectSectionIndex
+from pyunv.batch import find_universes
+
+
+# the columns of an inventory row, in order
+FIELDS = ('path', 'universe_name', 'universe_filename', 'revision',
+    'created_date', 'modified_date', 'dbms_engine', 'network_layer',
+    'tables', 'max_table_id', 'virtual_tables', 'columns', 'joins',
+    'contexts', 'links', 'hierarchies', 'classes', 'root_classes',
+    'objects', 'conditions', 'error')
+
+_MARKERS = ('Parameters;', 'Tables;', 'Virtual Tables;', 'Columns Id;',
+    'Joins;', 'Contexts;', 'Links;', 'Hierarchies;', 'Objects;')
+
+
+def _date(dateindex):
+    """return the date of a universe date index (see
+    Reader.date_from_dateindex), or None if it isn't a valid index"""
+    if dateindex < 2442964:
+        return None
+    return datetime.date(1976, 7, 4) + datetime.timedelta(dateindex-2442964)
+
+
+def _read_parameters(stream, row):
+    """decode the Parameters; fields of the inventory (see
+    Reader.read_parameters for the layout)"""
+    layout = records.PARAMETERS
+    read_string = stream.read_string
+    stream.skip(layout.header.size)
+    row['universe_filename'] = read_string()
+    row['universe_name'] = read_string()
+    row['revision'], = stream.unpack(layout.revision)
+    read_string()       # description
+    read_string()       # created_by
+    read_string()       # modified_by
+    created, modified, _, _ = stream.unpack(layout.dates)
+    row['created_date'] = _date(created)
+    row['modified_date'] = _date(modified)
+    read_string()
+    read_string()       # object_strategy
+    stream.skip(layout.limits.size)
+    read_string()       # comments
+    stream.skip(layout.comments_tail.size)
+    read_string()       # domain
+    row['dbms_engine'] = read_string()
+    row['network_layer'] = read_string()
+
+
+def scan_inventory(path):
+    """return a dictionary of the FIELDS of the universe at path (a path,
+    file object or the universe contents) read from its headers"""
+    stream = open_decoder(path, 'mmap')
+    try:
+        offsets = DirectSectionIndex(stream.contents(), _MARKERS).offsets
+        row = dict((field, None) for field in FIELDS)
+        row['path'] = path if isinstance(path, str) else None
+        unpack = stream.unpack
+
+        def seek(marker):
+            if marker not in offsets:
+                return False
+            stream.seek(offsets[marker])
+            return True
+
+        if seek('Parameters;'):
+            _read_parameters(stream, row)
+        if seek('Tables;'):
+            stream.skip(records.TABLES.header.size)
+            stream.read_string()    # database user name
+            stream.read_string()    # schema
+            row['max_table_id'], row['tables'] = unpack(records.TABLES.counts)
+        if seek('Virtual Tables;'):
+            row['virtual_tables'], = unpack(records.COUNT.count)
+        if seek('Columns Id;'):
+            _, row['columns'] = unpack(records.COLUMNS.counts)
+        if seek('Joins;'):
+            row['joins'], = unpack(records.JOINS.header)
+        for marker, field in (('Contexts;', 'contexts'), ('Links;', 'links'),
+                ('Hierarchies;', 'hierarchies')):
+            if seek(marker):
+                _, row[field] = unpack(records.ID_COUNT.counts)
+        if seek('Objects;'):
+            row['classes'], row['objects'], row['conditions'], \
+                row['root_classes'] = unpack(records.CLASSES.counts)
+        return row
+    finally:
+        stream.close()
+
+
+def scan_inventories(paths):
+    """yield an inventory row for each universe named by paths (files,
+    directories or glob patterns, see batch.find_universes); a universe
+    that can't be scanned has its error set"""
+    for path in find_universes(paths):
+        try:
+            yield scan_inventory(path)
+        except Exception as error:
+            row = dict((field, None) for field in FIELDS)
+            row['path'] = path
+            row['error'] = '%s: %s' % (type(error).__name__, error)
+            yield row
+
+
+def write_inventory(rows, f):
+    """write inventory rows to f as CSV with a header line, and return the
+    number of rows written"""
+    writer = csv.DictWriter(f, FIELDS)
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
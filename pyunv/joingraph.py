@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+joingraph.py
+
+Find the joins that connect a set of tables.
+
+JoinGraph turns a universe's joins into a graph of tables: each table
+has an array of the tables it is joined to and an array of the joins
+that do it (a join with more than two terms connects every pair of its
+tables). Each context is a bitmask of the joins it allows, as in the
+reader's context analysis.
+
+path() answers "which joins connect these tables within this context?".
+For two tables it is a shortest path (fewest joins). For more it grows a
+tree from the table that comes first in the graph (the universe's
+tables in order, then tables only joins mention), each time adding the
+shortest path to the nearest table not yet connected; that is the usual
+approximation of the (NP-hard) smallest connecting tree and what a
+query generator needs in practice. Results are memoized by table set and
+context, so repeating a question costs a dictionary lookup.
+
+    graph = universe.join_graph
+    graph.path(['Shop_facts', 'Calendar_year_lookup'], context='Shop facts')
+
+path_for_objects() asks the same question for the tables a query's
+objects refer to, choosing one alternative of each @aggregate_aware,
+and returns an ObjectPath that also lists the references it couldn't
+resolve.
+
+Universe.join_graph keeps one graph per universe and builds a new one
+when the universe's tables, joins or contexts are replaced (or reindex()
+is called after changing them in place).
+"""
+
+import array
+
+
+class ObjectPath(object):
+
+    """The joins a set of objects needs (see JoinGraph.path_for_objects)
+
+    joins is the tuple of join ids connecting the tables, or None if
+    they can't be connected. tables are the ids of the tables connected.
+    unresolved lists the table references (names or ids) that aren't
+    tables of the graph, such as misspelt or deleted tables; they are
+    left out of tables.
+    """
+
+    def __init__(self, joins, tables, unresolved):
+        super(ObjectPath, self).__init__()
+        self.joins = joins
+        self.tables = tables
+        self.unresolved = unresolved
+
+    def __repr__(self):
+        return 'ObjectPath(joins=%r, tables=%r, unresolved=%r)' % (
+            self.joins, self.tables, self.unresolved)
+
+
+class JoinGraph(object):
+
+    """The tables of a universe connected by its joins
+
+    tables and contexts may be given by id or by name everywhere. An
+    unknown table or context raises ValueError.
+    """
+
+    def __init__(self, universe):
+        super(JoinGraph, self).__init__()
+        self.universe = universe
+        # node -> table id, and back
+        self.table_ids = []
+        self._nodes = {}
+        for table in universe.tables:
+            self._node(table.id_)
+        # join index -> join id
+        self.join_ids = []
+        join_indexes = {}
+        edges = []
+        for join in universe.joins:
+            if join.id_ in join_indexes:
+                continue
+            index = join_indexes[join.id_] = len(self.join_ids)
+            self.join_ids.append(join.id_)
+            nodes = []
+            for column_name, table_id in join.terms:
+                node = self._node(table_id)
+                if node not in nodes:
+                    nodes.append(node)
+            for i, a in enumerate(nodes):
+                for b in nodes[i+1:]:
+                    edges.append((a, b, index))
+        # for each node, the neighbouring nodes and the joins to them
+        self._neighbours = [array.array('i') for node in self.table_ids]
+        self._joins = [array.array('i') for node in self.table_ids]
+        for a, b, index in edges:
+            self._neighbours[a].append(b)
+            self._joins[a].append(index)
+            self._neighbours[b].append(a)
+            self._joins[b].append(index)
+        # context id -> mask of the joins it allows
+        self.context_masks = {}
+        self._context_ids = {}
+        for context in universe.contexts:
+            if context.id_ in self.context_masks:
+                continue
+            mask = 0
+            for join_id in context.joins:
+                if join_id in join_indexes:
+                    mask |= 1 << join_indexes[join_id]
+            self.context_masks[context.id_] = mask
+            self._context_ids.setdefault(context.name, context.id_)
+        self._paths = {}
+
+    def _node(self, table_id):
+        node = self._nodes.get(table_id)
+        if node is None:
+            node = self._nodes[table_id] = len(self.table_ids)
+            self.table_ids.append(table_id)
+        return node
+
+    def _resolve(self, table):
+        """return the node of a table id or name, or None"""
+        if isinstance(table, str):
+            found = self.universe.table_name_map.get(table)
+            if found is None:
+                return None
+            table = found.id_
+        return self._nodes.get(table)
+
+    def table_node(self, table):
+        """return the node of a table id or name"""
+        node = self._resolve(table)
+        if node is None:
+            raise ValueError('unknown table %r' % (table,))
+        return node
+
+    def context_id(self, context):
+        """return the id of a context id or name (None for no context)"""
+        if context is None or context in self.context_masks:
+            return context
+        if context in self._context_ids:
+            return self._context_ids[context]
+        raise ValueError('unknown context %r' % (context,))
+
+    def neighbours(self, table, context=None):
+        """return [(table id, join id)] for the tables joined to table,
+        using only the joins context allows"""
+        node = self.table_node(table)
+        allowed = self._allowed(self.context_id(context))
+        return [(self.table_ids[n], self.join_ids[j])
+            for n, j in zip(self._neighbours[node], self._joins[node])
+            if allowed is None or allowed >> j & 1]
+
+    def _allowed(self, context_id):
+        if context_id is None:
+            return None
+        return self.context_masks[context_id]
+
+    def path(self, tables, context=None):
+        """return the ids of the joins connecting tables, using only the
+        joins context allows (None for every join), or None if they
+        can't be connected
+
+        The joins are in the order the tree reaches them; one table (or
+        none) needs no joins.
+        """
+        nodes = frozenset(self.table_node(t) for t in tables)
+        return self._path(nodes, self.context_id(context))
+
+    def _path(self, nodes, context_id):
+        """return path() of a frozenset of nodes, memoized"""
+        key = (nodes, context_id)
+        if key in self._paths:
+            return self._paths[key]
+        result = self._connect(nodes, self._allowed(context_id))
+        self._paths[key] = result
+        return result
+
+    def path_for_objects(self, objects, context=None):
+        """return the ObjectPath of the tables the select and where
+        clauses of objects (and conditions) refer to
+
+        Only one alternative of an @aggregate_aware is used in a query,
+        so a clause with one contributes the tables of a single
+        alternative: the first that resolves and can be joined to the
+        tables of the other clauses, or else the first.
+        """
+        context_id = self.context_id(context)
+
+        def resolve(references):
+            nodes = set()
+            missing = []
+            for ref in references.table_refs:
+                node = self._resolve(ref)
+                if node is not None:
+                    nodes.add(node)
+                elif ref not in missing:
+                    missing.append(ref)
+            return nodes, missing
+
+        nodes = set()
+        unresolved = []
+        choices = []
+        for obj in objects:
+            for references in (obj.select_references,
+                    obj.where_references):
+                if references.aggregate_alternatives:
+                    choices.append([resolve(alternative) for alternative
+                        in references.aggregate_alternatives])
+                else:
+                    found, missing = resolve(references)
+                    nodes.update(found)
+                    unresolved.extend(missing)
+        for alternatives in choices:
+            found, missing = alternatives[0]
+            for candidate, candidate_missing in alternatives:
+                if not candidate_missing and self._path(
+                        frozenset(nodes | candidate), context_id) is not None:
+                    found, missing = candidate, candidate_missing
+                    break
+            nodes.update(found)
+            unresolved.extend(missing)
+        nodes = frozenset(nodes)
+        return ObjectPath(self._path(nodes, context_id),
+            tuple(self.table_ids[n] for n in sorted(nodes)),
+            tuple(dict.fromkeys(unresolved)))
+
+    def clear(self):
+        """forget the memoized paths"""
+        self._paths.clear()
+
+    def _connect(self, nodes, allowed):
+        """return the join ids of a tree connecting nodes (see path)"""
+        if len(nodes) < 2:
+            return ()
+        terminals = sorted(nodes)
+        tree = set(terminals[:1])
+        remaining = set(terminals[1:])
+        joins = []
+        while remaining:
+            # breadth-first search from the tree to the nearest table that
+            # isn't connected yet; previous leads back to the tree
+            previous = dict.fromkeys(tree)
+            frontier = sorted(tree)
+            found = None
+            while frontier and found is None:
+                reached = []
+                for node in frontier:
+                    for neighbour, join in zip(self._neighbours[node],
+                            self._joins[node]):
+                        if neighbour in previous or \
+                                (allowed is not None and not allowed >> join & 1):
+                            continue
+                        previous[neighbour] = (node, join)
+                        if neighbour in remaining:
+                            found = neighbour
+                            break
+                        reached.append(neighbour)
+                    if found is not None:
+                        break
+                frontier = reached
+            if found is None:
+                return None
+            branch = []
+            node = found
+            while previous[node] is not None:
+                tree.add(node)
+                remaining.discard(node)
+                node, join = previous[node]
+                branch.append(join)
+            joins.extend(reversed(branch))
+        return tuple(self.join_ids[j] for j in joins)
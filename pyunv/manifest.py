@@ -16,6 +16,28 @@ import unittest
 from mako.template import Template
 
 
+# compiled templates by filename, with the modification time and size
+# they were compiled from
+_templates = {}
+
+
+def get_template(filename):
+    """return the compiled Mako template in filename
+    
+    Templates are compiled once and reused until the file changes, so
+    documenting many universes (or one universe many times) only pays
+    for the compile once.
+    """
+    st = os.stat(filename)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _templates.get(filename)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    template = Template(filename=filename, encoding_errors='replace')
+    _templates[filename] = (stamp, template)
+    return template
+
+
 class Manifest:
     
     def __init__(self, universe, template=None):
@@ -43,8 +65,7 @@ class Manifest:
         """docstring for write_manifest"""
         if self.template:
             try:
-                template = Template(filename=self.template, 
-                    encoding_errors='replace')
+                template = get_template(self.template)
                 f.write(template.render(universe=self.universe))
             except FileNotFoundError:
                 raise RuntimeError("No template found at: " + self.template + 
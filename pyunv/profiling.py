@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+profiling.py
+
+Per-phase measurements of a Reader run.
+
+Reader(f, profile=True) wraps its decoder in a CountingDecoder and
+records one entry in universe.parse_profile for each phase it runs:
+indexing the file (find_content_offsets), opening the archive, reading
+each section and running each analysis. Each phase records its wall
+time, the bytes it decoded, the number of read and seek calls it made on
+the universe file and the net number of memory blocks it allocated.
+
+    universe = Reader('sample.unv', profile=True).universe
+    print(universe.parse_profile.format())
+
+ParseProfile is a tracing.Tracer, so it sees the same phases as any
+other tracer. Readers created without profile=True don't pay for any of
+this.
+"""
+
+import os
+import sys
+import time
+
+from pyunv.tracing import Tracer
+
+
+class CountingFile(object):
+
+    """File object proxy that counts reads and seeks into a profile"""
+
+    def __init__(self, f, counters):
+        super(CountingFile, self).__init__()
+        self._file = f
+        self._counters = counters
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self._counters.reads += 1
+        self._counters.bytes += len(data)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self._counters.seeks += 1
+        return self._file.seek(offset, whence)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class CountingDecoder(object):
+
+    """Decoder proxy that counts the calls made on another decoder
+
+    Every decode call (read, unpack, read_string, contents) counts as a
+    read; seek and skip count as seeks. bytes counts the bytes decoded.
+    Archive members read through fileobj() are counted too.
+    """
+
+    def __init__(self, decoder):
+        super(CountingDecoder, self).__init__()
+        self.decoder = decoder
+        self.reads = 0
+        self.seeks = 0
+        self.bytes = 0
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self.seeks += 1
+        return self.decoder.seek(offset, whence)
+
+    def tell(self):
+        return self.decoder.tell()
+
+    def read(self, size=-1):
+        data = self.decoder.read(size)
+        self.reads += 1
+        self.bytes += len(data)
+        return data
+
+    def skip(self, size):
+        self.seeks += 1
+        self.decoder.skip(size)
+
+    def unpack(self, fmt):
+        start = self.decoder.tell()
+        values = self.decoder.unpack(fmt)
+        self.reads += 1
+        self.bytes += self.decoder.tell() - start
+        return values
+
+    def read_string(self):
+        start = self.decoder.tell()
+        s = self.decoder.read_string()
+        self.reads += 1
+        self.bytes += self.decoder.tell() - start
+        return s
+
+    def contents(self):
+        data = self.decoder.contents()
+        self.reads += 1
+        self.bytes += len(data)
+        return data
+
+    def fileobj(self):
+        return CountingFile(self.decoder.fileobj(), self)
+
+    def close(self):
+        self.decoder.close()
+
+
+class ParseProfile(Tracer):
+
+    """The phases of a Reader run, in the order they ran
+
+    Each phase is a dictionary with its name, kind ('index', 'archive',
+    'section' or 'analysis'), wall_time in seconds, bytes, reads, seeks
+    and allocated_blocks (net memory blocks allocated, from
+    sys.getallocatedblocks). depth is 0 for the phases the reader runs
+    itself and 1 or more for phases run inside another phase (such as
+    the steps of _extract_schema_details, or a lazy section loaded by
+    an analysis); they are included in their parent's figures.
+    """
+
+    fields = ('wall_time', 'bytes', 'reads', 'seeks', 'allocated_blocks')
+
+    def __init__(self, counters):
+        super(ParseProfile, self).__init__()
+        self.counters = counters
+        self.phases = []
+        self._open = []
+
+    def start(self, name, kind):
+        counters = self.counters
+        phase = {'name': name, 'kind': kind, 'depth': len(self._open)}
+        # parents are listed before the phases they contain
+        self.phases.append(phase)
+        self._open.append((phase, counters.reads, counters.seeks,
+            counters.bytes, sys.getallocatedblocks(), time.perf_counter()))
+
+    def end(self, name, kind, error=None):
+        now = time.perf_counter()
+        blocks = sys.getallocatedblocks()
+        counters = self.counters
+        phase, reads, seeks, nbytes, start_blocks, start = self._open.pop()
+        phase.update({
+            'wall_time': now - start,
+            'bytes': counters.bytes - nbytes,
+            'reads': counters.reads - reads,
+            'seeks': counters.seeks - seeks,
+            'allocated_blocks': blocks - start_blocks,
+        })
+
+    def phase(self, name):
+        """return the last phase called name, or None"""
+        for phase in reversed(self.phases):
+            if phase['name'] == name:
+                return phase
+        return None
+
+    def totals(self):
+        """return the sum of each field over the top-level phases"""
+        top = [p for p in self.phases if p['depth'] == 0]
+        return dict((field, sum(p[field] for p in top))
+            for field in ParseProfile.fields)
+
+    def slowest(self, count=5):
+        """return the count phases that took the longest"""
+        return sorted(self.phases, key=lambda p: p['wall_time'],
+            reverse=True)[:count]
+
+    def as_dict(self):
+        """return the profile as plain data (for JSON, for example)"""
+        return {'phases': [dict(p) for p in self.phases],
+            'totals': self.totals()}
+
+    def format(self):
+        """return the profile as a text table"""
+        lines = ['%-40s %-8s %10s %10s %8s %8s %10s' % ('phase', 'kind',
+            'ms', 'bytes', 'reads', 'seeks', 'blocks')]
+        rows = self.phases + [dict(self.totals(), name='total', kind='',
+            depth=0)]
+        for p in rows:
+            lines.append('%-40s %-8s %10.3f %10d %8d %8d %10d' % (
+                '  ' * p['depth'] + p['name'], p['kind'],
+                p['wall_time'] * 1000, p['bytes'], p['reads'], p['seeks'],
+                p['allocated_blocks']))
+        return '\n'.join(lines)
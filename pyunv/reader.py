@@ -10,43 +10,48 @@ Enhanced by Sanjay Sharma (indoos@gmail.com) 2025-10-17.
 """
 
 import datetime
+import functools
 import os
 import pdb
 import re
 import struct
 import sys
 import xml.etree.ElementTree as ET
-import os
+import posixpath
 import zipfile
-import shutil
 
 sys.path.insert(0, '..')
 from pyunv.universe import Universe, Parameters, Class, Join, Object
 from pyunv.universe import Condition, Table, VirtualTable, Column, Context, Link, Hierarchy
+from pyunv.universe import ColumnCatalog
+from pyunv import records
+from pyunv.decoder import open_decoder
+from pyunv.sections import SectionIndex
+from pyunv.sqlscan import scan_sql
+from pyunv.profiling import CountingDecoder, ParseProfile
+from pyunv.tracing import MultiTracer
 
 # import pyunv
 
 class Reader(object):
     def extractPromptsInfo(self):
         """
-        Scan all objects and conditions for @Prompt(...) in their SQL and print details.
+        Scan all objects and conditions for @Prompt(...) in their SQL and
+        report each one to the tracer as a 'prompt' event.
         """
-        import re
-        print("Extracting Prompts Information:")
-        prompt_pattern = r"@Prompt\((.*?)\)"
+        if self.tracer is None:
+            return
+        tracer = self.tracer
+        def report(kind, obj, references):
+            for prompt in references.prompts:
+                tracer.event('prompt', {'kind': kind, 'id': obj.id_,
+                    'name': obj.name, 'prompt': obj.expand_sql(prompt)})
         def scan_class(cls):
             for obj in getattr(cls, 'objects', []):
-                for sql in [getattr(obj, 'select_sql', None), getattr(obj, 'where_sql', None)]:
-                    if sql and "@Prompt" in sql:
-                        prompts = re.findall(prompt_pattern, sql, re.DOTALL)
-                        for prompt in prompts:
-                            print(f"Object: {obj.name} | Prompt: {prompt}")
+                report('object', obj, obj.select_references)
+                report('object', obj, obj.where_references)
             for cond in getattr(cls, 'conditions', []):
-                sql = getattr(cond, 'where_sql', None)
-                if sql and "@Prompt" in sql:
-                    prompts = re.findall(prompt_pattern, sql, re.DOTALL)
-                    for prompt in prompts:
-                        print(f"Condition: {cond.name} | Prompt: {prompt}")
+                report('condition', cond, cond.where_references)
             for subcls in getattr(cls, 'subclasses', []):
                 scan_class(subcls)
         for cls in getattr(self.universe, 'classes', []):
@@ -54,15 +59,16 @@ class Reader(object):
 
     def getDerivedTablesInfo(self):
         """
-        For each virtual table, find the matching table by id and print its name, id, and SQL.
+        For each table, report its name, id, and derived table SQL (None
+        for ordinary tables) to the tracer as a 'derived_table' event.
         """
+        if self.tracer is None:
+            return
         vt_map = {vt.table_id: vt for vt in getattr(self.universe, 'virtual_tables', [])}
         for table in getattr(self.universe, 'tables', []):
             vt = vt_map.get(table.id_)
-            if vt:
-                print(f"Table: {table.name} | ID: {table.id_} | SQL: {vt.select}")
-            else:
-                print(f"Table: {table.name} | ID: {table.id_} | SQL: <no virtual table>")
+            self.tracer.event('derived_table', {'table': table.name,
+                'table_id': table.id_, 'sql': vt.select if vt else None})
     
     _content_markers = ('Objects;', 'Tables;', 'Columns;', 'Contexts;',
         'Virtual Tables;', 'Parameters;', 'Columns Id;', 'Joins;',
@@ -80,201 +86,392 @@ class Reader(object):
         'Upward_Mapping;', 'Upward_Override;', 'Upward_Override_New;',
         'WindowsPageFormat;')
     
-    def __init__(self, f):
+    _engines = ('file', 'mmap')
+
+    # (section, universe attribute, reader method, default factory) for the
+    # sections that are left at their default value when they can't be read
+    _optional_sections = (
+        ('Hierarchies;', 'hierarchies', 'read_hierarchies', list),
+        ('Parameters_4_1;', 'parameters_4_1', 'read_parameters_4_1', None),
+        ('Parameters_5_0;', 'parameters_5_0', 'read_parameters_5_0', None),
+        ('Parameters_11_5;', 'parameters_11_5', 'read_parameters_11_5', None),
+        ('Object_Formats;', 'object_formats', 'read_object_formats', list),
+        ('Object_ExtraFormats;', 'object_extra_formats', 'read_object_extra_formats', list),
+        ('Dynamic_Class_Descriptions;', 'dynamic_class_descriptions', 'read_dynamic_class_descriptions', dict),
+        ('Dynamic_Object_Descriptions;', 'dynamic_object_descriptions', 'read_dynamic_object_descriptions', dict),
+        ('Dynamic_Property_Descriptions;', 'dynamic_property_descriptions', 'read_dynamic_property_descriptions', dict),
+        ('Audit;', 'audit_info', 'read_audit_info', None),
+        ('Dimensions;', 'dimensions', 'read_dimensions', list),
+        ('OLAPInfo;', 'olap_info', 'read_olap_info', None),
+        ('Graphical_Info;', 'graphical_info', 'read_graphical_info', None),
+        ('Crystal_References;', 'crystal_references', 'read_crystal_references', list),
+        ('XML-LOV;', 'xml_lov', 'read_xml_lov', None),
+        ('Integrity;', 'integrity_rules', 'read_integrity_rules', list),
+        ('AggregateNavigation;', 'aggregate_navigation', 'read_aggregate_navigation', None),
+        ('BoundedColumns;', 'bounded_columns', 'read_bounded_columns', list),
+        ('BuildOrigin_v6;', 'build_origin_v6', 'read_build_origin_v6', None),
+        ('CompulsaryType;', 'compulsary_type', 'read_compulsary_type', None),
+        ('Deleted References;', 'deleted_references', 'read_deleted_references', list),
+        ('DELETED_HISTORY;', 'deleted_history', 'read_deleted_history', list),
+        ('Dot_Tables;', 'dot_tables', 'read_dot_tables', list),
+        ('Downward;', 'downward', 'read_downward', None),
+        ('FormatLocaleSort;', 'format_locale_sort', 'read_format_locale_sort', None),
+        ('FormatVersion;', 'format_version', 'read_format_version', None),
+        ('Joins Extensions;', 'joins_extensions', 'read_joins_extensions', list),
+        ('Key References;', 'key_references', 'read_key_references', list),
+        ('KernelPageFormat;', 'kernel_page_format', 'read_kernel_page_format', None),
+        ('Platform;', 'platform', 'read_platform', None),
+        ('UNICODE ON;', 'unicode_on', 'read_unicode_on', None),
+        ('Upward;', 'upward', 'read_upward', None),
+        ('Upward_LocalIndexing;', 'upward_local_indexing', 'read_upward_local_indexing', None),
+        ('Upward_Mapping;', 'upward_mapping', 'read_upward_mapping', None),
+        ('Upward_Override;', 'upward_override', 'read_upward_override', None),
+        ('Upward_Override_New;', 'upward_override_new', 'read_upward_override_new', None),
+        ('WindowsPageFormat;', 'windows_page_format', 'read_windows_page_format', None),
+    )
+
+    # (analysis, universe attributes, method, sections it reads,
+    # analyses it builds on) in the order the analyses run; the method is
+    # the name of a Reader method or a function called with the reader.
+    # See register_analysis.
+    _analyses = (
+        ('cross_references', ('cross_references',),
+            'perform_cross_reference_analysis',
+            ('Objects;', 'Tables;', 'Joins;'), ()),
+        ('validation', ('validation_errors',),
+            'perform_validation_checks', ('Objects;', 'Tables;'), ()),
+        ('dependencies', ('dependency_graph',),
+            'perform_dependency_analysis', ('Objects;', 'Tables;'), ()),
+        ('schema_details', ('database_tables', 'table_columns', 'join_details'),
+            '_extract_schema_details', ('Tables;', 'Columns;', 'Joins;'), ()),
+        ('context_details', ('context_details',),
+            '_extract_context_details', ('Contexts;',), ('schema_details',)),
+        ('context_incompatibilities', ('context_incompatibilities',),
+            '_analyze_context_incompatibilities', ('Objects;',),
+            ('schema_details', 'context_details')),
+        ('lov_definitions', ('lov_definitions',),
+            '_extract_lov_definitions', ('Objects;', 'Tables;', 'XML-LOV;'),
+            ()),
+        ('stored_procedures', ('stored_procedure_parameters',),
+            '_extract_stored_procedure_parameters', (), ()),
+        ('derived_tables', (), 'getDerivedTablesInfo',
+            ('Tables;', 'Virtual Tables;'), ()),
+        ('prompts', (), 'extractPromptsInfo', ('Objects;', 'Tables;'), ()),
+    )
+
+    # the analyses perform_enhanced_analysis runs, in order
+    _enhanced_analyses = ('schema_details', 'context_details',
+        'context_incompatibilities', 'lov_definitions', 'stored_procedures')
+
+    # sections that can't be decoded without another section
+    _section_requires = {
+        'Columns;': ('Tables;',),
+    }
+
+    # sections that are read with another section
+    _section_aliases = {
+        'Columns Id;': 'Columns;',
+    }
+
+    def __init__(self, f, engine='file', lazy=False, sections=None,
+            analyses=None, profile=False, tracer=None):
+        """parse the universe in f
+
+        f may be a file object opened in binary mode, a path, or the
+        universe contents as bytes, bytearray, memoryview or io.BytesIO.
+        In-memory contents are decoded in place whatever the engine.
+
+        engine selects how sections are decoded: 'file' reads each field
+        from f, 'mmap' memory-maps the file (or reads it into memory when
+        it can't be mapped) and decodes fields in place. Both engines
+        produce the same universe.
+
+        When lazy is true, the reader only indexes the file. Each universe
+        section and analysis result is decoded or computed the first time
+        it is accessed, and then cached on the universe. A lazy reader
+        keeps the file contents mapped (or in memory) until close() is
+        called, so f may be closed as soon as the reader is created.
+
+        sections and analyses restrict the reader to the named universe
+        sections (such as 'Parameters', 'Objects;' or 'UNW_Storage') and
+        analyses (such as 'cross_references'). The sections an analysis
+        needs are always read. Everything else is skipped and left at its
+        default value on the universe. None means everything.
+
+        When profile is true, the reader measures each phase of its work
+        and leaves the measurements in universe.parse_profile (see
+        profiling.ParseProfile).
+
+        tracer, a tracing.Tracer, is told when each phase starts and
+        ends and receives the events the reader reports along the way.
+        """
         super(Reader, self).__init__()
+        if engine not in Reader._engines:
+            raise ValueError('unknown decoding engine %r (expected one of %s)'
+                % (engine, ', '.join(Reader._engines)))
         self.file = f
-        self.extracted_dir_path = self.unzip_unv_file()
+        self.engine = engine
+        self.lazy = lazy
+        self.analyses = self._select_analyses(analyses)
+        self.selected_sections = self._select_sections(sections,
+            self.analyses)
+        self.archive = None
+        self.stream = open_decoder(f, engine, lazy)
+        try:
+            self.profile = None
+            self.tracer = tracer
+            spans = []
+            if profile:
+                self.stream = CountingDecoder(self.stream)
+                self.profile = ParseProfile(self.stream)
+                spans.append(self.profile)
+            if tracer is not None:
+                spans.append(tracer)
+            # what to tell about phases: None, one tracer, or several
+            self._spans = spans[0] if len(spans) == 1 else \
+                MultiTracer(spans) if spans else None
+
+            self._measure('find_content_offsets', 'index',
+                self.find_content_offsets)
+            self.archive = None
+            if self.selected_sections & set(('UNW_Storage', 'ResourceHeader')):
+                self.archive = self._measure('open_archive', 'archive',
+                    self.open_archive)
+            self.universe = Universe()
+            self.universe.parse_profile = self.profile
+            if lazy:
+                for section, names, loader in self._section_loaders():
+                    if section in self.selected_sections:
+                        self.universe.defer(names, self._deferred(
+                            self._measured(section, 'section', loader)))
+                for name, names, method, _, _ in self._analyses:
+                    if name in self.analyses and names:
+                        self.universe.defer(names, self._deferred(
+                            self._measured(*self._analysis_phase(name,
+                            method))))
+                return
+            for section, names, loader in self._section_loaders():
+                if section in self.selected_sections:
+                    self._measure(section, 'section', loader)
+            # Perform additional analysis, each after the ones it builds on
+            for name, names, method, _, _ in self._analyses:
+                if name in self.analyses:
+                    self._measure(*self._analysis_phase(name, method))
+            if self.analyses.issuperset(Reader._enhanced_analyses):
+                self._report_enhanced_analysis()
+            self.close_archive()
+            self.stream.close()
+        except BaseException:
+            # a universe that can't be read mustn't leave its file, map
+            # or archive open
+            self._abandon()
+            raise
+
+    def close(self):
+        """release the file contents held by a lazy reader. Sections and
+        analyses that haven't been loaded yet can't be loaded afterwards."""
+        self.close_archive()
+        self.stream.close()
+
+    def _abandon(self):
+        """close what the reader opened after reading failed, without
+        hiding the reason it failed"""
+        for close in (self.close_archive, self.stream.close):
+            try:
+                close()
+            except Exception:
+                pass
 
-        self.find_content_offsets()
-        self.universe = Universe()
+    @classmethod
+    def register_analysis(cls, name, method, outputs=(), sections=(),
+            requires=()):
+        """add an analysis that runs after the ones already registered
+
+        method is the name of a Reader method or a function called with
+        the reader; it sets the universe attributes named in outputs
+        (and may report events to reader.tracer). sections are the
+        universe sections it reads and requires the analyses whose
+        results it uses, which always run before it. A lazy reader runs
+        the analysis when one of its outputs is first accessed, so an
+        analysis without outputs only runs eagerly.
+
+        Registering on a subclass of Reader leaves Reader unchanged.
+        """
+        known = set(a[0] for a in cls._analyses)
+        if name in known:
+            raise ValueError('analysis %r is already registered' % name)
+        for required in requires:
+            if required not in known:
+                raise ValueError('unknown analysis %r (expected one of %s)'
+                    % (required, ', '.join(sorted(known))))
+        cls._analyses = cls._analyses + ((name, tuple(outputs), method,
+            tuple(sections), tuple(requires)),)
+
+    def _analysis_phase(self, name, method):
+        """return (phase name, kind, function) to run an analysis"""
+        if isinstance(method, str):
+            return method, 'analysis', getattr(self, method)
+        return name, 'analysis', functools.partial(method, self)
+
+    @classmethod
+    def _select_analyses(cls, analyses):
+        """return the set of analyses to run, including the analyses they
+        build on"""
+        known = dict((a[0], a) for a in cls._analyses)
+        if analyses is None:
+            return set(known)
+        if isinstance(analyses, str):
+            analyses = (analyses,)
+        selected = set()
+        pending = list(analyses)
+        while pending:
+            name = pending.pop()
+            if name not in known:
+                raise ValueError('unknown analysis %r (expected one of %s)'
+                    % (name, ', '.join(sorted(known))))
+            if name not in selected:
+                selected.add(name)
+                pending.extend(known[name][4])
+        return selected
+
+    @classmethod
+    def _select_sections(cls, sections, analyses):
+        """return the set of sections to read: the requested sections,
+        the sections the analyses read, and the sections those need"""
+        known = set(cls._content_markers) | set(('UNW_Storage',
+            'ResourceHeader'))
+        if sections is None:
+            return known
+        if isinstance(sections, str):
+            sections = (sections,)
+        wanted = list(sections)
+        for analysis in cls._analyses:
+            if analysis[0] in analyses:
+                wanted.extend(analysis[3])
+        selected = set()
+        while wanted:
+            name = wanted.pop()
+            if name not in known and name + ';' in known:
+                name += ';'
+            if name not in known:
+                raise ValueError('unknown section %r' % name)
+            name = cls._section_aliases.get(name, name)
+            if name not in selected:
+                selected.add(name)
+                wanted.extend(cls._section_requires.get(name, ()))
+        return selected
+
+    def _section_loaders(self):
+        """return (section, universe attributes, loader) for each section,
+        in the order the sections are read"""
+        loaders = [
+            ('Parameters;', ('parameters',), self._load_parameters),
+            ('Parameters_6_0;', ('custom_parameters',),
+                self._load_custom_parameters),
+            ('Tables;', ('tables', 'table_map'), self._load_tables),
+            ('Virtual Tables;', ('virtual_tables',),
+                self._load_virtual_tables),
+            ('Columns;', ('columns', 'column_attributes'), self._load_columns),
+            ('Joins;', ('joins',), self._load_joins),
+            ('Contexts;', ('contexts',), self._load_contexts),
+            ('Links;', ('links',), self._load_links),
+        ]
+        for section, name, method, default in Reader._optional_sections:
+            loaders.append((section, (name,), functools.partial(
+                self._load_optional_section, name, method, default)))
+        loaders.append(('Objects;', ('classes', 'object_map'),
+            self._load_classes))
+        loaders.append(('UNW_Storage', ('unw_connection_info',
+            'unw_parameters', 'unw_objects_formats', 'unw_hidden_items',
+            'unw_custom_lov'), self.parse_unw_storage_data))
+        loaders.append(('ResourceHeader', ('resource_descriptor',
+            'resource_b_descriptor', 'resource_t_descriptor'),
+            self.parse_resource_header_data))
+        return loaders
+
+    def _measure(self, name, kind, function, *args):
+        """run function(*args) as the phase name, telling the profile and
+        the tracer (if any) when it starts and ends"""
+        spans = self._spans
+        if spans is None:
+            return function(*args)
+        spans.start(name, kind)
+        try:
+            result = function(*args)
+        except BaseException as error:
+            spans.end(name, kind, error)
+            raise
+        spans.end(name, kind, None)
+        return result
+
+    def _measured(self, name, kind, function):
+        """return function, run as the phase name whenever it is called if
+        the reader is profiling or tracing"""
+        if self._spans is None:
+            return function
+        return functools.partial(self._measure, name, kind, function)
+
+    def _warn(self, message):
+        """report a problem the reader worked around to the tracer"""
+        if self.tracer is not None:
+            self.tracer.event('warning', {'message': message})
+
+    def _deferred(self, loader):
+        """wrap loader so it can run in the middle of reading another
+        section without moving the stream"""
+        def load():
+            position = self.stream.tell()
+            try:
+                loader()
+            finally:
+                self.stream.seek(position)
+        return load
+
+    def _load_parameters(self):
         self.universe.parameters = self.read_parameters()
+
+    def _load_custom_parameters(self):
         self.universe.custom_parameters = self.read_customparameters()
+
+    def _load_tables(self):
         self.universe.tables = self.read_tables()
+        self.universe.table_map = {}
         self.universe.build_table_map()
+
+    def _load_virtual_tables(self):
         self.universe.virtual_tables = self.read_virtual_tables()
+
+    def _load_columns(self):
         self.universe.columns = self.read_columns()
-        self.universe.columns.sort(key=lambda c: c.id_)
+        self.universe.columns.sort()
         self.universe.column_attributes = self.read_column_attributes()
+
+    def _load_joins(self):
         self.universe.joins = self.read_joins()
+
+    def _load_contexts(self):
         self.universe.contexts = self.read_contexts()
+
+    def _load_links(self):
         self.universe.links = self.read_links()
+
+    def _load_optional_section(self, name, method, default):
         try:
-            self.universe.hierarchies = self.read_hierarchies()
-        except:
-            self.universe.hierarchies = []
-        # Read additional parameter versions
-        try:
-            self.universe.parameters_4_1 = self.read_parameters_4_1()
-        except:
-            self.universe.parameters_4_1 = None
-        try:
-            self.universe.parameters_5_0 = self.read_parameters_5_0()
-        except:
-            self.universe.parameters_5_0 = None
-        try:
-            self.universe.parameters_11_5 = self.read_parameters_11_5()
-        except:
-            self.universe.parameters_11_5 = None
-        # Read formatting information
-        try:
-            self.universe.object_formats = self.read_object_formats()
-        except:
-            self.universe.object_formats = []
-        try:
-            self.universe.object_extra_formats = self.read_object_extra_formats()
-        except:
-            self.universe.object_extra_formats = []
-        # Read dynamic descriptions
-        try:
-            self.universe.dynamic_class_descriptions = self.read_dynamic_class_descriptions()
-        except:
-            self.universe.dynamic_class_descriptions = {}
-        try:
-            self.universe.dynamic_object_descriptions = self.read_dynamic_object_descriptions()
-        except:
-            self.universe.dynamic_object_descriptions = {}
-        try:
-            self.universe.dynamic_property_descriptions = self.read_dynamic_property_descriptions()
-        except:
-            self.universe.dynamic_property_descriptions = {}
-        # Read audit and metadata
-        try:
-            self.universe.audit_info = self.read_audit_info()
-        except:
-            self.universe.audit_info = None
-        try:
-            self.universe.dimensions = self.read_dimensions()
-        except:
-            self.universe.dimensions = []
-        try:
-            self.universe.olap_info = self.read_olap_info()
-        except:
-            self.universe.olap_info = None
-        try:
-            self.universe.graphical_info = self.read_graphical_info()
-        except:
-            self.universe.graphical_info = None
-        try:
-            self.universe.crystal_references = self.read_crystal_references()
-        except:
-            self.universe.crystal_references = []
-        try:
-            self.universe.xml_lov = self.read_xml_lov()
-        except:
-            self.universe.xml_lov = None
-        try:
-            self.universe.integrity_rules = self.read_integrity_rules()
-        except:
-            self.universe.integrity_rules = []
-        # Read additional metadata sections
-        try:
-            self.universe.aggregate_navigation = self.read_aggregate_navigation()
-        except:
-            self.universe.aggregate_navigation = None
-        try:
-            self.universe.bounded_columns = self.read_bounded_columns()
-        except:
-            self.universe.bounded_columns = []
-        try:
-            self.universe.build_origin_v6 = self.read_build_origin_v6()
-        except:
-            self.universe.build_origin_v6 = None
-        try:
-            self.universe.compulsary_type = self.read_compulsary_type()
-        except:
-            self.universe.compulsary_type = None
-        try:
-            self.universe.deleted_references = self.read_deleted_references()
-        except:
-            self.universe.deleted_references = []
-        try:
-            self.universe.deleted_history = self.read_deleted_history()
-        except:
-            self.universe.deleted_history = []
-        try:
-            self.universe.dot_tables = self.read_dot_tables()
-        except:
-            self.universe.dot_tables = []
-        try:
-            self.universe.downward = self.read_downward()
-        except:
-            self.universe.downward = None
-        try:
-            self.universe.format_locale_sort = self.read_format_locale_sort()
-        except:
-            self.universe.format_locale_sort = None
-        try:
-            self.universe.format_version = self.read_format_version()
-        except:
-            self.universe.format_version = None
-        try:
-            self.universe.joins_extensions = self.read_joins_extensions()
-        except:
-            self.universe.joins_extensions = []
-        try:
-            self.universe.key_references = self.read_key_references()
-        except:
-            self.universe.key_references = []
-        try:
-            self.universe.kernel_page_format = self.read_kernel_page_format()
-        except:
-            self.universe.kernel_page_format = None
-        try:
-            self.universe.platform = self.read_platform()
-        except:
-            self.universe.platform = None
-        try:
-            self.universe.unicode_on = self.read_unicode_on()
-        except:
-            self.universe.unicode_on = None
-        try:
-            self.universe.upward = self.read_upward()
-        except:
-            self.universe.upward = None
-        try:
-            self.universe.upward_local_indexing = self.read_upward_local_indexing()
-        except:
-            self.universe.upward_local_indexing = None
-        try:
-            self.universe.upward_mapping = self.read_upward_mapping()
-        except:
-            self.universe.upward_mapping = None
-        try:
-            self.universe.upward_override = self.read_upward_override()
-        except:
-            self.universe.upward_override = None
-        try:
-            self.universe.upward_override_new = self.read_upward_override_new()
-        except:
-            self.universe.upward_override_new = None
-        try:
-            self.universe.windows_page_format = self.read_windows_page_format()
+            value = getattr(self, method)()
         except:
-            self.universe.windows_page_format = None
+            value = default() if default else None
+        setattr(self.universe, name, value)
+
+    def _load_classes(self):
         self.universe.classes = self.read_classes()
+        self.universe.object_map = {}
         self.universe.build_object_map()
-        # Perform additional analysis
-        self.parse_unw_storage_data()
-        self.parse_resource_header_data()
-        self.perform_cross_reference_analysis()
-        self.perform_validation_checks()
-        self.perform_dependency_analysis()
-        self.perform_enhanced_analysis()
-        self.getDerivedTablesInfo()
-        self.extractPromptsInfo()
-        self.delete_temp_extracted_files()
-
-
-    def delete_temp_extracted_files(self):
-        """
-        Delete the temporary extracted folder if it exists.
-        """
-        if self.extracted_dir_path and os.path.exists(self.extracted_dir_path):
-            try:
-                shutil.rmtree(self.extracted_dir_path)
-                print(f"Deleted temporary folder: {self.extracted_dir_path}")
-            except Exception as e:
-                print(f"Error deleting temporary folder: {e}")
+
+    def close_archive(self):
+        """close the universe zip archive if it is open"""
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
 
     def find_content_offsets(self):
         """find the offsets of the object, table, and column definitions 
@@ -284,43 +481,44 @@ class Reader(object):
         cases, the first occurence is the right one. One exception is when
         the marker recurs almost immediately -- in this case we need to skip
         over the false marker and search the rest of the file.
+
+        The file is scanned once (see sections.SectionIndex). Markers that
+        don't appear in the file are left out of content_offsets.
         """
         
-        self.content_offsets = dict()
-        contents = self.file.read()
-        for marker in Reader._content_markers:
-            marker_bytes = b'\x00' + marker.encode('utf-8')
-            begin = contents.find(marker_bytes)
-            end = begin + len(marker_bytes)
-            if contents.find(marker.encode('utf-8'), begin-20, begin) != -1 or \
-                    contents.find(marker.encode('utf-8'), end, end+20) != -1:
-                begin = contents.find(marker_bytes, end+20)
-                end = begin + len(marker_bytes)
-            self.content_offsets[marker] = end
-        del contents
+        self.sections = SectionIndex(self.stream.contents(),
+            Reader._content_markers)
+        self.content_offsets = self.sections.offsets
         return
     
-    def unzip_unv_file(self):
-        """
-        Unzips the universe file (if it is a zip) and saves the extracted folder in the current working directory.
-        Returns the extracted directory path as extracted_dir_path.
+    def open_archive(self):
+        """return a zipfile.ZipFile for the universe file, or None if the
+        universe file is not a zip archive.
+
+        Archive members (UNW_Storage, ResourceHeader) are read straight
+        from the universe file without extracting them to disk.
         """
-        # Assume self.file is a file object, get its name
-        unv_path = getattr(self.file, 'name', None)
-        if not unv_path or not os.path.isfile(unv_path):
-            print("Universe file path not found or not a file.")
-            return None
-        # Check if file is a zip
-        if not zipfile.is_zipfile(unv_path):
-            print("Universe file is not a zip archive.")
+        fileobj = self.stream.fileobj()
+        try:
+            if not zipfile.is_zipfile(fileobj):
+                return None
+            return zipfile.ZipFile(fileobj, 'r')
+        except (zipfile.BadZipFile, OSError, ValueError):
             return None
-        # Extract to cwd with folder name based on zip filename
-        base_name = os.path.splitext(os.path.basename(unv_path))[0]
-        extracted_dir_path = os.path.join(os.getcwd(), base_name + "_extracted")
-        with zipfile.ZipFile(unv_path, 'r') as zip_ref:
-            zip_ref.extractall(extracted_dir_path)
-        print(f"Extracted universe to: {extracted_dir_path}")
-        return extracted_dir_path
+
+    def _has_member(self, name):
+        """return True if the archive has a member named name"""
+        if self.archive is None:
+            return False
+        try:
+            self.archive.getinfo(name)
+        except KeyError:
+            return False
+        return True
+
+    def _open_member(self, name):
+        """return a file object that streams the archive member name"""
+        return self.archive.open(name, 'r')
 
     def read_parameters(self):
         """docstring for read_parameters
@@ -357,31 +555,27 @@ class Reader(object):
             Parameters_11_5;
         
         """
-        self.file.seek(self.content_offsets['Parameters;'])
+        self.stream.seek(self.content_offsets['Parameters;'])
         params = Parameters()
-        struct.unpack('<2I', self.file.read(8))
+        self.stream.skip(records.PARAMETERS.header.size)
         params.universe_filename = self.read_string()
         params.universe_name = self.read_string()
-        params.revision, = struct.unpack('<I', self.file.read(4))
-        struct.unpack('<H', self.file.read(2))
+        params.revision, = self.stream.unpack(records.PARAMETERS.revision)
         params.description = self.read_string()
         params.created_by = self.read_string()
         params.modified_by = self.read_string()
-        created, modified, = struct.unpack('<2I', self.file.read(8))
+        created, modified, seconds, params.query_row_limit = \
+            self.stream.unpack(records.PARAMETERS.dates)
         params.created_date = Reader.date_from_dateindex(created)
         params.modified_date = Reader.date_from_dateindex(modified)
-        seconds, = struct.unpack('<I', self.file.read(4))
         params.query_time_limit = seconds / 60
-        params.query_row_limit, = struct.unpack('<I', self.file.read(4))
         self.read_string()
         params.object_strategy = self.read_string()
-        struct.unpack('<x', self.file.read(1))
-        seconds, = struct.unpack('<I', self.file.read(4))
+        seconds, params.long_text_limit = \
+            self.stream.unpack(records.PARAMETERS.limits)
         params.cost_estimate_warning_limit = seconds / 60
-        params.long_text_limit, = struct.unpack('<I', self.file.read(4))
-        struct.unpack('<4x', self.file.read(4))
         params.comments = self.read_string()
-        struct.unpack('<3I', self.file.read(12))
+        self.stream.skip(records.PARAMETERS.comments_tail.size)
         params.domain = self.read_string()
         params.dbms_engine = self.read_string()
         params.network_layer = self.read_string()
@@ -402,9 +596,11 @@ class Reader(object):
             Parameters_11_5;
         
         """
-        self.file.seek(self.content_offsets['Parameters_6_0;'])
+        if 'Parameters_6_0;' not in self.content_offsets:
+            return dict()
+        self.stream.seek(self.content_offsets['Parameters_6_0;'])
         params = dict()
-        count, = struct.unpack('<I', self.file.read(4))
+        count, = self.stream.unpack(records.COUNT.count)
         for p in range(count):
             name = self.read_string()
             value = self.read_string()
@@ -423,13 +619,12 @@ class Reader(object):
         ???B tables
 
         """
-        self.file.seek(self.content_offsets['Tables;'])
+        self.stream.seek(self.content_offsets['Tables;'])
         # pdb.set_trace()
-        self.file.read(2)
+        self.stream.skip(records.TABLES.header.size)
         user_name = self.read_string()
         schema = self.read_string()
-        max_table_id, = struct.unpack('<I', self.file.read(4))
-        table_count, = struct.unpack('<I', self.file.read(4))
+        max_table_id, table_count = self.stream.unpack(records.TABLES.counts)
         return [self.read_table(schema) for x in range(table_count)]
 
     def read_virtual_tables(self):
@@ -439,71 +634,64 @@ class Reader(object):
         ???B virtual_tables
 
         """
-        self.file.seek(self.content_offsets['Virtual Tables;'])
-        count, = struct.unpack('<I', self.file.read(4))
+        self.stream.seek(self.content_offsets['Virtual Tables;'])
+        count, = self.stream.unpack(records.COUNT.count)
         return [self.read_virtualtable() for x in range(count)]
 
     def read_columns(self):
         """read the list of source database columns from the universe file
+        into a ColumnCatalog, in one sweep without creating Columns
 
         I column_count
         I column_count?
         ???B columns
 
         """
-        self.file.seek(self.content_offsets['Columns Id;'])
-        column_count, = struct.unpack('<I', self.file.read(4))
-        column_count2, = struct.unpack('<I', self.file.read(4))
+        self.stream.seek(self.content_offsets['Columns Id;'])
+        column_count, column_count2 = \
+            self.stream.unpack(records.COLUMNS.counts)
         #print('count1 %d  count2 %d' % (column_count, column_count2))
-        return [self.read_column() for x in range(column_count2)]
+        catalog = ColumnCatalog(self.universe)
+        unpack = self.stream.unpack
+        read_string = self.stream.read_string
+        head = records.COLUMN.head
+        append = catalog.append
+        for x in range(column_count2):
+            id_, table_id = unpack(head)
+            append(id_, table_id, read_string())
+        return catalog
 
-    
     def read_column_attributes(self):
-        """read a column definition from the universe file
+        """read the column datatypes from the universe file into the
+        column catalog
 
-        I column_id
-        I table_id
-        S column_name
-        B datatype_code (0x02=Numeric, 0x03=String, 0x04=Date, etc.)
-        10B metadata/flags
-        
+        I column_count (for each table, in table order)
+        [repeats column_count times]
+            S column_name
+            B datatype_code (0x02=Numeric, 0x03=String, 0x04=Date, etc.)
+            10B metadata/flags
+
+        A column is matched by its table id and name.
         """
-        self.file.seek(self.content_offsets['Columns;'])
-        
-        # Group columns by table
+        self.stream.seek(self.content_offsets['Columns;'])
+        catalog = self.universe.columns
+        table_map = self.universe.table_map
+        unpack = self.stream.unpack
+        read_string = self.stream.read_string
+        count = records.COUNT.count
+        tail = records.COLUMN_ATTRIBUTES.tail
         for table in self.universe.tables:
-            table_columns = {col.name: col for col in self.universe.columns if col.parent and col.parent.id_ == table.id_}
-            column_count, = struct.unpack('<I', self.file.read(4))
+            column_count, = unpack(count)
+            # columns of tables that aren't in the table map have no parent
+            # and are never matched
+            in_map = table.id_ in table_map
             for i in range(column_count):
-                # id_, = struct.unpack('<I', self.file.read(4))
-                # table_id, = struct.unpack('<I', self.file.read(4))
-                # parent = self.universe.table_map.get(id_, None)  # Use get() to handle missing tables
-                name = self.read_string()
-
-                # Read datatype code (1 byte)
-                datatype_code, = struct.unpack('<B', self.file.read(1))
-                
-                # Map datatype code to human-readable name
-                DATATYPE_MAP = {
-                    0x01: 'Unknown',
-                    0x02: 'Numeric',
-                    0x03: 'String',
-                    0x04: 'Date',
-                    0x05: 'Boolean',
-                    0x06: 'Long'
-                }
-                datatype = DATATYPE_MAP.get(datatype_code, f'Unknown_{datatype_code:02x}')
-                
-                # Read metadata/flags (6 bytes based on pattern analysis)
-                # Pattern: \x01\x00\x00\x00\x00\x00
-                metadata = self.file.read(10)
-                curr_column = table_columns.get(name)
-                if(curr_column):
-                    curr_column.datatype = datatype
-                    curr_column.metadata = metadata
-                print(name, datatype, metadata)
-        
-        # return column
+                name = read_string()
+                # metadata pattern: \x01\x00\x00\x00\x00\x00...
+                datatype_code, metadata = unpack(tail)
+                row = catalog.find(table.id_, name) if in_map else None
+                if row is not None:
+                    catalog.set_attributes(row, datatype_code, metadata)
 
     def read_joins(self):
         """docstring for read_joins
@@ -515,11 +703,10 @@ class Reader(object):
         I unknown
 
         """
-        self.file.seek(self.content_offsets['Joins;'])
-        self.file.read(8)
-        join_count, = struct.unpack('<I', self.file.read(4))
+        self.stream.seek(self.content_offsets['Joins;'])
+        join_count, = self.stream.unpack(records.JOINS.header)
         joins = [self.read_join() for x in range(join_count)]
-        self.file.read(8)
+        self.stream.skip(records.JOINS.trailer.size)
         return joins
 
     def read_contexts(self):
@@ -530,10 +717,9 @@ class Reader(object):
         contexts...
 
         """
-        self.file.seek(self.content_offsets['Contexts;'])
+        self.stream.seek(self.content_offsets['Contexts;'])
         # pdb.set_trace()
-        max_id, = struct.unpack('<I', self.file.read(4))
-        count, = struct.unpack('<I', self.file.read(4))
+        max_id, count = self.stream.unpack(records.ID_COUNT.counts)
         contexts = [self.read_context() for x in range(count)]
         return contexts
 
@@ -545,9 +731,10 @@ class Reader(object):
         links...
 
         """
-        self.file.seek(self.content_offsets['Links;'])
-        max_id, = struct.unpack('<I', self.file.read(4))
-        count, = struct.unpack('<I', self.file.read(4))
+        if 'Links;' not in self.content_offsets:
+            return []
+        self.stream.seek(self.content_offsets['Links;'])
+        max_id, count = self.stream.unpack(records.ID_COUNT.counts)
         links = [self.read_link() for x in range(count)]
         return links
 
@@ -559,17 +746,18 @@ class Reader(object):
         hierarchies...
 
         """
-        self.file.seek(self.content_offsets['Hierarchies;'])
-        max_id, = struct.unpack('<I', self.file.read(4))
-        count, = struct.unpack('<I', self.file.read(4))
+        if 'Hierarchies;' not in self.content_offsets:
+            return []
+        self.stream.seek(self.content_offsets['Hierarchies;'])
+        max_id, count = self.stream.unpack(records.ID_COUNT.counts)
         hierarchies = [self.read_hierarchy() for x in range(count)]
         return hierarchies
 
     def read_classes(self):
         """docstring for read_classes"""
-        self.file.seek(self.content_offsets['Objects;'])
+        self.stream.seek(self.content_offsets['Objects;'])
         class_count, object_count, condition_count, rootclass_count, = \
-            struct.unpack('<4I', self.file.read(16))
+            self.stream.unpack(records.CLASSES.counts)
         return [self.read_class(None) for x in range(rootclass_count)]
         
     def read_table(self, schema):
@@ -586,17 +774,15 @@ class Reader(object):
             xxI unknown (count times)
         
         """
-        id_, = struct.unpack('<I', self.file.read(4))
-        self.file.read(19)
+        layout = records.TABLE
+        id_, = self.stream.unpack(layout.head)
         name = self.read_string()
-        parent_id, = struct.unpack('<I', self.file.read(4))
-        self.file.read(9)
-        flag, = struct.unpack('<?', self.file.read(1))
+        parent_id, flag = self.stream.unpack(layout.tail)
         if flag:
-            count, = struct.unpack('<H', self.file.read(2))
-            self.file.read(4*count+3)
+            count, = self.stream.unpack(layout.count)
+            self.stream.skip(4*count+3)
         else:
-            self.file.read(1)
+            self.stream.skip(layout.pad.size)
         return Table(self.universe, id_, parent_id, name, schema)
 
     def read_virtualtable(self):
@@ -606,7 +792,7 @@ class Reader(object):
         S select
         
         """
-        table_id, = struct.unpack('<I', self.file.read(4))
+        table_id, = self.stream.unpack(records.VIRTUAL_TABLE.head)
         select = self.read_string()
         return VirtualTable(self.universe, table_id, select)
 
@@ -618,8 +804,7 @@ class Reader(object):
         S table_name
         
         """
-        id_, = struct.unpack('<I', self.file.read(4))
-        table_id, = struct.unpack('<I', self.file.read(4))
+        id_, table_id = self.stream.unpack(records.COLUMN.head)
         parent = self.universe.table_map.get(table_id, None)  # Use get() to handle missing tables
         name = self.read_string()
         #print(name)
@@ -641,22 +826,21 @@ class Reader(object):
         ???B subclasses
 
         """
-        id_, = struct.unpack('<I', self.file.read(4))
+        layout = records.CLASS
+        id_, = self.stream.unpack(layout.head)
         name = self.read_string()
-        parent_id, = struct.unpack('<I', self.file.read(4))
+        parent_id, = self.stream.unpack(layout.parent)
         if parent:
             assert(parent_id==parent.id_)
         else:
             assert(parent_id == 0)
         description = self.read_string()
         c = Class(self.universe, id_, parent, name, description)
-        uk = self.file.read(7)
-        # self.file.seek(7, os.SEEK_CUR)
-        object_count, = struct.unpack('<I', self.file.read(4))
+        object_count, = self.stream.unpack(layout.object_count)
         c.objects = [self.read_object(c) for x in range(object_count)]
-        condition_count, = struct.unpack('<I', self.file.read(4))
+        condition_count, = self.stream.unpack(records.COUNT.count)
         c.conditions = [self.read_condition(c) for x in range(condition_count)]
-        subclass_count, = struct.unpack('<I', self.file.read(4))
+        subclass_count, = self.stream.unpack(records.COUNT.count)
         c.subclasses = [self.read_class(c) for x in range(subclass_count)]
         return c
 
@@ -681,30 +865,27 @@ class Reader(object):
         55B unknown  (LOV settings, hide indicator?)
 
        """
-        id_, = struct.unpack('<I', self.file.read(4))
+        layout = records.OBJECT
+        id_, = self.stream.unpack(layout.head)
         name = self.read_string()
-        parent_id, = struct.unpack('<I', self.file.read(4))
+        parent_id, = self.stream.unpack(layout.parent)
         if parent:
             assert(parent_id==parent.id_)
         else:
             assert(parent_id == 0)
         description = self.read_string()
         o = Object(self.universe, id_, parent, name, description)
-        select_tablecount, = struct.unpack('<H', self.file.read(2))
-        struct.unpack('<%dI' % select_tablecount, 
-            self.file.read(4 * select_tablecount))
-        where_tablecount, = struct.unpack('<H', self.file.read(2))
-        struct.unpack('<%dI' % where_tablecount, 
-            self.file.read(4 * where_tablecount))
+        select_tablecount, = self.stream.unpack(layout.table_count)
+        self.stream.skip(4 * select_tablecount)
+        where_tablecount, = self.stream.unpack(layout.table_count)
+        self.stream.skip(4 * where_tablecount)
         o.select = self.read_string()
         o.where = self.read_string()
         o.format = self.read_string()
         unknown2 = self.read_string()
         o.lov_name = self.read_string()
-        self.file.seek(2, os.SEEK_CUR)
-        visibility, = struct.unpack('<B', self.file.read(1))
+        visibility, = self.stream.unpack(layout.tail)
         o.visible = visibility != 0x36
-        self.file.seek(55, os.SEEK_CUR)
         return o
 
     def read_condition(self, parent):
@@ -722,21 +903,20 @@ class Reader(object):
         S where
 
         """
-        id_, = struct.unpack('<I', self.file.read(4))
+        layout = records.CONDITION
+        id_, = self.stream.unpack(layout.head)
         name = self.read_string()
-        parent_id, = struct.unpack('<I', self.file.read(4))
+        parent_id, = self.stream.unpack(layout.parent)
         if parent:
             assert(parent_id==parent.id_)
         else:
             assert(parent_id == 0)
         description = self.read_string()
         c = Condition(self.universe, id_, parent, name, description)
-        where_tablecount, = struct.unpack('<H', self.file.read(2))
-        struct.unpack('<%dI' % where_tablecount, 
-            self.file.read(4 * where_tablecount))
-        unknown_tablecount, = struct.unpack('<H', self.file.read(2))
-        struct.unpack('<%dI' % unknown_tablecount, 
-            self.file.read(4 * unknown_tablecount))
+        where_tablecount, = self.stream.unpack(layout.table_count)
+        self.stream.skip(4 * where_tablecount)
+        unknown_tablecount, = self.stream.unpack(layout.table_count)
+        self.stream.skip(4 * unknown_tablecount)
         c.where = self.read_string()
         return c
 
@@ -753,16 +933,15 @@ class Reader(object):
             I term_table_id
 
         """
-        join_id, = struct.unpack('<I', self.file.read(4))
-        self.file.read(20)
+        layout = records.JOIN
+        join_id, = self.stream.unpack(layout.head)
         j = Join(self.universe, join_id)
         j.expression = self.read_string()
-        self.file.read(8)
-        j.term_count, = struct.unpack('<I', self.file.read(4))
+        j.term_count, = self.stream.unpack(layout.term_count)
         j.terms = []
         for i in range(j.term_count):
             term_name = self.read_string()
-            term_parent_id, = struct.unpack('<I', self.file.read(4)) 
+            term_parent_id, = self.stream.unpack(layout.term)
             j.terms.append((term_name, term_parent_id))
         return j
 
@@ -778,13 +957,11 @@ class Reader(object):
 
         """
         name = self.read_string()
-        id_, = struct.unpack('<I', self.file.read(4))
+        id_, = self.stream.unpack(records.CONTEXT.id_)
         description = self.read_string()
         c = Context(self.universe, id_, name, description)
-        join_count, = struct.unpack('<I', self.file.read(4))
-        for i in range(join_count):
-            join_id, = struct.unpack('<I', self.file.read(4))
-            c.joins.append(join_id)
+        join_count, = self.stream.unpack(records.CONTEXT.join_count)
+        c.joins.extend(self.stream.unpack(records.id_array(join_count)))
         return c
 
     def read_link(self):
@@ -797,7 +974,7 @@ class Reader(object):
 
         """
         name = self.read_string()
-        id_, = struct.unpack('<I', self.file.read(4))
+        id_, = self.stream.unpack(records.LINK.id_)
         description = self.read_string()
         linked_universe = self.read_string()
         l = Link(self.universe, id_, name, description, linked_universe)
@@ -815,23 +992,16 @@ class Reader(object):
 
         """
         name = self.read_string()
-        id_, = struct.unpack('<I', self.file.read(4))
+        id_, = self.stream.unpack(records.HIERARCHY.id_)
         description = self.read_string()
         h = Hierarchy(self.universe, id_, name, description)
-        level_count, = struct.unpack('<I', self.file.read(4))
-        for i in range(level_count):
-            level_id, = struct.unpack('<I', self.file.read(4))
-            h.levels.append(level_id)
+        level_count, = self.stream.unpack(records.HIERARCHY.level_count)
+        h.levels.extend(self.stream.unpack(records.id_array(level_count)))
         return h
 
     def read_string(self):
         """read a variable-length string from the universe file"""
-        length, = struct.unpack('<H', self.file.read(2))
-        if length:
-            s, = struct.unpack('<%ds' % length, self.file.read(length))
-            return s.translate(None, b'\x0d\x0a').decode('utf-8', errors='ignore')
-        else:
-            return None
+        return self.stream.read_string()
 
     @classmethod
     def date_from_dateindex(cls, dateindex):
@@ -847,388 +1017,377 @@ class Reader(object):
         """Read Parameters_4_1 section"""
         if 'Parameters_4_1;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['Parameters_4_1;'])
+        self.stream.seek(self.content_offsets['Parameters_4_1;'])
         # Read the binary data
         length = self._get_section_length('Parameters_4_1;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_parameters_5_0(self):
         """Read Parameters_5_0 section"""
         if 'Parameters_5_0;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['Parameters_5_0;'])
+        self.stream.seek(self.content_offsets['Parameters_5_0;'])
         length = self._get_section_length('Parameters_5_0;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_parameters_11_5(self):
         """Read Parameters_11_5 section"""
         if 'Parameters_11_5;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['Parameters_11_5;'])
+        self.stream.seek(self.content_offsets['Parameters_11_5;'])
         length = self._get_section_length('Parameters_11_5;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_object_formats(self):
         """Read Object_Formats section"""
         if 'Object_Formats;' not in self.content_offsets:
             return []
-        self.file.seek(self.content_offsets['Object_Formats;'])
+        self.stream.seek(self.content_offsets['Object_Formats;'])
         length = self._get_section_length('Object_Formats;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return []
 
     def read_object_extra_formats(self):
         """Read Object_ExtraFormats section"""
         if 'Object_ExtraFormats;' not in self.content_offsets:
             return []
-        self.file.seek(self.content_offsets['Object_ExtraFormats;'])
+        self.stream.seek(self.content_offsets['Object_ExtraFormats;'])
         length = self._get_section_length('Object_ExtraFormats;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return []
 
     def read_dynamic_class_descriptions(self):
         """Read Dynamic_Class_Descriptions section"""
         if 'Dynamic_Class_Descriptions;' not in self.content_offsets:
             return {}
-        self.file.seek(self.content_offsets['Dynamic_Class_Descriptions;'])
+        self.stream.seek(self.content_offsets['Dynamic_Class_Descriptions;'])
         length = self._get_section_length('Dynamic_Class_Descriptions;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return {}
 
     def read_dynamic_object_descriptions(self):
         """Read Dynamic_Object_Descriptions section"""
         if 'Dynamic_Object_Descriptions;' not in self.content_offsets:
             return {}
-        self.file.seek(self.content_offsets['Dynamic_Object_Descriptions;'])
+        self.stream.seek(self.content_offsets['Dynamic_Object_Descriptions;'])
         length = self._get_section_length('Dynamic_Object_Descriptions;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return {}
 
     def read_dynamic_property_descriptions(self):
         """Read Dynamic_Property_Descriptions section"""
         if 'Dynamic_Property_Descriptions;' not in self.content_offsets:
             return {}
-        self.file.seek(self.content_offsets['Dynamic_Property_Descriptions;'])
+        self.stream.seek(self.content_offsets['Dynamic_Property_Descriptions;'])
         length = self._get_section_length('Dynamic_Property_Descriptions;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return {}
 
     def read_audit_info(self):
         """Read Audit information"""
         if 'Audit;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['Audit;'])
+        self.stream.seek(self.content_offsets['Audit;'])
         length = self._get_section_length('Audit;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_dimensions(self):
         """Read Dimensions section"""
         if 'Dimensions;' not in self.content_offsets:
             return []
-        self.file.seek(self.content_offsets['Dimensions;'])
+        self.stream.seek(self.content_offsets['Dimensions;'])
         length = self._get_section_length('Dimensions;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return []
 
     def read_olap_info(self):
         """Read OLAP information"""
         if 'OLAPInfo;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['OLAPInfo;'])
+        self.stream.seek(self.content_offsets['OLAPInfo;'])
         length = self._get_section_length('OLAPInfo;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_graphical_info(self):
         """Read Graphical information"""
         if 'Graphical_Info;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['Graphical_Info;'])
+        self.stream.seek(self.content_offsets['Graphical_Info;'])
         length = self._get_section_length('Graphical_Info;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_crystal_references(self):
         """Read Crystal References"""
         if 'Crystal_References;' not in self.content_offsets:
             return []
-        self.file.seek(self.content_offsets['Crystal_References;'])
+        self.stream.seek(self.content_offsets['Crystal_References;'])
         length = self._get_section_length('Crystal_References;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return []
 
     def read_xml_lov(self):
         """Read XML LOV information"""
         if 'XML-LOV;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['XML-LOV;'])
+        self.stream.seek(self.content_offsets['XML-LOV;'])
         length = self._get_section_length('XML-LOV;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_integrity_rules(self):
         """Read Integrity rules"""
         if 'Integrity;' not in self.content_offsets:
             return []
-        self.file.seek(self.content_offsets['Integrity;'])
+        self.stream.seek(self.content_offsets['Integrity;'])
         length = self._get_section_length('Integrity;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return []
 
     def read_aggregate_navigation(self):
         """Read Aggregate Navigation information"""
         if 'AggregateNavigation;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['AggregateNavigation;'])
+        self.stream.seek(self.content_offsets['AggregateNavigation;'])
         length = self._get_section_length('AggregateNavigation;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_bounded_columns(self):
         """Read Bounded Columns information"""
         if 'BoundedColumns;' not in self.content_offsets:
             return []
-        self.file.seek(self.content_offsets['BoundedColumns;'])
+        self.stream.seek(self.content_offsets['BoundedColumns;'])
         length = self._get_section_length('BoundedColumns;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return []
 
     def read_build_origin_v6(self):
         """Read Build Origin V6 information"""
         if 'BuildOrigin_v6;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['BuildOrigin_v6;'])
+        self.stream.seek(self.content_offsets['BuildOrigin_v6;'])
         length = self._get_section_length('BuildOrigin_v6;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_compulsary_type(self):
         """Read Compulsary Type information"""
         if 'CompulsaryType;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['CompulsaryType;'])
+        self.stream.seek(self.content_offsets['CompulsaryType;'])
         length = self._get_section_length('CompulsaryType;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_deleted_references(self):
         """Read Deleted References"""
         if 'Deleted References;' not in self.content_offsets:
             return []
-        self.file.seek(self.content_offsets['Deleted References;'])
+        self.stream.seek(self.content_offsets['Deleted References;'])
         length = self._get_section_length('Deleted References;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return []
 
     def read_deleted_history(self):
         """Read Deleted History"""
         if 'DELETED_HISTORY;' not in self.content_offsets:
             return []
-        self.file.seek(self.content_offsets['DELETED_HISTORY;'])
+        self.stream.seek(self.content_offsets['DELETED_HISTORY;'])
         length = self._get_section_length('DELETED_HISTORY;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return []
 
     def read_dot_tables(self):
         """Read Dot Tables information"""
         if 'Dot_Tables;' not in self.content_offsets:
             return []
-        self.file.seek(self.content_offsets['Dot_Tables;'])
+        self.stream.seek(self.content_offsets['Dot_Tables;'])
         length = self._get_section_length('Dot_Tables;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return []
 
     def read_downward(self):
         """Read Downward information"""
         if 'Downward;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['Downward;'])
+        self.stream.seek(self.content_offsets['Downward;'])
         length = self._get_section_length('Downward;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_format_locale_sort(self):
         """Read Format Locale Sort information"""
         if 'FormatLocaleSort;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['FormatLocaleSort;'])
+        self.stream.seek(self.content_offsets['FormatLocaleSort;'])
         length = self._get_section_length('FormatLocaleSort;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_format_version(self):
         """Read Format Version information"""
         if 'FormatVersion;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['FormatVersion;'])
+        self.stream.seek(self.content_offsets['FormatVersion;'])
         length = self._get_section_length('FormatVersion;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_joins_extensions(self):
         """Read Joins Extensions"""
         if 'Joins Extensions;' not in self.content_offsets:
             return []
-        self.file.seek(self.content_offsets['Joins Extensions;'])
+        self.stream.seek(self.content_offsets['Joins Extensions;'])
         length = self._get_section_length('Joins Extensions;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return []
 
     def read_key_references(self):
         """Read Key References"""
         if 'Key References;' not in self.content_offsets:
             return []
-        self.file.seek(self.content_offsets['Key References;'])
+        self.stream.seek(self.content_offsets['Key References;'])
         length = self._get_section_length('Key References;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return []
 
     def read_kernel_page_format(self):
         """Read Kernel Page Format information"""
         if 'KernelPageFormat;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['KernelPageFormat;'])
+        self.stream.seek(self.content_offsets['KernelPageFormat;'])
         length = self._get_section_length('KernelPageFormat;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_platform(self):
         """Read Platform information"""
         if 'Platform;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['Platform;'])
+        self.stream.seek(self.content_offsets['Platform;'])
         length = self._get_section_length('Platform;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_unicode_on(self):
         """Read Unicode On information"""
         if 'UNICODE ON;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['UNICODE ON;'])
+        self.stream.seek(self.content_offsets['UNICODE ON;'])
         length = self._get_section_length('UNICODE ON;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_upward(self):
         """Read Upward information"""
         if 'Upward;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['Upward;'])
+        self.stream.seek(self.content_offsets['Upward;'])
         length = self._get_section_length('Upward;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_upward_local_indexing(self):
         """Read Upward Local Indexing information"""
         if 'Upward_LocalIndexing;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['Upward_LocalIndexing;'])
+        self.stream.seek(self.content_offsets['Upward_LocalIndexing;'])
         length = self._get_section_length('Upward_LocalIndexing;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_upward_mapping(self):
         """Read Upward Mapping information"""
         if 'Upward_Mapping;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['Upward_Mapping;'])
+        self.stream.seek(self.content_offsets['Upward_Mapping;'])
         length = self._get_section_length('Upward_Mapping;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_upward_override(self):
         """Read Upward Override information"""
         if 'Upward_Override;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['Upward_Override;'])
+        self.stream.seek(self.content_offsets['Upward_Override;'])
         length = self._get_section_length('Upward_Override;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_upward_override_new(self):
         """Read Upward Override New information"""
         if 'Upward_Override_New;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['Upward_Override_New;'])
+        self.stream.seek(self.content_offsets['Upward_Override_New;'])
         length = self._get_section_length('Upward_Override_New;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def read_windows_page_format(self):
         """Read Windows Page Format information"""
         if 'WindowsPageFormat;' not in self.content_offsets:
             return None
-        self.file.seek(self.content_offsets['WindowsPageFormat;'])
+        self.stream.seek(self.content_offsets['WindowsPageFormat;'])
         length = self._get_section_length('WindowsPageFormat;')
         if length > 0:
-            return self.file.read(length)
+            return self.stream.read(length)
         return None
 
     def _get_section_length(self, marker):
         """Helper method to calculate section length"""
-        current_pos = self.file.tell()
-        # Find the next marker or end of file
-        next_markers = [m for m in self.content_offsets.keys() if self.content_offsets[m] > current_pos]
-        if next_markers:
-            next_pos = min(self.content_offsets[m] for m in next_markers)
-            return next_pos - current_pos
-        else:
-            # Last section, read to end
-            self.file.seek(0, 2)  # Seek to end
-            end_pos = self.file.tell()
-            self.file.seek(current_pos)
-            return end_pos - current_pos
+        section = self.sections.get(marker)
+        if section is None:
+            return 0
+        return section.end - self.stream.tell()
 
     # Enhanced parsing methods for UNW_Storage and ResourceHeader data
 
     def parse_unw_storage_data(self):
-        """Parse structured data from UNW_Storage directory if available"""
+        """Parse structured data from the UNW_Storage archive members if available"""
         unw_storage_path = self._get_unw_storage_path()
         if not unw_storage_path:
-            if self.extracted_dir_path:
-                unw_storage_path = os.path.join(self.extracted_dir_path, "UNW_Storage")
-            if not unw_storage_path:
-                return
+            return
 
         # Parse connection information
         self.universe.unw_connection_info = self._parse_unw_connection(unw_storage_path)
@@ -1246,7 +1405,7 @@ class Reader(object):
         self.universe.unw_custom_lov = self._parse_unw_custom_lov(unw_storage_path)
 
     def parse_resource_header_data(self):
-        """Parse structured data from ResourceHeader directory if available"""
+        """Parse structured data from the ResourceHeader archive members if available"""
         resource_path = self._get_resource_header_path()
         if not resource_path:
             return
@@ -1260,23 +1419,31 @@ class Reader(object):
         # Parse T-descriptor
         self.universe.resource_t_descriptor = self._parse_resource_t_descriptor(resource_path)
 
-    def _get_unw_storage_path(self):
-        """Get path to UNW_Storage directory if it exists"""
-        # This would need to be implemented based on how the unzipped data is accessed
-        # For now, return None as we don't have direct file system access in this context
+    def _get_archive_dir(self, name):
+        """return the archive path of the directory name, or None if the
+        archive has no members under it"""
+        if self.archive is None:
+            return None
+        prefix = name + '/'
+        for member in self.archive.namelist():
+            if member.startswith(prefix):
+                return name
         return None
 
+    def _get_unw_storage_path(self):
+        """Get the archive path of the UNW_Storage directory if it exists"""
+        return self._get_archive_dir('UNW_Storage')
+
     def _get_resource_header_path(self):
-        """Get path to ResourceHeader directory if it exists"""
-        # Similar to above
-        return None
+        """Get the archive path of the ResourceHeader directory if it exists"""
+        return self._get_archive_dir('ResourceHeader|')
 
     def _parse_unw_connection(self, base_path):
         """Parse connection information from UNW_Storage/Connection"""
         try:
-            connection_file = os.path.join(base_path, "Connection", "Connection")
-            if os.path.exists(connection_file):
-                with open(connection_file, 'rb') as f:
+            connection_file = posixpath.join(base_path, "Connection", "Connection")
+            if self._has_member(connection_file):
+                with self._open_member(connection_file) as f:
                     # data = f.read()
                     data = None
                     # Try to extract readable connection information
@@ -1289,9 +1456,9 @@ class Reader(object):
         """Parse parameters from UNW_Storage/Parameters"""
         params = {}
         try:
-            param_file = os.path.join(base_path, "Parameters", "Parameters")
-            if os.path.exists(param_file):
-                with open(param_file, 'rb') as f:
+            param_file = posixpath.join(base_path, "Parameters", "Parameters")
+            if self._has_member(param_file):
+                with self._open_member(param_file) as f:
                     data = f.read()
                     # Try to extract parameter key-value pairs
                     params = self._extract_parameters(data)
@@ -1303,9 +1470,9 @@ class Reader(object):
         """Parse objects formats from UNW_Storage/Objects Formats"""
         formats = {}
         try:
-            format_file = os.path.join(base_path, "Objects Formats", "Objects Formats")
-            if os.path.exists(format_file):
-                with open(format_file, 'rb') as f:
+            format_file = posixpath.join(base_path, "Objects Formats", "Objects Formats")
+            if self._has_member(format_file):
+                with self._open_member(format_file) as f:
                     data = f.read()
                     # Try to extract format information
                     formats = self._extract_formats(data)
@@ -1317,9 +1484,9 @@ class Reader(object):
         """Parse hidden items from UNW_Storage/Hidden_Items"""
         hidden = []
         try:
-            hidden_file = os.path.join(base_path, "Hidden_Items", "Hidden_Items")
-            if os.path.exists(hidden_file):
-                with open(hidden_file, 'rb') as f:
+            hidden_file = posixpath.join(base_path, "Hidden_Items", "Hidden_Items")
+            if self._has_member(hidden_file):
+                with self._open_member(hidden_file) as f:
                     data = f.read()
                     # Try to extract hidden item IDs
                     hidden = self._extract_hidden_items(data)
@@ -1331,9 +1498,9 @@ class Reader(object):
         """Parse custom LOV from UNW_Storage/Customized_LOV"""
         lov = []
         try:
-            lov_file = os.path.join(base_path, "Customized_LOV", "Customized_LOV")
-            if os.path.exists(lov_file):
-                with open(lov_file, 'rb') as f:
+            lov_file = posixpath.join(base_path, "Customized_LOV", "Customized_LOV")
+            if self._has_member(lov_file):
+                with self._open_member(lov_file) as f:
                     data = f.read()
                     # Try to extract LOV information
                     lov = self._extract_lov(data)
@@ -1344,9 +1511,9 @@ class Reader(object):
     def _parse_resource_descriptor(self, base_path):
         """Parse descriptor from ResourceHeader/Descriptor"""
         try:
-            desc_file = os.path.join(base_path, "Descriptor;")
-            if os.path.exists(desc_file):
-                with open(desc_file, 'rb') as f:
+            desc_file = posixpath.join(base_path, "Descriptor;")
+            if self._has_member(desc_file):
+                with self._open_member(desc_file) as f:
                     data = f.read()
                     return self._extract_descriptor_info(data)
         except:
@@ -1356,9 +1523,9 @@ class Reader(object):
     def _parse_resource_b_descriptor(self, base_path):
         """Parse B-descriptor from ResourceHeader/B-Descriptor"""
         try:
-            desc_file = os.path.join(base_path, "B-Descriptor;")
-            if os.path.exists(desc_file):
-                with open(desc_file, 'rb') as f:
+            desc_file = posixpath.join(base_path, "B-Descriptor;")
+            if self._has_member(desc_file):
+                with self._open_member(desc_file) as f:
                     return f.read()
         except:
             pass
@@ -1367,9 +1534,9 @@ class Reader(object):
     def _parse_resource_t_descriptor(self, base_path):
         """Parse T-descriptor from ResourceHeader/T-Descriptor"""
         try:
-            desc_file = os.path.join(base_path, "T-Descriptor;")
-            if os.path.exists(desc_file):
-                with open(desc_file, 'rb') as f:
+            desc_file = posixpath.join(base_path, "T-Descriptor;")
+            if self._has_member(desc_file):
+                with self._open_member(desc_file) as f:
                     return f.read()
         except:
             pass
@@ -1431,7 +1598,8 @@ class Reader(object):
                 'database_type':database_type,
                 'connection_string':connection_str
             }
-            print(info)
+            if self.tracer is not None:
+                self.tracer.event('connection_info', info)
             return info if info else data
         except:
             return data
@@ -1499,13 +1667,15 @@ class Reader(object):
 
     def perform_cross_reference_analysis(self):
         """Perform cross-reference analysis on the universe"""
+        self.universe.cross_references = {}
+        tables_by_name = self.universe.table_name_map
         # Analyze object-to-table relationships
         for obj in self._get_all_objects():
-            if obj.select_sql:
-                table_refs = self._extract_table_references(obj.select_sql)
+            if obj.select:
+                table_refs = obj.select_references.table_names(self.universe)
                 for table_ref in table_refs:
                     # Find the actual table
-                    table = next((t for t in self.universe.tables if t.name == table_ref), None)
+                    table = tables_by_name.get(table_ref)
                     if table:
                         self.universe.cross_references[f"obj_{obj.id_}_table_{table.id_}"] = {
                             'type': 'object_table',
@@ -1519,7 +1689,7 @@ class Reader(object):
         for join in self.universe.joins:
             table_refs = self._extract_table_references(join.statement)
             for table_ref in table_refs:
-                table = next((t for t in self.universe.tables if t.name == table_ref), None)
+                table = tables_by_name.get(table_ref)
                 if table:
                     self.universe.cross_references[f"join_{join.id_}_table_{table.id_}"] = {
                         'type': 'join_table',
@@ -1531,10 +1701,12 @@ class Reader(object):
 
     def perform_validation_checks(self):
         """Perform validation checks on the universe"""
+        self.universe.validation_errors = []
         # Check for broken references in SQL
         for obj in self._get_all_objects():
-            if obj.select_sql:
-                broken_refs = self._find_broken_references(obj.select_sql)
+            if obj.select:
+                broken_refs = self._find_broken_references(
+                    obj.select_references)
                 for broken_ref in broken_refs:
                     self.universe.validation_errors.append({
                         'type': 'broken_reference',
@@ -1545,8 +1717,9 @@ class Reader(object):
                         'message': f"Object '{obj.name}' references non-existent table '{broken_ref}' in SELECT clause"
                     })
             
-            if obj.where_sql:
-                broken_refs = self._find_broken_references(obj.where_sql)
+            if obj.where:
+                broken_refs = self._find_broken_references(
+                    obj.where_references)
                 for broken_ref in broken_refs:
                     self.universe.validation_errors.append({
                         'type': 'broken_reference',
@@ -1559,9 +1732,11 @@ class Reader(object):
         
         # Check for orphaned objects (objects that reference non-existent tables)
         for obj in self._get_all_objects():
-            if obj.select_sql:
-                table_refs = self._extract_table_references(obj.select_sql)
-                if not table_refs:
+            if obj.select:
+                references = obj.select_references
+                # an object built from other objects reaches its tables
+                # through them
+                if not references.table_refs and not references.object_refs:
                     self.universe.validation_errors.append({
                         'type': 'orphaned_object',
                         'object_id': obj.id_,
@@ -1689,88 +1864,98 @@ class Reader(object):
             self.universe.context_details[context.id_] = context_info
 
     def _analyze_context_incompatibilities(self):
-        """Analyze incompatible objects between different contexts"""
-        self.universe.context_incompatibilities = []
+        """Analyze incompatible objects between different contexts
 
-        # Get all objects that belong to contexts
-        context_objects = {}
-        for context in self.universe.contexts:
-            context_objects[context.id_] = set()
+        Sets of contexts are bitmasks (ints) with bit i for the context
+        with the i-th smallest id (see _context_masks). An object can be
+        used in the contexts of the tables its select clause refers to,
+        and it is reported once for each pair of those contexts that
+        share no join, in id order.
+        """
+        self.universe.context_incompatibilities = []
+        incompatibilities = self.universe.context_incompatibilities
+        context_ids, table_masks, incompatible = self._context_masks()
+        context_names = [self._get_context_name_by_id(ctx)
+            for ctx in context_ids]
 
         # For each object, determine which contexts it can be used in
         # This is a simplified analysis - in reality, context incompatibilities
         # are determined by the joins and tables an object references
-        for cls in self.universe.classes:
-            self._analyze_class_contexts(cls, context_objects)
+        context_objects = {}
+        for obj in self._get_all_objects():
+            mask = 0
+            for table_ref in obj.select_references.table_names(self.universe):
+                mask |= table_masks.get(table_ref, 0)
+            context_objects[obj.id_] = mask
 
         # Find objects that are incompatible between contexts
-        for obj_id, obj_contexts in context_objects.items():
-            if len(obj_contexts) > 1:
-                # Object can be used in multiple contexts - check for conflicts
-                contexts_list = list(obj_contexts)
-                for i, ctx1 in enumerate(contexts_list):
-                    for ctx2 in contexts_list[i+1:]:
-                        if self._contexts_are_incompatible(ctx1, ctx2):
-                            obj_name = self._get_object_name_by_id(obj_id)
-                            incompatibility = {
-                                'object_id': obj_id,
-                                'object_name': obj_name,
-                                'context1_id': ctx1,
-                                'context1_name': self._get_context_name_by_id(ctx1),
-                                'context2_id': ctx2,
-                                'context2_name': self._get_context_name_by_id(ctx2),
-                                'reason': 'Object references tables from incompatible contexts'
-                            }
-                            self.universe.context_incompatibilities.append(incompatibility)
-
-    def _analyze_class_contexts(self, cls, context_objects):
-        """Analyze which contexts a class's objects belong to"""
-        for obj in cls.objects:
-            obj_contexts = set()
-            # Determine contexts based on table references
-            table_refs = self._extract_table_references(obj.select_sql)
-            if table_refs:
-                for table_ref in table_refs:
-                    for context_id, context_info in self.universe.context_details.items():
-                        if any(self.universe.database_tables.get(tid, {}).get('name') == table_ref 
-                               for tid in context_info['tables_involved']):
-                            obj_contexts.add(context_id)
-            context_objects[obj.id_] = obj_contexts
-
-        for subclass in cls.subclasses:
-            self._analyze_class_contexts(subclass, context_objects)
+        for obj_id, mask in context_objects.items():
+            if not mask & (mask - 1):
+                # fewer than two contexts
+                continue
+            obj_name = self._get_object_name_by_id(obj_id)
+            rest = mask
+            while rest:
+                bit = rest & -rest
+                rest ^= bit
+                i = bit.bit_length() - 1
+                others = incompatible[i] & rest
+                while others:
+                    bit = others & -others
+                    others ^= bit
+                    j = bit.bit_length() - 1
+                    incompatibilities.append({
+                        'object_id': obj_id,
+                        'object_name': obj_name,
+                        'context1_id': context_ids[i],
+                        'context1_name': context_names[i],
+                        'context2_id': context_ids[j],
+                        'context2_name': context_names[j],
+                        'reason': 'Object references tables from incompatible contexts'
+                    })
 
-    def _contexts_are_incompatible(self, ctx1_id, ctx2_id):
-        """Check if two contexts are incompatible"""
-        # Simplified check: contexts are incompatible if they don't share any joins
-        ctx1_joins = set(self.universe.context_details[ctx1_id]['joins'])
-        ctx2_joins = set(self.universe.context_details[ctx2_id]['joins'])
-        return len(ctx1_joins & ctx2_joins) == 0
+    def _context_masks(self):
+        """return the context ids in order, {table name: mask of the
+        contexts whose joins involve the table}, and for each context the
+        mask of the contexts it shares no join with"""
+        details = self.universe.context_details
+        database_tables = self.universe.database_tables
+        context_ids = sorted(details)
+        table_masks = {}
+        join_bits = {}
+        join_masks = []
+        for i, context_id in enumerate(context_ids):
+            info = details[context_id]
+            names = set(database_tables.get(tid, {}).get('name')
+                for tid in info['tables_involved'])
+            for name in names:
+                table_masks[name] = table_masks.get(name, 0) | 1 << i
+            joins = 0
+            for join_id in info['joins']:
+                joins |= 1 << join_bits.setdefault(join_id, len(join_bits))
+            join_masks.append(joins)
+        # the context x context compatibility matrix, one row per context
+        incompatible = []
+        for joins in join_masks:
+            row = 0
+            for j, other in enumerate(join_masks):
+                if not joins & other:
+                    row |= 1 << j
+            incompatible.append(row)
+        return context_ids, table_masks, incompatible
 
     def _get_object_name_by_id(self, obj_id):
         """Get object name by ID"""
-        for cls in self.universe.classes:
-            name = self._find_object_in_class(cls, obj_id)
-            if name:
-                return name
+        obj = self.universe.object_map.get(obj_id)
+        if obj and obj.name:
+            return obj.name
         return f"Object_{obj_id}"
 
-    def _find_object_in_class(self, cls, obj_id):
-        """Find object name in class hierarchy"""
-        for obj in cls.objects:
-            if obj.id_ == obj_id:
-                return obj.name
-        for subclass in cls.subclasses:
-            name = self._find_object_in_class(subclass, obj_id)
-            if name:
-                return name
-        return None
-
     def _get_context_name_by_id(self, ctx_id):
         """Get context name by ID"""
-        for context in self.universe.contexts:
-            if context.id_ == ctx_id:
-                return context.name
+        context = self.universe.context_map.get(ctx_id)
+        if context:
+            return context.name
         return f"Context_{ctx_id}"
 
     def _extract_lov_definitions(self):
@@ -1813,24 +1998,38 @@ class Reader(object):
             }
             self.universe.lov_definitions['xml_lov'] = xml_lov_info
 
+    def _extract_schema_details(self):
+        """Extract database tables, their columns, and the joins between
+        them. Columns and joins update the table details, so these three
+        always run together."""
+        self._measure('_extract_database_tables', 'analysis',
+            self._extract_database_tables)
+        self._measure('_extract_table_columns', 'analysis',
+            self._extract_table_columns)
+        self._measure('_extract_join_details', 'analysis',
+            self._extract_join_details)
+
     def perform_enhanced_analysis(self):
         """Perform enhanced analysis to extract database tables, columns, joins, contexts, and LOV information"""
-        print("DEBUG: Starting enhanced analysis")
-        self._extract_database_tables()
-        print(f"DEBUG: Extracted {len(self.universe.database_tables)} database tables")
-        self._extract_table_columns()
-        print(f"DEBUG: Extracted columns for {len(self.universe.table_columns)} tables")
-        self._extract_join_details()
-        print(f"DEBUG: Extracted {len(self.universe.join_details)} join details")
-        self._extract_context_details()
-        print(f"DEBUG: Extracted {len(self.universe.context_details)} context details")
-        self._analyze_context_incompatibilities()
-        print(f"DEBUG: Found {len(self.universe.context_incompatibilities)} incompatibilities")
-        self._extract_lov_definitions()
-        print(f"DEBUG: Extracted {len(self.universe.lov_definitions)} LOV definitions")
-        self._extract_stored_procedure_parameters()
-        print(f"DEBUG: Extracted {len(self.universe.stored_procedure_parameters)} stored procedures with parameters")
-        print("DEBUG: Enhanced analysis completed")
+        known = dict((a[0], a) for a in self._analyses)
+        for name in Reader._enhanced_analyses:
+            self._measure(*self._analysis_phase(name, known[name][2]))
+        self._report_enhanced_analysis()
+
+    def _report_enhanced_analysis(self):
+        """report the sizes of the enhanced analysis results to the
+        tracer"""
+        if self.tracer is not None:
+            u = self.universe
+            self.tracer.event('enhanced_analysis', {
+                'database_tables': len(u.database_tables),
+                'table_columns': len(u.table_columns),
+                'join_details': len(u.join_details),
+                'context_details': len(u.context_details),
+                'context_incompatibilities': len(u.context_incompatibilities),
+                'lov_definitions': len(u.lov_definitions),
+                'stored_procedures': len(u.stored_procedure_parameters),
+            })
 
     # Helper methods for analysis
 
@@ -1839,6 +2038,7 @@ class Reader(object):
         import xml.etree.ElementTree as ET
         import re
         
+        self.universe.stored_procedure_parameters = {}
         try:
             # Get the path to UNW_Storage if available
             unw_storage_path = self._get_unw_storage_path()
@@ -1848,14 +2048,14 @@ class Reader(object):
                 self._extract_procedure_params_from_binary()
             else:
                 # Read from UNW_Storage/Tables file
-                tables_file = os.path.join(unw_storage_path, "Tables", "Tables")
-                if os.path.exists(tables_file):
-                    with open(tables_file, 'rb') as f:
+                tables_file = posixpath.join(unw_storage_path, "Tables", "Tables")
+                if self._has_member(tables_file):
+                    with self._open_member(tables_file) as f:
                         data = f.read()
                     self._parse_procedure_xml_from_binary(data)
                     
         except Exception as e:
-            print(f"DEBUG: Error extracting stored procedure parameters: {e}")
+            self._warn(f"Error extracting stored procedure parameters: {e}")
 
     def _extract_procedure_params_from_binary(self):
         """Extract procedure parameters from the binary file content"""
@@ -1864,20 +2064,20 @@ class Reader(object):
             if 'Tables;' not in self.content_offsets:
                 return
                 
-            self.file.seek(self.content_offsets['Tables;'])
+            self.stream.seek(self.content_offsets['Tables;'])
             # Skip header information
-            self.file.read(2)
+            self.stream.skip(records.TABLES.header.size)
             user_name = self.read_string()
             schema = self.read_string()
-            max_table_id, = struct.unpack('<I', self.file.read(4))
-            table_count, = struct.unpack('<I', self.file.read(4))
+            max_table_id, table_count = \
+                self.stream.unpack(records.TABLES.counts)
             
             # Read remaining content which may contain procedure XML
-            remaining_data = self.file.read()
+            remaining_data = self.stream.read()
             self._parse_procedure_xml_from_binary(remaining_data)
             
         except Exception as e:
-            print(f"DEBUG: Error reading procedure parameters from binary: {e}")
+            self._warn(f"Error reading procedure parameters from binary: {e}")
 
     def _parse_procedure_xml_from_binary(self, data):
         """Parse procedure XML from binary data to extract parameters"""
@@ -1916,7 +2116,7 @@ class Reader(object):
                     self._parse_procedure_parameters_manual(proc_xml_raw)
                     
         except Exception as e:
-            print(f"DEBUG: Error parsing procedure XML: {e}")
+            self._warn(f"Error parsing procedure XML: {e}")
 
     def _parse_procedure_parameters_manual(self, proc_str):
         """Manually parse procedure parameters if XML parsing fails"""
@@ -1946,56 +2146,32 @@ class Reader(object):
             pass  # Silent failure for manual parsing
         
     def _get_all_objects(self):
-        """Get all objects from all classes recursively"""
-        objects = []
-        for cls in self.universe.classes:
-            self._collect_objects_from_class(cls, objects)
-        return objects
-
-    def _collect_objects_from_class(self, cls, objects_list):
-        """Recursively collect objects from a class and its subclasses"""
-        objects_list.extend(cls.objects)
-        for subclass in cls.subclasses:
-            self._collect_objects_from_class(subclass, objects_list)
+        """Get all objects from all classes recursively (see
+        Universe.all_objects, which the analyses share)"""
+        return self.universe.all_objects
 
     def _extract_table_references(self, sql):
-        """Extract table references from SQL"""
-        if not sql:
-            return []
-        table_refs = []
-        # Simple regex to find table references in SQL
-        # This is a basic implementation - could be enhanced
-        import re        # Look for patterns like Table_Name. or @aggregate_aware(Table_Name.
-        table_pattern = r'\b([A-Za-z_][A-Za-z0-9_]*)\.'
-        matches = re.findall(table_pattern, sql)
-        # Remove duplicates and filter out common SQL keywords
-        sql_keywords = {'SELECT', 'FROM', 'WHERE', 'AND', 'OR', 'NOT', 'IN', 'BETWEEN', 'LIKE', 'IS', 'NULL'}
-        table_refs = [match for match in matches if match.upper() not in sql_keywords]
-        return list(set(table_refs))  # Remove duplicates
-
-    def _find_broken_references(self, sql):
-        """Find broken table references in SQL"""
-        if not sql:
-            return []
-        table_refs = self._extract_table_references(sql)
-        broken_refs = []
-        for table_ref in table_refs:
-            # Check if table exists in universe
-            table_exists = any(t.name == table_ref for t in self.universe.tables)
-            if not table_exists:
-                broken_refs.append(table_ref)
-        return broken_refs
+        """Extract table references from SQL (see sqlscan.scan_sql); object
+        SQL has them cached in select_references and where_references"""
+        return scan_sql(sql).table_names(self.universe)
+
+    def _find_broken_references(self, references):
+        """Find broken table references in an object's SqlReferences"""
+        table_refs = references.table_names(self.universe)
+        tables_by_name = self.universe.table_name_map
+        return [table_ref for table_ref in table_refs
+            if table_ref not in tables_by_name]
 
     def _analyze_dependencies(self):
         """Analyze dependencies between objects"""
         deps = {}
         for obj in self._get_all_objects():
             obj_deps = []
-            if obj.select_sql:
-                table_refs = self._extract_table_references(obj.select_sql)
-                obj_deps.extend(table_refs)
-            if obj.where_sql:
-                table_refs = self._extract_table_references(obj.where_sql)
-                obj_deps.extend(table_refs)
+            if obj.select:
+                obj_deps.extend(
+                    obj.select_references.table_names(self.universe))
+            if obj.where:
+                obj_deps.extend(
+                    obj.where_references.table_names(self.universe))
             deps[obj.id_] = obj_deps
         return deps
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+records.py
+
+Precompiled layouts of the fixed-size parts of universe records.
+
+Every record documented in the reader.Reader docstrings is a run of
+fixed-size fields broken up by strings and counted arrays. Each of those
+fixed runs is compiled once here as a struct.Struct (unknown fields
+become pad bytes), so the reader decodes a whole run with one unpack
+call instead of parsing a format string for every field.
+"""
+
+import struct
+
+
+class Layout(object):
+
+    """The fixed runs of one record, named after the field they start with"""
+
+    def __init__(self, name, **runs):
+        super(Layout, self).__init__()
+        self.name = name
+        self.runs = dict((run, struct.Struct('<' + fmt))
+            for run, fmt in runs.items())
+        for run, s in self.runs.items():
+            setattr(self, run, s)
+
+    def __repr__(self):
+        return 'Layout(%r, %s)' % (self.name, ', '.join('%s=%r' % (run,
+            self.runs[run].format) for run in sorted(self.runs)))
+
+
+# section headers
+
+PARAMETERS = Layout('Parameters;',
+    header='8x',                # I unknown, I unknown
+    revision='I2x',             # I revision, H unknown
+    dates='4I',                 # I created, I modified, I query_time_limit,
+                                # I query_row_limit
+    limits='x2I4x',             # x, I cost_estimate_warning_limit,
+                                # I long_text_limit, 4x
+    comments_tail='12x')        # 3I unknown
+
+COUNT = Layout('count', count='I')
+
+TABLES = Layout('Tables;', header='2x', counts='2I')
+
+COLUMNS = Layout('Columns Id;', counts='2I')
+
+JOINS = Layout('Joins;', header='8xI', trailer='8x')
+
+ID_COUNT = Layout('max id and count', counts='2I')
+
+CLASSES = Layout('Objects;', counts='4I')
+
+# records
+
+TABLE = Layout('table',
+    head='I19x',                # I table_id, 7x, 3I unknown
+    tail='I9x?',                # I parent_id, 9x, ? flag
+    count='H',
+    pad='x')
+
+VIRTUAL_TABLE = Layout('virtual table', head='I')
+
+COLUMN = Layout('column', head='2I')
+
+COLUMN_ATTRIBUTES = Layout('column attributes', tail='B10s')
+
+CLASS = Layout('class',
+    head='I',                   # I id
+    parent='I',                 # I parent_id
+    object_count='7xI')         # 7B unknown, I object_count
+
+OBJECT = Layout('object',
+    head='I',
+    parent='I',
+    table_count='H',
+    tail='2xB55x')              # 2x, x visibility, 55B unknown
+
+CONDITION = Layout('condition',
+    head='I',
+    parent='I',
+    table_count='H')
+
+JOIN = Layout('join',
+    head='I20x',                # I join_id, 5I unknown
+    term_count='8xI',           # 2I unknown, I term_count
+    term='I')
+
+CONTEXT = Layout('context', id_='I', join_count='I')
+
+LINK = Layout('link', id_='I')
+
+HIERARCHY = Layout('hierarchy', id_='I', level_count='I')
+
+
+RECORDS = dict((layout.name, layout) for layout in (PARAMETERS, COUNT,
+    TABLES, COLUMNS, JOINS, ID_COUNT, CLASSES, TABLE, VIRTUAL_TABLE, COLUMN,
+    COLUMN_ATTRIBUTES, CLASS, OBJECT, CONDITION, JOIN, CONTEXT, LINK,
+    HIERARCHY))
+
+
+_ID_ARRAYS = {}
+
+
+def id_array(count):
+    """return the Struct for an array of count 32-bit ids"""
+    s = _ID_ARRAYS.get(count)
+    if s is None:
+        s = _ID_ARRAYS[count] = struct.Struct('<%dI' % count)
+    return s
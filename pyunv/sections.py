@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+sections.py
+
+Locate the named sections ("Objects;", "Tables;", ...) of a universe file.
+
+Every section starts with a null byte followed by its marker, and every
+marker ends with a semicolon. SectionIndex walks the semicolons in the
+file once, records each marker occurrence it finds, and then picks the
+real occurrence for each marker. DirectSectionIndex searches for each
+marker instead, which is quicker when only a few markers are wanted.
+"""
+
+import collections
+
+
+Section = collections.namedtuple('Section', ['name', 'start', 'end'])
+
+
+class SectionIndex(object):
+
+    """Index of the section markers in a universe file
+
+    occurrences maps each marker to the offsets of every null-prefixed
+    occurrence in the file. offsets maps each marker that was found to
+    the offset of the first byte after it. sections is the list of
+    Section(name, start, end) tuples sorted by start, where end is the
+    offset of the next section's marker (or the end of the file).
+    """
+
+    # a marker that recurs within this many bytes is a false marker
+    false_marker_distance = 20
+
+    def __init__(self, contents, markers):
+        super(SectionIndex, self).__init__()
+        self.markers = tuple(markers)
+        self.size = len(contents)
+        self.occurrences = self._scan(contents)
+        self.offsets = dict()
+        for marker in self.markers:
+            begin = self._resolve(contents, marker)
+            if begin != -1:
+                self.offsets[marker] = begin + len(marker) + 1
+        self._build_sections()
+
+    def _scan(self, contents):
+        """record every null-prefixed marker occurrence in one pass over
+        the semicolons in contents"""
+        names = dict((marker.encode('utf-8'), marker)
+            for marker in self.markers)
+        longest = max(len(name) for name in names) if names else 0
+        occurrences = dict((marker, []) for marker in self.markers)
+        find = contents.find
+        rfind = contents.rfind
+        semicolon = find(b';')
+        while semicolon != -1:
+            null = rfind(b'\x00', max(0, semicolon - longest), semicolon)
+            if null != -1:
+                # bytes() because bytearray slices aren't hashable
+                marker = names.get(bytes(contents[null+1:semicolon+1]))
+                if marker:
+                    occurrences[marker].append(null)
+            semicolon = find(b';', semicolon + 1)
+        return occurrences
+
+    def _resolve(self, contents, marker):
+        """return the offset of the real occurrence of marker, or -1
+
+        In most cases, the first occurence is the right one. One exception
+        is when the marker recurs almost immediately -- in this case we
+        skip over the false marker and use the next occurrence after it.
+        """
+        begins = self.occurrences[marker]
+        if not begins:
+            return -1
+        text = marker.encode('utf-8')
+        distance = self.false_marker_distance
+        begin = begins[0]
+        end = begin + len(text) + 1
+        if contents.find(text, max(0, begin-distance), begin) != -1 or \
+                contents.find(text, end, end+distance) != -1:
+            for later in begins[1:]:
+                if later >= end + distance:
+                    return later
+            return -1
+        return begin
+
+    def _build_sections(self):
+        starts = sorted((start, marker)
+            for marker, start in self.offsets.items())
+        self.sections = []
+        for i, (start, marker) in enumerate(starts):
+            if i + 1 < len(starts):
+                next_start, next_marker = starts[i+1]
+                end = next_start - len(next_marker) - 1
+            else:
+                end = self.size
+            self.sections.append(Section(marker, start, end))
+        self._by_name = dict((s.name, s) for s in self.sections)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def __iter__(self):
+        return iter(self.sections)
+
+    def __len__(self):
+        return len(self.sections)
+
+    def get(self, name, default=None):
+        """return the Section named name, or default"""
+        return self._by_name.get(name, default)
+
+    def __getitem__(self, name):
+        return self._by_name[name]
+
+
+class DirectSectionIndex(SectionIndex):
+
+    """SectionIndex that searches the file for each marker in turn
+
+    Each search runs at C speed, so for a handful of markers this is much
+    quicker than walking every semicolon in the file. The offsets are the
+    same as SectionIndex finds for those markers, but occurrences stops
+    at the last occurrence the offsets can depend on, and section ends
+    only take the indexed markers into account.
+    """
+
+    def _scan(self, contents):
+        occurrences = dict()
+        find = contents.find
+        for marker in self.markers:
+            # null bytes are everywhere in a universe file, so search for
+            # the marker text and check the byte before it
+            text = marker.encode('utf-8')
+            distance = self.false_marker_distance
+            found = []
+            begin = find(text, 1)
+            while begin != -1:
+                if contents[begin-1] == 0:
+                    found.append(begin - 1)
+                    # _resolve only looks past the first occurrence when
+                    # it is a false marker, and then only as far as the
+                    # first occurrence clear of it
+                    end = found[0] + len(text) + 1
+                    if len(found) == 1 and find(text,
+                            max(0, found[0] - distance), found[0]) == -1 \
+                            and find(text, end, end + distance) == -1:
+                        break
+                    if begin - 1 >= end + distance:
+                        break
+                begin = find(text, begin + 1)
+            occurrences[marker] = found
+        return occurrences
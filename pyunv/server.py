@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+server.py
+
+Serve universe metadata as JSON over HTTP.
+
+The server documents the universes under one directory. Parsed universes
+are kept in a least recently used cache keyed by path, modification time
+and size, so a page view costs a dictionary lookup instead of a parse
+(and a saved universe is parsed again on its next request).
+
+    GET /universes                          the universe files
+    GET /universes/<path>.unv               parameters and statistics
+    GET /universes/<path>.unv/<section>     one of SECTIONS
+
+    server = make_server('universes/', port=8080)
+    server.serve_forever()
+"""
+
+import collections
+import datetime
+import http.server
+import json
+import os
+import threading
+import urllib.parse
+
+import pyunv
+from pyunv.reader import Reader
+from pyunv.batch import find_universes
+
+
+def _parameters(universe):
+    return {
+        'parameters': vars(universe.parameters)
+            if universe.parameters else None,
+        'custom_parameters': universe.custom_parameters,
+        'statistics': universe.statistics,
+    }
+
+
+def _object(o):
+    return {
+        'id': o.id_,
+        'name': o.name,
+        'description': o.description,
+        'select_sql': o.select_sql,
+        'where_sql': o.where_sql,
+        'visible': o.visible,
+    }
+
+
+def _class(c):
+    return {
+        'id': c.id_,
+        'name': c.name,
+        'description': c.description,
+        'objects': [_object(o) for o in c.objects],
+        'conditions': [_object(o) for o in c.conditions],
+        'subclasses': [_class(s) for s in c.subclasses],
+    }
+
+
+def _classes(universe):
+    return [_class(c) for c in universe.classes]
+
+
+def _objects(universe):
+    objects = []
+
+    def visit(c):
+        for o in c.objects:
+            item = _object(o)
+            item['class'] = c.name
+            objects.append(item)
+        for s in c.subclasses:
+            visit(s)
+    for c in universe.classes:
+        visit(c)
+    return objects
+
+
+def _tables(universe):
+    return [{'id': t.id_, 'name': t.name, 'schema': t.schema,
+        'fullname': t.fullname, 'alias_of': t.parent_id or None}
+        for t in universe.tables]
+
+
+def _joins(universe):
+    return [{'id': j.id_, 'statement': j.statement,
+        'tables': sorted(set(table_id for column, table_id in j.terms))}
+        for j in universe.joins]
+
+
+def _contexts(universe):
+    return [{'id': c.id_, 'name': c.name, 'description': c.description,
+        'joins': list(c.joins)} for c in universe.contexts]
+
+
+def _validation(universe):
+    return universe.validation_errors
+
+
+# the JSON documents a universe can be viewed as, by URL section
+SECTIONS = collections.OrderedDict([
+    ('classes', _classes),
+    ('objects', _objects),
+    ('tables', _tables),
+    ('joins', _joins),
+    ('contexts', _contexts),
+    ('validation', _validation),
+])
+
+
+def _default(value):
+    """encode the values json doesn't know about"""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('latin-1')
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    return str(value)
+
+
+def encode(document):
+    """return document as UTF-8 JSON"""
+    return json.dumps(document, default=_default).encode('utf-8')
+
+
+class UniverseCache(object):
+
+    """Least recently used cache of parsed universes
+
+    Entries are keyed by absolute path, modification time and size, so a
+    changed universe file misses the cache and is parsed again. The
+    encoded JSON documents are kept with each universe.
+    """
+
+    def __init__(self, max_entries=16):
+        super(UniverseCache, self).__init__()
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key_for(self, path):
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+    def get(self, path):
+        """return (universe, documents) for the universe file at path"""
+        key = self.key_for(path)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        # parse outside the lock so one slow universe doesn't block the
+        # others; two requests racing for a new universe both parse it
+        entry = (Reader(path).universe, {})
+        with self.lock:
+            for old in [k for k in self.entries if k[0] == key[0]]:
+                del self.entries[old]
+            self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def document(self, path, section):
+        """return the encoded JSON document section of the universe at
+        path"""
+        universe, documents = self.get(path)
+        body = documents.get(section)
+        if body is None:
+            if section is None:
+                body = encode(_parameters(universe))
+            else:
+                body = encode(SECTIONS[section](universe))
+            documents[section] = body
+        return body
+
+
+class UniverseRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    """Answer GET requests for universe metadata"""
+
+    server_version = 'pyunv/' + pyunv.__version__
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path
+        parts = [urllib.parse.unquote(p) for p in path.split('/') if p]
+        if not parts or parts[0] != 'universes':
+            return self.send_error(404, 'Not found')
+        if len(parts) == 1:
+            return self.send_json(encode(self.server.universe_list()))
+        for i, part in enumerate(parts):
+            if part.lower().endswith('.unv'):
+                break
+        else:
+            return self.send_error(404, 'Not a universe')
+        filename = self.server.resolve(parts[1:i+1])
+        section = parts[i+1] if len(parts) > i + 1 else None
+        if filename is None or len(parts) > i + 2 or \
+                (section is not None and section not in SECTIONS):
+            return self.send_error(404, 'Not found')
+        try:
+            body = self.server.cache.document(filename, section)
+        except Exception as error:
+            self.log_error('unable to read %s: %s', filename, error)
+            return self.send_error(500, 'Unable to read this universe')
+        self.send_json(body)
+
+    def send_json(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class UniverseServer(http.server.ThreadingHTTPServer):
+
+    """HTTP server for the universes under root"""
+
+    daemon_threads = True
+
+    def __init__(self, root, address=('127.0.0.1', 8080), cache_size=16,
+            handler=UniverseRequestHandler):
+        self.root = os.path.realpath(root)
+        self.cache = UniverseCache(cache_size)
+        http.server.ThreadingHTTPServer.__init__(self, address, handler)
+
+    def universe_list(self):
+        return [os.path.relpath(path, self.root).replace(os.sep, '/')
+            for path in find_universes([self.root])]
+
+    def resolve(self, parts):
+        """return the universe file for URL path parts, or None if it
+        isn't a file under root"""
+        if any(part in ('', '.', '..') or '/' in part or os.sep in part
+                for part in parts):
+            return None
+        path = os.path.realpath(os.path.join(self.root, *parts))
+        if os.path.commonpath([self.root, path]) != self.root or \
+                not os.path.isfile(path):
+            return None
+        return path
+
+
+def make_server(root, host='127.0.0.1', port=8080, cache_size=16):
+    """return a UniverseServer for the universes under root"""
+    return UniverseServer(root, (host, port), cache_size)
@@ -0,0 +1,623 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+snapshot.py
+
+A compact binary snapshot format for Universe.
+
+The universe graph is full of back-references (universe, parent), which
+makes pickles of it slow and deeply recursive. A snapshot is flat
+instead. Each string is stored once in a string table. Tables, columns,
+classes, objects, conditions, joins, contexts, links and hierarchies
+are stored column-wise, as arrays that refer to strings and to each
+other by index. loads() rebuilds the graph from the arrays.
+
+    data = snapshot.dumps(universe)
+    universe = snapshot.loads(data)
+
+Layout (little-endian):
+
+    9s  magic (PYUNVSNAP)
+    H   format version
+    string table:
+        I count
+        I byte length of each string (repeats count times)
+        utf-8 bytes of every string, back to back
+    body: the sections written by _Writer.universe, in order
+
+String references are 1-based indexes into the string table, and 0
+stands for None. The remaining universe attributes (analysis results,
+raw section blobs, UNW_Storage data) hold no references to the graph.
+They are stored as one plain block: marshal data when marshal can
+encode them, or tagged values otherwise (dates, for example).
+"""
+
+import array
+import datetime
+import marshal
+import struct
+import sys
+
+from pyunv.universe import Universe, Parameters, Class, Object, Condition
+from pyunv.universe import Join, Context, Link, Hierarchy, Table
+from pyunv.universe import VirtualTable, ColumnCatalog, COLUMN_DATATYPES
+
+
+MAGIC = b'PYUNVSNAP'
+FORMAT_VERSION = 2
+
+_HEADER = struct.Struct('<%dsH' % len(MAGIC))
+_U32 = struct.Struct('<I')
+_I64 = struct.Struct('<q')
+_F64 = struct.Struct('<d')
+
+# arrays are stored little-endian
+_SWAP = sys.byteorder != 'little'
+
+# universe attributes stored in their own sections; the rest are values
+_MODEL_ATTRIBUTES = frozenset(('parameters', 'tables', 'table_map',
+    'virtual_tables', 'columns', 'classes', 'object_map', 'joins',
+    'contexts', 'links', 'hierarchies', '_loaders', '_defaults'))
+
+# universe attributes about the Reader run, the objects' SQL caches and
+# the universe's indexes rather than the universe
+_TRANSIENT_ATTRIBUTES = frozenset(('parse_profile', 'sql_generation',
+    '_indexes'))
+
+_DATATYPE_CODES = dict((name, code)
+    for code, name in COLUMN_DATATYPES.items())
+
+
+class SnapshotError(ValueError):
+
+    """The data is not a snapshot this version of pyunv can read"""
+
+
+def dumps(universe):
+    """return a snapshot of universe as bytes
+
+    Attributes of a lazy universe that haven't been loaded yet are
+    loaded first.
+    """
+    for name in universe.pending:
+        getattr(universe, name)
+    writer = _Writer()
+    writer.universe(universe)
+    return writer.getvalue()
+
+
+def loads(data):
+    """return the Universe in a snapshot made by dumps()
+
+    Data that isn't a complete, intact snapshot raises SnapshotError.
+    """
+    try:
+        return _Reader(data).universe()
+    except SnapshotError:
+        raise
+    except Exception as error:
+        # a damaged index or count shows up as whatever error the
+        # decoding step that trips over it raises
+        raise SnapshotError('corrupt snapshot (%s: %s)'
+            % (type(error).__name__, error)) from error
+
+
+def dump(universe, f):
+    """write a snapshot of universe to the binary file f"""
+    f.write(dumps(universe))
+
+
+def load(f):
+    """read a snapshot from the binary file f and return its Universe"""
+    return loads(f.read())
+
+
+class _Writer(object):
+
+    def __init__(self):
+        super(_Writer, self).__init__()
+        self.out = bytearray()
+        self.strings = {}
+        self.string_list = []
+
+    def getvalue(self):
+        encoded = [s.encode('utf-8', 'surrogatepass')
+            for s in self.string_list]
+        lengths = array.array('I', [len(s) for s in encoded])
+        if _SWAP:
+            lengths.byteswap()
+        return b''.join([_HEADER.pack(MAGIC, FORMAT_VERSION),
+            _U32.pack(len(encoded)), lengths.tobytes(), b''.join(encoded),
+            bytes(self.out)])
+
+    def ref(self, s):
+        """return the string table reference of s"""
+        if s is None:
+            return 0
+        i = self.strings.get(s)
+        if i is None:
+            self.string_list.append(s)
+            i = self.strings[s] = len(self.string_list)
+        return i
+
+    def u32(self, n):
+        self.out += _U32.pack(n)
+
+    def ints(self, values, typecode='I'):
+        a = array.array(typecode, values)
+        if _SWAP:
+            a.byteswap()
+        self.u32(len(a))
+        self.out += a.tobytes()
+
+    def refs(self, strings):
+        ref = self.ref
+        self.ints([ref(s) for s in strings])
+
+    def value(self, v):
+        """write a plain value (None, bool, int, float, str, bytes, date,
+        or a list, tuple, set or dict of them)"""
+        out = self.out
+        if v is None:
+            out += b'N'
+        elif v is True:
+            out += b'T'
+        elif v is False:
+            out += b'F'
+        elif isinstance(v, int):
+            if -2**63 <= v < 2**63:
+                out += b'i' + _I64.pack(v)
+            else:
+                out += b'I' + _U32.pack(self.ref(str(v)))
+        elif isinstance(v, float):
+            out += b'f' + _F64.pack(v)
+        elif isinstance(v, str):
+            out += b's' + _U32.pack(self.ref(v))
+        elif isinstance(v, (bytes, bytearray)):
+            out += b'b' + _U32.pack(len(v)) + v
+        elif isinstance(v, datetime.datetime):
+            out += b'M' + _U32.pack(self.ref(v.isoformat()))
+        elif isinstance(v, datetime.date):
+            out += b'D' + _U32.pack(v.toordinal())
+        elif isinstance(v, dict):
+            out += b'd' + _U32.pack(len(v))
+            for key, item in v.items():
+                self.value(key)
+                self.value(item)
+        elif isinstance(v, (list, tuple, set, frozenset)):
+            tag = {list: b'l', tuple: b't', set: b'S',
+                frozenset: b'Z'}.get(type(v), b'l')
+            out += tag + _U32.pack(len(v))
+            for item in v:
+                self.value(item)
+        else:
+            raise TypeError("can't snapshot %s value %r"
+                % (type(v).__name__, v))
+
+    def plain(self, v):
+        """write a block of plain values, with marshal if it can encode
+        them"""
+        try:
+            data = marshal.dumps(v)
+        except ValueError:
+            self.out += b'v'
+            self.value(v)
+        else:
+            self.out += b'm' + _U32.pack(len(data)) + data
+
+    def universe(self, u):
+        if u.parameters is None:
+            self.value(None)
+        else:
+            self.value(dict(vars(u.parameters)))
+        self.tables(u)
+        self.columns(u)
+        self.classes(u)
+        self.joins(u.joins)
+        self.contexts(u.contexts)
+        self.links(u.links)
+        self.hierarchies(u.hierarchies)
+        self.plain(dict((name, value) for name, value in vars(u).items()
+            if name not in _MODEL_ATTRIBUTES
+            and name not in _TRANSIENT_ATTRIBUTES))
+
+    def tables(self, u):
+        tables = u.tables
+        self.ints([t.id_ for t in tables])
+        self.ints([t.parent_id for t in tables])
+        self.refs([t.name for t in tables])
+        self.refs([t.schema for t in tables])
+        rows = dict((id(t), row) for row, t in enumerate(tables))
+        self.ints(list(u.table_map.keys()))
+        self.ints([rows[id(t)] for t in u.table_map.values()])
+        self.ints([v.table_id for v in u.virtual_tables])
+        self.refs([v.select for v in u.virtual_tables])
+
+    def columns(self, u):
+        catalog = u.columns
+        if not isinstance(catalog, ColumnCatalog):
+            catalog = self._catalog(u, catalog)
+        self.ints(catalog.ids)
+        self.ints(catalog.table_ids)
+        self.ints(catalog.datatype_codes, 'B')
+        self.refs(catalog.names)
+        self.plain(catalog.metadata)
+
+    def _catalog(self, u, columns):
+        """return a ColumnCatalog with the rows of a list of Columns"""
+        catalog = ColumnCatalog(u)
+        for row, c in enumerate(columns):
+            catalog.append(c.id_, c.parent.id_ if c.parent else 0, c.name)
+            metadata = getattr(c, 'metadata', None)
+            if c.datatype is not None or metadata is not None:
+                code = _DATATYPE_CODES.get(c.datatype)
+                if code is None and c.datatype:
+                    code = int(c.datatype.rsplit('_', 1)[-1], 16)
+                catalog.set_attributes(row, code or 0, metadata or b'')
+        return catalog
+
+    def classes(self, u):
+        classes = []
+        parents = []
+
+        def walk(c, parent_row):
+            row = len(classes)
+            classes.append(c)
+            parents.append(parent_row)
+            for subclass in c.subclasses:
+                walk(subclass, row + 1)
+
+        for c in u.classes:
+            walk(c, 0)
+        self.ints([c.id_ for c in classes])
+        self.ints(parents)
+        self.refs([c.name for c in classes])
+        self.refs([c.description for c in classes])
+
+        objects = []
+        object_classes = []
+        conditions = []
+        condition_classes = []
+        for row, c in enumerate(classes):
+            objects.extend(c.objects)
+            object_classes.extend([row] * len(c.objects))
+            conditions.extend(c.conditions)
+            condition_classes.extend([row] * len(c.conditions))
+        self.ints(object_classes)
+        self.items(objects, True)
+        self.ints(condition_classes)
+        self.items(conditions, False)
+
+        rows = dict((id(o), row) for row, o in enumerate(objects))
+        self.ints(list(u.object_map.keys()))
+        self.ints([rows[id(o)] for o in u.object_map.values()])
+
+    def items(self, items, objects):
+        """write the fields of objects or conditions"""
+        self.ints([o.id_ for o in items])
+        self.refs([o.name for o in items])
+        self.refs([o.description for o in items])
+        self.refs([o.select for o in items])
+        self.refs([o.where for o in items])
+        self.ints([bool(o.visible) for o in items], 'B')
+        self.plain([o.select_table_refs for o in items])
+        self.plain([o.where_table_refs for o in items])
+        if objects:
+            self.refs([o.format for o in items])
+            self.refs([o.lov_name for o in items])
+
+    def joins(self, joins):
+        self.ints([j.id_ for j in joins])
+        self.refs([j.expression for j in joins])
+        self.ints([j.term_count for j in joins])
+        self.ints([len(j.terms) for j in joins])
+        terms = [term for j in joins for term in j.terms]
+        self.refs([name for name, table_id in terms])
+        self.ints([table_id for name, table_id in terms])
+
+    def contexts(self, contexts):
+        self.ints([c.id_ for c in contexts])
+        self.refs([c.name for c in contexts])
+        self.refs([c.description for c in contexts])
+        self.ints([len(c.joins) for c in contexts])
+        self.ints([join_id for c in contexts for join_id in c.joins])
+
+    def links(self, links):
+        self.ints([l.id_ for l in links])
+        self.refs([l.name for l in links])
+        self.refs([l.description for l in links])
+        self.refs([l.linked_universe for l in links])
+
+    def hierarchies(self, hierarchies):
+        self.ints([h.id_ for h in hierarchies])
+        self.refs([h.name for h in hierarchies])
+        self.refs([h.description for h in hierarchies])
+        self.ints([len(h.levels) for h in hierarchies])
+        self.ints([level for h in hierarchies for level in h.levels])
+
+
+def _new(cls, fields):
+    """return an instance of cls with the attributes in fields, without
+    calling its constructor"""
+    o = cls.__new__(cls)
+    o.__dict__.update(fields)
+    return o
+
+
+class _Reader(object):
+
+    def __init__(self, data):
+        super(_Reader, self).__init__()
+        self.view = memoryview(data)
+        try:
+            magic, version = _HEADER.unpack_from(self.view, 0)
+        except struct.error:
+            raise SnapshotError('not a universe snapshot')
+        if magic != MAGIC:
+            raise SnapshotError('not a universe snapshot')
+        if version != FORMAT_VERSION:
+            raise SnapshotError('unsupported snapshot format version %d'
+                % version)
+        self.pos = _HEADER.size
+        lengths = self.ints()
+        strings = [None]
+        pos = self.pos
+        view = self.view
+        for length in lengths:
+            strings.append(str(view[pos:pos+length], 'utf-8',
+                'surrogatepass'))
+            pos += length
+        self.pos = pos
+        self.strings = strings
+
+    def u32(self):
+        v, = _U32.unpack_from(self.view, self.pos)
+        self.pos += 4
+        return v
+
+    def ints(self, typecode='I'):
+        count = self.u32()
+        a = array.array(typecode)
+        end = self.pos + count * a.itemsize
+        if end > len(self.view):
+            raise SnapshotError('truncated snapshot')
+        a.frombytes(self.view[self.pos:end])
+        if _SWAP:
+            a.byteswap()
+        self.pos = end
+        return a
+
+    def refs(self):
+        strings = self.strings
+        return [strings[i] for i in self.ints()]
+
+    def value(self):
+        view = self.view
+        tag = view[self.pos:self.pos+1].tobytes()
+        self.pos += 1
+        if tag == b'N':
+            return None
+        if tag == b'T':
+            return True
+        if tag == b'F':
+            return False
+        if tag == b'i':
+            v, = _I64.unpack_from(view, self.pos)
+            self.pos += 8
+            return v
+        if tag == b'f':
+            v, = _F64.unpack_from(view, self.pos)
+            self.pos += 8
+            return v
+        n = self.u32()
+        if tag == b's':
+            return self.strings[n]
+        if tag == b'b':
+            v = view[self.pos:self.pos+n].tobytes()
+            self.pos += n
+            return v
+        if tag == b'D':
+            return datetime.date.fromordinal(n)
+        if tag == b'I':
+            return int(self.strings[n])
+        if tag == b'M':
+            return datetime.datetime.fromisoformat(self.strings[n])
+        if tag == b'd':
+            value = self.value
+            d = {}
+            for i in range(n):
+                key = value()
+                d[key] = value()
+            return d
+        if tag in (b'l', b't', b'S', b'Z'):
+            value = self.value
+            items = [value() for i in range(n)]
+            if tag == b'l':
+                return items
+            return {b't': tuple, b'S': set, b'Z': frozenset}[tag](items)
+        raise SnapshotError('bad value tag %r at offset %d'
+            % (tag, self.pos - 5))
+
+    def plain(self):
+        tag = self.view[self.pos:self.pos+1].tobytes()
+        self.pos += 1
+        if tag == b'v':
+            return self.value()
+        if tag != b'm':
+            raise SnapshotError('bad block tag %r at offset %d'
+                % (tag, self.pos - 1))
+        n = self.u32()
+        try:
+            v = marshal.loads(self.view[self.pos:self.pos+n])
+        except (EOFError, ValueError, TypeError):
+            raise SnapshotError('bad marshal block at offset %d' % self.pos)
+        self.pos += n
+        return v
+
+    def universe(self):
+        u = Universe()
+        parameters = self.value()
+        if parameters is not None:
+            u.parameters = _new(Parameters, parameters)
+        self.tables(u)
+        self.columns(u)
+        self.classes(u)
+        self.joins(u)
+        self.contexts(u)
+        self.links(u)
+        self.hierarchies(u)
+        u.__dict__.update(self.plain())
+        return u
+
+    def tables(self, u):
+        ids = self.ints()
+        parent_ids = self.ints()
+        names = self.refs()
+        schemas = self.refs()
+        u.tables = [_new(Table, {'universe': u, 'id_': id_,
+            'parent_id': parent_id, 'name': name, 'schema': schema})
+            for id_, parent_id, name, schema
+            in zip(ids, parent_ids, names, schemas)]
+        keys = self.ints()
+        rows = self.ints()
+        u.table_map = dict((key, u.tables[row])
+            for key, row in zip(keys, rows))
+        table_ids = self.ints()
+        selects = self.refs()
+        u.virtual_tables = [_new(VirtualTable, {'universe': u,
+            'table_id': table_id, 'select': select})
+            for table_id, select in zip(table_ids, selects)]
+
+    def columns(self, u):
+        catalog = ColumnCatalog(u)
+        catalog.ids = self.ints()
+        catalog.table_ids = self.ints()
+        catalog.datatype_codes = self.ints('B')
+        catalog.names = self.refs()
+        catalog.metadata = self.plain()
+        catalog._columns = [None] * len(catalog.ids)
+        u.columns = catalog if catalog.ids else []
+
+    def classes(self, u):
+        ids = self.ints()
+        parents = self.ints()
+        names = self.refs()
+        descriptions = self.refs()
+        classes = []
+        roots = []
+        for id_, parent_row, name, description in zip(ids, parents, names,
+                descriptions):
+            parent = classes[parent_row - 1] if parent_row else None
+            c = _new(Class, {'universe': u, 'id_': id_, 'parent': parent,
+                'name': name, 'description': description, 'objects': [],
+                'conditions': [], 'subclasses': []})
+            classes.append(c)
+            if parent is None:
+                roots.append(c)
+            else:
+                parent.subclasses.append(c)
+        u.classes = roots
+
+        objects = self.items(u, Object, classes, 'objects')
+        self.items(u, Condition, classes, 'conditions')
+        keys = self.ints()
+        rows = self.ints()
+        u.object_map = dict((key, objects[row])
+            for key, row in zip(keys, rows))
+
+    def items(self, u, cls, classes, attribute):
+        """read objects or conditions and add them to their classes"""
+        class_rows = self.ints()
+        ids = self.ints()
+        names = self.refs()
+        descriptions = self.refs()
+        selects = self.refs()
+        wheres = self.refs()
+        visibles = self.ints('B')
+        select_refs = self.plain()
+        where_refs = self.plain()
+        columns = [ids, names, descriptions, selects, wheres, visibles,
+            select_refs, where_refs]
+        if cls is Object:
+            columns.append(self.refs())
+            columns.append(self.refs())
+        items = []
+        for row, fields in zip(class_rows, zip(*columns)):
+            parent = classes[row]
+            # in the order ObjectBase.__init__ sets them, with its empty
+            # SQL caches, so these objects share their dict keys with
+            # parsed ones
+            d = {'universe': u, 'id_': fields[0], 'parent': parent,
+                'name': fields[1], 'description': fields[2],
+                'select_table_refs': fields[6],
+                'where_table_refs': fields[7], 'select': fields[3],
+                'where': fields[4], 'visible': bool(fields[5]),
+                '_select_sql': None, '_where_sql': None,
+                '_select_references': None, '_where_references': None}
+            if cls is Object:
+                d['format'] = fields[8]
+                d['lov_name'] = fields[9]
+            o = _new(cls, d)
+            getattr(parent, attribute).append(o)
+            items.append(o)
+        return items
+
+    def joins(self, u):
+        ids = self.ints()
+        expressions = self.refs()
+        term_counts = self.ints()
+        lengths = self.ints()
+        term_names = self.refs()
+        term_tables = self.ints()
+        terms = list(zip(term_names, term_tables))
+        joins = []
+        start = 0
+        for id_, expression, term_count, length in zip(ids, expressions,
+                term_counts, lengths):
+            joins.append(_new(Join, {'universe': u, 'id_': id_,
+                'expression': expression, 'term_count': term_count,
+                'terms': terms[start:start+length]}))
+            start += length
+        u.joins = joins
+
+    def contexts(self, u):
+        ids = self.ints()
+        names = self.refs()
+        descriptions = self.refs()
+        lengths = self.ints()
+        joins = self.ints().tolist()
+        contexts = []
+        start = 0
+        for id_, name, description, length in zip(ids, names, descriptions,
+                lengths):
+            contexts.append(_new(Context, {'universe': u, 'id_': id_,
+                'name': name, 'description': description,
+                'joins': joins[start:start+length]}))
+            start += length
+        u.contexts = contexts
+
+    def links(self, u):
+        ids = self.ints()
+        names = self.refs()
+        descriptions = self.refs()
+        linked = self.refs()
+        u.links = [_new(Link, {'universe': u, 'id_': id_, 'name': name,
+            'description': description, 'linked_universe': linked_universe})
+            for id_, name, description, linked_universe
+            in zip(ids, names, descriptions, linked)]
+
+    def hierarchies(self, u):
+        ids = self.ints()
+        names = self.refs()
+        descriptions = self.refs()
+        lengths = self.ints()
+        levels = self.ints().tolist()
+        hierarchies = []
+        start = 0
+        for id_, name, description, length in zip(ids, names, descriptions,
+                lengths):
+            hierarchies.append(_new(Hierarchy, {'universe': u, 'id_': id_,
+                'name': name, 'description': description,
+                'levels': levels[start:start+length]}))
+            start += length
+        u.hierarchies = hierarchies
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+sqlscan.py
+
+Find what the SQL of an object, condition or join refers to.
+
+scan_sql() makes one pass over a SQL string, before or after expansion
+(see universe.ObjectBase.expand_sql), and returns SqlReferences:
+
+- table references, in the order they first appear: the id of each
+  table marker (\\x03 and the table id) and the name of each table named
+  in the text, as in Table.column, schema.Table.column, "My
+  Table".column or [My Table].column
+- object references: the id of each object marker (\\x02 and the id)
+- @functions such as @Select, @Prompt and @aggregate_aware, as written
+- string literals, without their quotes
+- the arguments of each @Prompt, as written
+- the alternatives of @aggregate_aware, each scanned on its own
+
+String literals and comments are skipped when looking for table names,
+so a dot inside 'a.b' or a comment isn't taken for a table reference.
+
+    >>> scan_sql("\\x037.Family_name IN @Prompt('Line?','A')").table_refs
+    (7,)
+
+Objects and conditions keep the SqlReferences of their select and where
+clauses (ObjectBase.select_references and where_references) until the
+SQL changes, so the reader's analyses scan each clause once however many
+of them look at it.
+"""
+
+import re
+import weakref
+
+
+# SQL keywords that can come before a dot without naming a table
+_KEYWORDS = frozenset(('SELECT', 'FROM', 'WHERE', 'AND', 'OR', 'NOT', 'IN',
+    'BETWEEN', 'LIKE', 'IS', 'NULL'))
+
+_IDENTIFIER = r'(?:"[^"\n]+"|\[[^\]\n]+\]|[A-Za-z_][A-Za-z0-9_$#]*)'
+
+_TOKEN = re.compile(r'''
+    (?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))
+  | '(?P<string>(?:[^']|'')*)(?:'|\Z)
+  | (?P<marker>[\x02\x03])(?P<id>[0-9]{1,4})
+  | @(?P<function>[A-Za-z_][A-Za-z0-9_]*)(?P<call>\s*\()?
+  | (?<![A-Za-z0-9_$#"\]])(?P<qualifier>(?:%s\s*\.\s*)+)(?=[A-Za-z_"\[*\x03])
+  | [A-Za-z0-9_$#]+
+''' % _IDENTIFIER, re.VERBOSE | re.DOTALL)
+
+_PART = re.compile(_IDENTIFIER)
+
+
+def _unquote(part):
+    if part[0] in '"[':
+        return part[1:-1]
+    return part
+
+
+def _arguments(sql, start):
+    """return the text from start to the parenthesis that closes the one
+    before it, skipping string literals (or to the end of sql)"""
+    depth = 1
+    i = start
+    n = len(sql)
+    while i < n:
+        c = sql[i]
+        if c == "'":
+            end = sql.find("'", i + 1)
+            while end != -1 and sql.startswith("''", end):
+                end = sql.find("'", end + 2)
+            if end == -1:
+                break
+            i = end
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if depth == 0:
+                return sql[start:i]
+        i += 1
+    return sql[start:]
+
+
+def _split_arguments(text):
+    """return the comma-separated arguments in text, ignoring commas in
+    parentheses and string literals"""
+    arguments = []
+    depth = 0
+    begin = i = 0
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c == "'":
+            end = text.find("'", i + 1)
+            while end != -1 and text.startswith("''", end):
+                end = text.find("'", end + 2)
+            if end == -1:
+                break
+            i = end
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            arguments.append(text[begin:i])
+            begin = i + 1
+        i += 1
+    arguments.append(text[begin:])
+    return arguments
+
+
+class SqlReferences(object):
+
+    """What one SQL string refers to (see scan_sql)
+
+    table_refs is a tuple of table ids (ints, from table markers) and
+    table names (strings) in the order they first appear, each once.
+    object_refs is a tuple of object ids, functions of the @functions,
+    literals of the string literals and prompts of the @Prompt
+    arguments, in the order they appear. aggregate_alternatives has the
+    SqlReferences of each alternative of the first @aggregate_aware, in
+    order (only one of them is used in a query). Tuples keep the
+    profiles that every object carries small.
+    """
+
+    def __init__(self, table_refs=(), object_refs=(), functions=(),
+            literals=(), prompts=(), aggregate_alternatives=()):
+        super(SqlReferences, self).__init__()
+        self.table_refs = tuple(table_refs)
+        self.object_refs = tuple(object_refs)
+        self.functions = tuple(functions)
+        self.literals = tuple(literals)
+        self.prompts = tuple(prompts)
+        self.aggregate_alternatives = tuple(aggregate_alternatives)
+        # (weakref to the universe, sql_generation, names) of the last
+        # table_names
+        self._names = None
+
+    def table_names(self, universe):
+        """return the names of the tables referred to, resolving table ids
+        with universe.table_map, each once
+
+        The tuple is kept until the universe's SQL is invalidated (see
+        Universe.invalidate_sql), so the analyses share it. Nothing is
+        kept for SQL without table references: that SqlReferences can be
+        shared by every universe.
+        """
+        if not self.table_refs:
+            return ()
+        cached = self._names
+        if cached is not None and cached[0]() is universe and \
+                cached[1] == universe.sql_generation:
+            return cached[2]
+        names = []
+        for ref in self.table_refs:
+            if not isinstance(ref, str):
+                table = universe.table_map.get(ref)
+                ref = table.name if table else 'UnknownTable_%d' % ref
+            if ref not in names:
+                names.append(ref)
+        names = tuple(names)
+        self._names = (weakref.ref(universe), universe.sql_generation,
+            names)
+        return names
+
+    def __repr__(self):
+        return 'SqlReferences(tables=%r, objects=%r, functions=%r)' % (
+            self.table_refs, self.object_refs, self.functions)
+
+
+# what None or '' refers to, shared by all the clauses without SQL
+_NO_REFERENCES = SqlReferences()
+
+
+def scan_sql(sql):
+    """return the SqlReferences of sql (None or '' has none)"""
+    if not sql:
+        return _NO_REFERENCES
+    tables = []
+    objects = []
+    functions = []
+    literals = []
+    prompts = []
+    alternatives = ()
+    seen = set()
+    for match in _TOKEN.finditer(sql):
+        kind = match.lastgroup
+        if kind == 'qualifier' or kind == 'id':
+            if kind == 'id':
+                ref = int(match.group('id'))
+                if match.group('marker') == '\x02':
+                    objects.append(ref)
+                    continue
+            else:
+                parts = [_unquote(p)
+                    for p in _PART.findall(match.group('qualifier'))]
+                ref = '.'.join(parts)
+                if len(parts) == 1 and ref.upper() in _KEYWORDS:
+                    continue
+            if ref not in seen:
+                seen.add(ref)
+                tables.append(ref)
+        elif kind == 'string':
+            literals.append(match.group('string').replace("''", "'"))
+        elif kind == 'function' or kind == 'call':
+            name = match.group('function')
+            functions.append(name)
+            if match.group('call') and name.lower() == 'prompt':
+                prompts.append(_arguments(sql, match.end()))
+            elif match.group('call') and not alternatives and \
+                    name.lower() == 'aggregate_aware':
+                alternatives = [scan_sql(argument) for argument
+                    in _split_arguments(_arguments(sql, match.end()))]
+    return SqlReferences(tables, objects, functions, literals, prompts,
+        alternatives)
@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+synthetic.py
+
+Write synthetic universe files of any size.
+
+generate() builds a universe file from the record layouts the reader
+decodes (see records.py and the docstrings of Reader.read_table,
+read_virtualtable, read_column, read_class, read_object, read_condition,
+read_join, read_context, read_link and read_hierarchy): parameters,
+tables with their aliases and derived tables, columns, joins, contexts,
+links, hierarchies, and nested classes of objects and conditions. The
+file has no archive members, so it carries no UNW_Storage or
+ResourceHeader data. The names and SQL are made up but consistent:
+
+- the tables are numbered 1..tables, followed by the derived tables and
+  then the aliases; each alias is an alias of one of the tables
+- every table, alias and derived table has columns_per_table columns
+  col_0, col_1, ...
+- every join links col_0 of two tables, chaining through all of them
+- every object selects a column of one of the tables, and every fourth
+  object also has a where clause; table references in object and
+  condition SQL are encoded the way Designer stores them (\\x03 and the
+  table id), so select_sql and where_sql show table names
+- classes are nested in chains depth classes deep
+
+    data = generate(tables=500, aliases=50, classes=100, depth=3)
+    universe = Reader(data).universe
+
+scaled(n) returns the generate() arguments for a universe n times the
+size of a small reference universe, for benchmarks. The module can also
+be run to write a universe file:
+
+    python -m pyunv.synthetic --scale 100 big.unv
+"""
+
+import getopt
+import struct
+import sys
+
+from pyunv import records
+
+
+_STRING_LENGTH = struct.Struct('<H')
+
+# date index of 2009-09-07 (see Reader.date_from_dateindex)
+_DATE_INDEX = 2442964 + 12118
+
+# ObjectBase.expand_sql only recognises table ids of up to four digits
+MAX_TABLE_ID = 9999
+
+# the size of a small universe; scaled() multiplies the counts
+REFERENCE = {
+    'tables': 7,
+    'aliases': 1,
+    'derived_tables': 1,
+    'columns_per_table': 6,
+    'classes': 2,
+    'depth': 2,
+    'objects_per_class': 20,
+    'conditions_per_class': 2,
+    'joins': 10,
+    'contexts': 2,
+    'links': 0,
+    'hierarchies': 1,
+}
+
+# the counts scaled() multiplies
+_SCALED = ('tables', 'aliases', 'derived_tables', 'classes', 'joins',
+    'contexts', 'hierarchies')
+
+
+def scaled(scale):
+    """return generate() arguments for a universe scale times the size of
+    REFERENCE (columns per table, objects per class and the nesting depth
+    stay the same)"""
+    arguments = dict(REFERENCE)
+    for name in _SCALED:
+        arguments[name] = REFERENCE[name] * scale
+    arguments['name'] = 'Synthetic x%d' % scale
+    return arguments
+
+
+class UniverseWriter(object):
+
+    """Append universe fields to a growing buffer"""
+
+    def __init__(self):
+        super(UniverseWriter, self).__init__()
+        self.out = bytearray()
+
+    def pack(self, s, *values):
+        self.out += s.pack(*values)
+
+    def string(self, s):
+        """write a length-prefixed string (None is written as empty)"""
+        data = s.encode('utf-8') if s else b''
+        self.out += _STRING_LENGTH.pack(len(data)) + data
+
+    def ids(self, values):
+        self.out += records.id_array(len(values)).pack(*values)
+
+    def marker(self, name):
+        """start the section name"""
+        self.out += b'\x00' + name.encode('utf-8')
+
+    def getvalue(self):
+        return bytes(self.out)
+
+
+def _column_name(i):
+    return 'col_%d' % i
+
+
+def _table_ref(table_id):
+    """return a table reference as Designer stores it in object SQL"""
+    return '\x03%d' % table_id
+
+
+def generate(tables=8, aliases=0, derived_tables=0, columns_per_table=6,
+        classes=2, depth=1, objects_per_class=20, conditions_per_class=2,
+        joins=10, contexts=2, links=0, hierarchies=0, name='Synthetic'):
+    """return the contents of a synthetic universe file"""
+    all_tables = tables + derived_tables + aliases
+    if all_tables > MAX_TABLE_ID:
+        raise ValueError('at most %d tables, aliases and derived tables '
+            '(got %d)' % (MAX_TABLE_ID, all_tables))
+    if aliases and not tables:
+        raise ValueError('aliases need at least one table')
+    if depth < 1:
+        raise ValueError('depth must be at least 1 (got %d)' % depth)
+
+    # (id, name, parent id) of every table, in the order they are written
+    table_rows = [(i, 'Table_%d' % i, 0) for i in range(1, tables + 1)]
+    for i in range(1, derived_tables + 1):
+        table_rows.append((tables + i, 'Derived_%d' % i, 0))
+    for i in range(1, aliases + 1):
+        table_rows.append((tables + derived_tables + i, 'Alias_%d' % i,
+            (i - 1) % tables + 1))
+    table_ids = [row[0] for row in table_rows]
+    table_names = dict((row[0], row[1]) for row in table_rows)
+
+    w = UniverseWriter()
+    # a leading block that isn't part of any section, like the header of
+    # a real universe file
+    w.out += b'\x00' * 16
+
+    w.marker('Parameters;')
+    _write_parameters(w, name)
+    w.marker('Parameters_6_0;')
+    w.pack(records.COUNT.count, 1)
+    w.string('GENERATOR')
+    w.string('pyunv.synthetic')
+
+    w.marker('Tables;')
+    w.pack(records.TABLES.header)
+    w.string('')
+    w.string('dbo')
+    w.pack(records.TABLES.counts, all_tables, all_tables)
+    for table_id, table_name, parent_id in table_rows:
+        w.pack(records.TABLE.head, table_id)
+        w.string(table_name)
+        w.pack(records.TABLE.tail, parent_id, False)
+        w.pack(records.TABLE.pad)
+
+    w.marker('Virtual Tables;')
+    w.pack(records.COUNT.count, derived_tables)
+    for i in range(derived_tables):
+        source = table_names[i % tables + 1] if tables else 'dual'
+        w.pack(records.VIRTUAL_TABLE.head, tables + i + 1)
+        w.string('SELECT %s FROM %s' % (', '.join(_column_name(k)
+            for k in range(columns_per_table)) or '*', source))
+
+    column_count = all_tables * columns_per_table
+    w.marker('Columns Id;')
+    w.pack(records.COLUMNS.counts, column_count, column_count)
+    column_id = 0
+    for table_id in table_ids:
+        for i in range(columns_per_table):
+            column_id += 1
+            w.pack(records.COLUMN.head, column_id, table_id)
+            w.string(_column_name(i))
+
+    w.marker('Columns;')
+    for table_id in table_ids:
+        w.pack(records.COUNT.count, columns_per_table)
+        for i in range(columns_per_table):
+            w.string(_column_name(i))
+            # numeric for the key column, character for the rest
+            w.pack(records.COLUMN_ATTRIBUTES.tail, 2 if i == 0 else 3,
+                b'\x01' + b'\x00' * 9)
+
+    join_ids = list(range(1, joins + 1))
+    w.marker('Joins;')
+    w.pack(records.JOINS.header, joins)
+    for join_id in join_ids:
+        left = table_ids[(join_id - 1) % all_tables] if all_tables else 0
+        right = table_ids[join_id % all_tables] if all_tables else 0
+        w.pack(records.JOIN.head, join_id)
+        w.string('=')
+        w.pack(records.JOIN.term_count, 2)
+        w.string(_column_name(0))
+        w.pack(records.JOIN.term, left)
+        w.string(_column_name(0))
+        w.pack(records.JOIN.term, right)
+    w.pack(records.JOINS.trailer)
+
+    w.marker('Contexts;')
+    w.pack(records.ID_COUNT.counts, contexts, contexts)
+    for i in range(contexts):
+        context_id = i + 1
+        members = join_ids[i::contexts]
+        w.string('Context %d' % context_id)
+        w.pack(records.CONTEXT.id_, context_id)
+        w.string('Joins %d to %d' % (members[0], members[-1])
+            if members else None)
+        w.pack(records.CONTEXT.join_count, len(members))
+        w.ids(members)
+
+    if links:
+        w.marker('Links;')
+        w.pack(records.ID_COUNT.counts, links, links)
+        for i in range(1, links + 1):
+            w.string('Link %d' % i)
+            w.pack(records.LINK.id_, i)
+            w.string('Synthetic link %d' % i)
+            w.string('Linked_%d.unv' % i)
+
+    if hierarchies:
+        # each hierarchy drills through the first objects of a class
+        levels = min(3, objects_per_class)
+        w.marker('Hierarchies;')
+        w.pack(records.ID_COUNT.counts, hierarchies, hierarchies)
+        for i in range(hierarchies):
+            first = (i % classes) * objects_per_class + 1 if classes else 1
+            w.string('Hierarchy %d' % (i + 1))
+            w.pack(records.HIERARCHY.id_, i + 1)
+            w.string('Synthetic hierarchy %d' % (i + 1))
+            w.pack(records.HIERARCHY.level_count, levels if classes else 0)
+            w.ids(list(range(first, first + levels)) if classes else [])
+
+    w.marker('Objects;')
+    roots = (classes + depth - 1) // depth
+    w.pack(records.CLASSES.counts, classes, classes * objects_per_class,
+        classes * conditions_per_class, roots)
+    # classes are numbered in the order they are written: each root class
+    # is followed by its chain of subclasses
+    next_object = [classes * objects_per_class]
+    for root in range(roots):
+        first = root * depth
+        _write_class(w, range(first, min(first + depth, classes)), 0,
+            table_ids, columns_per_table, objects_per_class,
+            conditions_per_class, next_object)
+    return w.getvalue()
+
+
+def _write_parameters(w, name):
+    p = records.PARAMETERS
+    w.pack(p.header)
+    w.string(name.replace(' ', '_') + '.unv')
+    w.string(name)
+    w.pack(p.revision, 1)
+    w.string('Synthetic universe written by pyunv')
+    w.string('pyunv')
+    w.string('pyunv')
+    w.pack(p.dates, _DATE_INDEX, _DATE_INDEX, 600, 10000)
+    w.string(None)
+    w.string('(Built-in) Standard Renaming')
+    w.pack(p.limits, 300, 1000)
+    w.string(None)
+    w.pack(p.comments_tail)
+    w.string('Synthetic')
+    w.string('Generic ODBC datasource')
+    w.string('ODBC')
+
+
+def _write_class(w, chain, parent_id, table_ids, columns_per_table,
+        objects_per_class, conditions_per_class, next_object):
+    """write the first class of chain with the rest as its subclasses
+
+    Objects are numbered by class (objects_per_class ids per class), so a
+    class's objects keep their ids whatever the nesting; conditions are
+    numbered after all the objects, in the order they are written.
+    """
+    index, rest = chain[0], chain[1:]
+    class_id = 100000 + index + 1
+    w.pack(records.CLASS.head, class_id)
+    w.string('Class %d' % (index + 1))
+    w.pack(records.CLASS.parent, parent_id)
+    w.string('Synthetic class %d' % (index + 1))
+    w.pack(records.CLASS.object_count, objects_per_class)
+    for j in range(objects_per_class):
+        object_id = index * objects_per_class + j + 1
+        table_id = table_ids[object_id % len(table_ids)] if table_ids else 0
+        column = _column_name(j % columns_per_table) \
+            if columns_per_table else 'x'
+        where = None
+        if j % 4 == 3:
+            where = '%s.%s IS NOT NULL' % (_table_ref(table_id),
+                _column_name(0))
+        _write_object(w, object_id, class_id, table_id, column, where)
+    w.pack(records.COUNT.count, conditions_per_class)
+    for j in range(conditions_per_class):
+        next_object[0] += 1
+        object_id = next_object[0]
+        table_id = table_ids[object_id % len(table_ids)] if table_ids else 0
+        _write_condition(w, object_id, class_id, table_id)
+    w.pack(records.COUNT.count, 1 if rest else 0)
+    if rest:
+        _write_class(w, rest, class_id, table_ids, columns_per_table,
+            objects_per_class, conditions_per_class, next_object)
+
+
+def _write_object(w, object_id, class_id, table_id, column, where):
+    layout = records.OBJECT
+    w.pack(layout.head, object_id)
+    w.string('Object %d' % object_id)
+    w.pack(layout.parent, class_id)
+    w.string('Synthetic object %d' % object_id)
+    w.pack(layout.table_count, 1)
+    w.ids([table_id])
+    w.pack(layout.table_count, 1 if where else 0)
+    if where:
+        w.ids([table_id])
+    w.string('%s.%s' % (_table_ref(table_id), column))
+    w.string(where)
+    w.string(None)
+    w.string(None)
+    w.string(None)
+    w.pack(layout.tail, 0x36)
+
+
+def _write_condition(w, object_id, class_id, table_id):
+    layout = records.CONDITION
+    w.pack(layout.head, object_id)
+    w.string('Condition %d' % object_id)
+    w.pack(layout.parent, class_id)
+    w.string('Synthetic condition %d' % object_id)
+    w.pack(layout.table_count, 1)
+    w.ids([table_id])
+    w.pack(layout.table_count, 0)
+    w.string('%s.%s > 0' % (_table_ref(table_id), _column_name(0)))
+
+
+def write(path, **arguments):
+    """write a synthetic universe (see generate) to path"""
+    with open(path, 'wb') as f:
+        f.write(generate(**arguments))
+
+
+help_message = '''
+Write a synthetic universe file.
+
+python -m pyunv.synthetic [options] FILE
+
+    -s  --scale      start from the reference universe times SCALE
+                     (default: the generate() defaults)
+    -n  --name       universe name
+        --tables  --aliases  --derived-tables  --columns-per-table
+        --classes  --depth  --objects-per-class  --conditions-per-class
+        --joins  --contexts  --links  --hierarchies
+                     set one count (after --scale)
+    -h  --help       show this help
+'''
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    counts = ('tables', 'aliases', 'derived_tables', 'columns_per_table',
+        'classes', 'depth', 'objects_per_class', 'conditions_per_class',
+        'joins', 'contexts', 'links', 'hierarchies')
+    try:
+        opts, args = getopt.getopt(argv[1:], 'hs:n:', ['help', 'scale=',
+            'name='] + [c.replace('_', '-') + '=' for c in counts])
+        arguments = {}
+        overrides = {}
+        for option, value in opts:
+            if option in ('-h', '--help'):
+                print(help_message)
+                return 0
+            if option in ('-s', '--scale'):
+                arguments = scaled(int(value))
+            elif option in ('-n', '--name'):
+                overrides['name'] = value
+            elif option.startswith('--') and \
+                    option[2:].replace('-', '_') in counts:
+                overrides[option[2:].replace('-', '_')] = int(value)
+        if len(args) != 1:
+            raise getopt.error('expected one output file')
+        arguments.update(overrides)
+        write(args[0], **arguments)
+    except (getopt.error, ValueError) as error:
+        print('synthetic: %s' % error, file=sys.stderr)
+        print(help_message, file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
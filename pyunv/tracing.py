@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+tracing.py
+
+Hooks for following what a Reader does.
+
+A Reader given a tracer calls tracer.start(name, kind) and
+tracer.end(name, kind, error) around each phase of its work (the same
+phases as profiling.ParseProfile), and tracer.event(name, fields) for
+the details it finds along the way: each derived table, each @Prompt in
+an object or condition, the UNW_Storage connection, the enhanced
+analysis counts and the problems it works around. Without a tracer the
+reader makes none of these calls, and skips the scans that only exist
+to report them.
+
+    class Spans(Tracer):
+        def start(self, name, kind):
+            self.started = time.perf_counter()
+        def end(self, name, kind, error=None):
+            log.info('%s took %.3fs', name, time.perf_counter() - self.started)
+
+    universe = Reader('sample.unv', tracer=Spans()).universe
+
+PrintTracer writes the events as the text lines earlier versions of the
+reader printed.
+"""
+
+import sys
+
+
+class Tracer(object):
+
+    """Base class for reader tracers; every hook does nothing
+
+    start and end bracket a phase. kind is 'index', 'archive', 'section'
+    or 'analysis'. Phases nest: a phase that runs inside another starts
+    after it and ends before it. end gets the exception that ended the
+    phase, or None. event reports something found inside the current
+    phase; fields is a dictionary that depends on the event name.
+    """
+
+    def start(self, name, kind):
+        pass
+
+    def end(self, name, kind, error=None):
+        pass
+
+    def event(self, name, fields):
+        pass
+
+
+class PrintTracer(Tracer):
+
+    """Write reader events to a file as text lines"""
+
+    def __init__(self, file=None):
+        super(PrintTracer, self).__init__()
+        self.file = file
+
+    def write(self, line):
+        print(line, file=self.file or sys.stdout)
+
+    def start(self, name, kind):
+        if name == 'extractPromptsInfo':
+            self.write('Extracting Prompts Information:')
+
+    def event(self, name, fields):
+        if name == 'prompt':
+            self.write('%s: %s | Prompt: %s' % (fields['kind'].title(),
+                fields['name'], fields['prompt']))
+        elif name == 'derived_table':
+            self.write('Table: %s | ID: %s | SQL: %s' % (fields['table'],
+                fields['table_id'], fields['sql'] or '<no virtual table>'))
+        elif name == 'enhanced_analysis':
+            for key, value in sorted(fields.items()):
+                self.write('DEBUG: %s: %d' % (key, value))
+        elif name == 'warning':
+            self.write('DEBUG: %s' % fields['message'])
+        else:
+            self.write('%s: %r' % (name, fields))
+
+
+class MultiTracer(Tracer):
+
+    """Pass every call on to several tracers"""
+
+    def __init__(self, tracers):
+        super(MultiTracer, self).__init__()
+        self.tracers = list(tracers)
+
+    def start(self, name, kind):
+        for tracer in self.tracers:
+            tracer.start(name, kind)
+
+    def end(self, name, kind, error=None):
+        for tracer in reversed(self.tracers):
+            tracer.end(name, kind, error)
+
+    def event(self, name, fields):
+        for tracer in self.tracers:
+            tracer.event(name, fields)
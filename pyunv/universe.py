@@ -9,15 +9,39 @@ Copyright (c) 2009 David Peckham. All rights reserved.
 Enhanced by Sanjay Sharma (indoos@gmail.com) 2025-10-17.
 """
 
+import array
+import collections
+import collections.abc
 import os
 import re
 import sys
-import collections
+
+from pyunv.joingraph import JoinGraph
+from pyunv.sqlscan import scan_sql
+
 __version__ = "0.3.0"
 
+# replacing one of these Universe attributes clears its indexes
+_INDEXED_ATTRIBUTES = frozenset(('tables', 'classes', 'contexts', 'joins',
+    'table_map', 'object_map'))
+
+# a table (\x03) or object (\x02) reference in object SQL, followed by
+# the table or object id
+_SQL_REFERENCE = re.compile('([\x02\x03])([0-9]{1,4})')
+
+
+def _first_by_id(items):
+    index = {}
+    for item in items:
+        index.setdefault(item.id_, item)
+    return index
+
 
 class Universe(object):
 
+    # bumped by invalidate_sql
+    sql_generation = 0
+
     def __init__(self, id_=None, name=None, description=None):
         super(Universe, self).__init__()
         self.pyunv_version = __version__
@@ -110,16 +134,173 @@ class Universe(object):
         self.stored_procedure_parameters = {}  # {procedure_name: [{name, type, value}, ...]}
         self.table_map = {}
         self.object_map = {}
+        # profiling.ParseProfile of the Reader run, when it was profiled
+        self.parse_profile = None
+        self._loaders = {}
+        self._defaults = {}
+
+    def __setattr__(self, name, value):
+        if name in ('table_map', 'object_map'):
+            self.invalidate_sql()
+        if name in _INDEXED_ATTRIBUTES:
+            self.__dict__.get('_indexes', {}).clear()
+        object.__setattr__(self, name, value)
+
+    def invalidate_sql(self):
+        """Forget the expanded SQL of every object and condition
+
+        Objects cache select_sql and where_sql until their SQL changes or
+        table_map or object_map is replaced or rebuilt. Call this after
+        renaming a table, class or object, or changing a map in place.
+        """
+        self.__dict__['sql_generation'] = self.sql_generation + 1
+
+    def reindex(self):
+        """Forget the name and id indexes and the expanded SQL
+
+        The indexes (table_name_map, object_name_map, class_path_map,
+        context_map and join_map) are built on first use and kept until
+        tables, classes, contexts, joins, table_map or object_map is
+        replaced. Call this after adding, removing or renaming any of
+        them in place.
+        """
+        self.__dict__.get('_indexes', {}).clear()
+        self.invalidate_sql()
+
+    def _index(self, name, build):
+        """return the index name, calling build to make it if needed"""
+        indexes = self.__dict__.get('_indexes')
+        if indexes is None:
+            indexes = self.__dict__['_indexes'] = {}
+        index = indexes.get(name)
+        if index is None:
+            # build can load a lazy section, which clears indexes
+            index = build()
+            indexes[name] = index
+        return index
+
+    @property
+    def table_name_map(self):
+        """{name: table} for every table and alias, also keyed by
+        schema.name; the first table with a name wins"""
+        def build():
+            index = {}
+            for t in self.tables:
+                index.setdefault(t.name, t)
+                if t.schema and t.name:
+                    index.setdefault('%s.%s' % (t.schema, t.name), t)
+            return index
+        return self._index('table_name_map', build)
+
+    @property
+    def object_name_map(self):
+        """{class.object: object} for every object (see
+        ObjectBase.fullname); the first object with a name wins"""
+        def build():
+            index = {}
+            for o in self.object_map.values():
+                index.setdefault(o.fullname, o)
+            return index
+        return self._index('object_name_map', build)
+
+    @property
+    def all_objects(self):
+        """every object of every class, each class's objects before those
+        of its subclasses (a shared list; don't change it)"""
+        def build():
+            objects = []
+            pending = list(reversed(self.classes))
+            while pending:
+                c = pending.pop()
+                objects.extend(c.objects)
+                pending.extend(reversed(c.subclasses))
+            return objects
+        return self._index('all_objects', build)
+
+    @property
+    def class_path_map(self):
+        """{path: class} for every class, where the path is the class
+        names from the root class down joined by backslashes"""
+        def build():
+            index = {}
+            pending = [(c.name, c) for c in reversed(self.classes)]
+            while pending:
+                path, c = pending.pop()
+                index.setdefault(path, c)
+                pending.extend(('%s\\%s' % (path, s.name), s)
+                    for s in reversed(c.subclasses))
+            return index
+        return self._index('class_path_map', build)
+
+    @property
+    def context_map(self):
+        """{id: context} for every context; the first context with an id
+        wins"""
+        return self._index('context_map',
+            lambda: _first_by_id(self.contexts))
+
+    @property
+    def join_map(self):
+        """{id: join} for every join; the first join with an id wins"""
+        return self._index('join_map', lambda: _first_by_id(self.joins))
+
+    @property
+    def join_graph(self):
+        """the joingraph.JoinGraph of the tables, joins and contexts,
+        which memoizes the join paths it finds"""
+        return self._index('join_graph', lambda: JoinGraph(self))
+
+    def defer(self, names, loader):
+        """Load the attributes in names on first access
+
+        The attributes are removed until one of them is accessed. Then
+        loader is called once. Attributes the loader doesn't set keep the
+        value they had before they were deferred.
+        """
+        for name in names:
+            self._defaults[name] = self.__dict__.pop(name, None)
+            self._loaders[name] = loader
+
+    def __getattr__(self, name):
+        loaders = self.__dict__.get('_loaders')
+        if loaders and name in loaders:
+            loader = loaders[name]
+            keys = [k for k, l in loaders.items() if l is loader]
+            for key in keys:
+                del loaders[key]
+            try:
+                loader()
+            except BaseException:
+                # keep the attributes pending, so the next access raises
+                # the same error instead of a missing attribute
+                for key in keys:
+                    self.__dict__.pop(key, None)
+                    loaders[key] = loader
+                raise
+            for key in keys:
+                default = self._defaults.pop(key)
+                if key not in self.__dict__:
+                    self.__dict__[key] = default
+            return self.__dict__[name]
+        raise AttributeError("'%s' object has no attribute '%s'" % (
+            type(self).__name__, name))
+
+    @property
+    def pending(self):
+        """the names of the attributes that haven't been loaded yet"""
+        return sorted(self._loaders)
 
     def build_table_map(self):
         """Construct a table map so we can expand where and select clauses"""
         for t in self.tables:
             self.table_map[t.id_] = t
+        self.reindex()
 
     def build_object_map(self):
         """Construct an object map so we can expand where and select clauses"""
         for c in self.classes:
             self._map_objects(c)
+        self.reindex()
     
     def _map_objects(self, c):
         for o in c.objects:
@@ -299,6 +480,14 @@ class ObjectBase(object):
         self.select = None
         self.where = None
         self.visible = True
+        # (sql, sql_generation, expanded sql) caches of select_sql and
+        # where_sql; set here so instances keep sharing their dict keys
+        self._select_sql = None
+        self._where_sql = None
+        # (sql, sqlscan.SqlReferences) caches of select_references and
+        # where_references
+        self._select_references = None
+        self._where_references = None
     
     @property
     def fullname(self):
@@ -307,39 +496,84 @@ class ObjectBase(object):
         else:
             return self.name
     
-    def lookup_table(self, match):
-        table_id = int(match.groups()[0])
+    def table_name(self, table_id):
         table = self.universe.table_map.get(table_id)
         if table:
             return table.name
         else:
             return f"UnknownTable_{table_id}"
-    
-    def lookup_object(self, match):
-        object_id = int(match.groups()[0])
+
+    def object_name(self, object_id):
         obj = self.universe.object_map.get(object_id)
         if obj:
             return obj.fullname
         else:
             return f"UnknownObject_{object_id}"
-    
+
+    def lookup_table(self, match):
+        return self.table_name(int(match.groups()[-1]))
+
+    def lookup_object(self, match):
+        return self.object_name(int(match.groups()[-1]))
+
+    def _lookup_reference(self, match):
+        kind, id_ = match.groups()
+        if kind == '\x03':
+            return self.table_name(int(id_))
+        return self.object_name(int(id_))
+
     def expand_sql(self, sql):
         """Return the SQL with table names instead of table IDs"""
         if sql:
-            p = re.compile(r'(?:'+chr(3)+')([0-9]{1,4})')
-            expanded_sql = p.sub(self.lookup_table, sql)
-            p = re.compile(r'(?:'+chr(2)+')([0-9]{1,4})')
-            return p.sub(self.lookup_object, expanded_sql)
+            if '\x03' not in sql and '\x02' not in sql:
+                return sql
+            return _SQL_REFERENCE.sub(self._lookup_reference, sql)
         else:
             return None
-    
+
+    def _expanded(self, name, sql):
+        """return sql expanded, from the cache slot name if it was
+        expanded from the same SQL since the universe's maps last
+        changed"""
+        cached = self.__dict__.get(name)
+        if cached is not None and cached[0] is sql and \
+                cached[1] == self.universe.sql_generation:
+            return cached[2]
+        expanded = self.expand_sql(sql)
+        # read the generation afterwards: expanding can load the maps of
+        # a lazy universe
+        self.__dict__[name] = (sql, self.universe.sql_generation, expanded)
+        return expanded
+
+    def _references(self, name, sql):
+        """return the SqlReferences of sql, from the cache slot name if
+        they were scanned from the same SQL"""
+        cached = self.__dict__.get(name)
+        if cached is not None and cached[0] is sql:
+            return cached[1]
+        references = scan_sql(sql)
+        self.__dict__[name] = (sql, references)
+        return references
+
+    @property
+    def select_references(self):
+        """the tables, objects, functions, literals and prompts the
+        select clause refers to (see sqlscan.scan_sql)"""
+        return self._references('_select_references', self.select)
+
+    @property
+    def where_references(self):
+        """the tables, objects, functions, literals and prompts the
+        where clause refers to (see sqlscan.scan_sql)"""
+        return self._references('_where_references', self.where)
+
     @property
     def select_sql(self):
-        return self.expand_sql(self.select)
+        return self._expanded('_select_sql', self.select)
     
     @property
     def where_sql(self):
-        return self.expand_sql(self.where)
+        return self._expanded('_where_sql', self.where)
     
     def __str__(self):
         return '%s id=%d, name=%s, select=%s' % (type(self),
@@ -455,6 +689,123 @@ class Column(object):
             self.id_, self.name, self.parent)
 
 
+# datatype codes in the Columns; section
+COLUMN_DATATYPES = {
+    0x01: 'Unknown',
+    0x02: 'Numeric',
+    0x03: 'String',
+    0x04: 'Date',
+    0x05: 'Boolean',
+    0x06: 'Long'
+}
+
+
+class ColumnCatalog(collections.abc.Sequence):
+
+    """The source database columns of a universe, stored column-wise
+
+    ids, table_ids and datatype_codes (0 until the Columns; section sets
+    it) are parallel arrays, and names and metadata are parallel lists. Column
+    objects are created the first time a row is accessed and cached, so
+    the catalog behaves like a list of Columns sorted by id.
+    """
+
+    def __init__(self, universe=None):
+        super(ColumnCatalog, self).__init__()
+        self.universe = universe
+        self.ids = array.array('I')
+        self.table_ids = array.array('I')
+        self.datatype_codes = array.array('B')
+        self.names = []
+        self.metadata = []
+        self._columns = []
+        self._index = None
+
+    def append(self, id_, table_id, name):
+        """add a column row"""
+        self.ids.append(id_)
+        self.table_ids.append(table_id)
+        self.datatype_codes.append(0)
+        self.names.append(name)
+        self.metadata.append(None)
+        self._columns.append(None)
+        self._index = None
+
+    def sort(self):
+        """sort the rows by column id (rows with equal ids keep their
+        order)"""
+        ids = self.ids
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+        for name in ('ids', 'table_ids', 'datatype_codes'):
+            column = getattr(self, name)
+            setattr(self, name, array.array(column.typecode,
+                [column[i] for i in order]))
+        self.names = [self.names[i] for i in order]
+        self.metadata = [self.metadata[i] for i in order]
+        self._columns = [self._columns[i] for i in order]
+        self._index = None
+
+    def find(self, table_id, name):
+        """return the row of the column named name in table table_id, or
+        None. If a table has two columns with the same name, the one with
+        the higher row wins."""
+        if self._index is None:
+            self._index = dict(((table_id, name), row) for row, (table_id,
+                name) in enumerate(zip(self.table_ids, self.names)))
+        return self._index.get((table_id, name))
+
+    def set_attributes(self, row, datatype_code, metadata):
+        """record the datatype code and metadata of a column row"""
+        self.datatype_codes[row] = datatype_code
+        self.metadata[row] = metadata
+        column = self._columns[row]
+        if column is not None:
+            column.datatype = self.datatype(row)
+            column.metadata = metadata
+
+    def datatype(self, row):
+        """return the datatype name of a column row, or None if it isn't
+        known"""
+        code = self.datatype_codes[row]
+        if not code and self.metadata[row] is None:
+            return None
+        return COLUMN_DATATYPES.get(code, 'Unknown_%02x' % code)
+
+    def column(self, row):
+        """return the Column for a row, creating it on first access"""
+        column = self._columns[row]
+        if column is None:
+            parent = None
+            if self.universe is not None:
+                parent = self.universe.table_map.get(self.table_ids[row])
+            column = Column(self.ids[row], self.names[row], parent,
+                self.universe, self.datatype(row))
+            if self.metadata[row] is not None:
+                column.metadata = self.metadata[row]
+            self._columns[row] = column
+        return column
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.column(row)
+                for row in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('column index out of range')
+        return self.column(index)
+
+    def __eq__(self, other):
+        if isinstance(other, (ColumnCatalog, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+
 class ClassVisitor(object):
     
     """Visits each node in the class, object, and condition hierarchy"""
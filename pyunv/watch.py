@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+watch.py
+
+Re-document universes as they change.
+
+Watcher keeps the universes named by a list of files, directories and
+glob patterns parsed in memory. Each poll compares the modification time
+and size of every universe file with the last poll and re-parses only
+the files that changed, rewriting only their outputs. When the manifest
+template changes, the manifests are rendered again from the universes in
+memory without re-parsing anything.
+
+Polling works everywhere. If the inotify_simple package is installed
+(Linux only), the watcher sleeps until something in the watched
+directories changes instead of waking up every interval. It still wakes
+up every interval while a directory it should watch can't be (such as
+the base of a glob pattern that doesn't exist yet).
+
+    watcher = Watcher(['universes/'], outputs=('manifest', 'csv'))
+    watcher.run()
+"""
+
+import glob
+import os
+import time
+import traceback
+
+from pyunv.reader import Reader
+from pyunv.manifest import Manifest
+from pyunv.batch import OUTPUTS, find_universes, output_paths, write_output
+
+
+def _stamp(path):
+    """return (mtime, size) of path, or None if it doesn't exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _base_directory(path):
+    """return the directory a file, directory or glob pattern lives in"""
+    if glob.has_magic(path):
+        parts = []
+        for part in path.split(os.sep):
+            if glob.has_magic(part):
+                break
+            parts.append(part)
+        path = os.sep.join(parts) or os.curdir
+    elif not os.path.isdir(path):
+        path = os.path.dirname(path) or os.curdir
+    return os.path.abspath(path)
+
+
+class Watcher(object):
+
+    """Keep the outputs of a set of universes up to date
+
+    paths, outputs, output_dir and template are as for batch.run_batch.
+    interval is the number of seconds between polls. notify=False
+    disables inotify even when it is available. progress, if given, is
+    called with a result dictionary (see batch.document_universe) for
+    each universe documented, and with status 'removed' for each
+    universe that disappears.
+    """
+
+    def __init__(self, paths, outputs=('manifest',), output_dir=None,
+            template=None, interval=1.0, notify=True, progress=None):
+        super(Watcher, self).__init__()
+        for output in outputs:
+            if output not in OUTPUTS:
+                raise ValueError('unknown output %r (expected one of %s)'
+                    % (output, ', '.join(OUTPUTS)))
+        self.paths = list(paths)
+        self.outputs = tuple(outputs)
+        self.output_dir = output_dir
+        self.template = template
+        self.interval = interval
+        self.progress = progress
+        self.root = None
+        if output_dir is not None and self.paths:
+            self.root = os.path.commonpath([_base_directory(p)
+                for p in self.paths])
+        self.universes = {}
+        self.stamps = {}
+        self.template_stamp = self._template_stamp()
+        self.notifier = None
+        self.watched = {}
+        self._watch_mask = 0
+        if notify:
+            self.notifier = self._open_notifier()
+
+    def _template_stamp(self):
+        if 'manifest' not in self.outputs:
+            return None
+        return _stamp(Manifest(None, self.template).template)
+
+    def _open_notifier(self):
+        try:
+            import inotify_simple
+        except ImportError:
+            return None
+        try:
+            notifier = inotify_simple.INotify()
+        except OSError:
+            return None
+        flags = inotify_simple.flags
+        self._watch_mask = flags.CLOSE_WRITE | flags.MOVED_TO | \
+            flags.MOVED_FROM | flags.CREATE | flags.DELETE
+        return notifier
+
+    def _watch_directories(self):
+        """add inotify watches for directories that aren't watched yet
+
+        Return (added, missing): whether a watch was added, and whether
+        a directory couldn't be watched.
+        """
+        directories = set()
+        for path in self.paths:
+            base = _base_directory(path)
+            directories.add(base)
+            if os.path.isdir(path) or '**' in path:
+                for root, dirs, files in os.walk(base):
+                    directories.update(os.path.join(root, d) for d in dirs)
+        if 'manifest' in self.outputs:
+            template = Manifest(None, self.template).template
+            directories.add(os.path.dirname(os.path.abspath(template)))
+        added = missing = False
+        for directory in directories - set(self.watched):
+            try:
+                self.watched[directory] = self.notifier.add_watch(directory,
+                    self._watch_mask)
+                added = True
+            except OSError:
+                missing = True
+        return added, missing
+
+    def scan(self):
+        """return {path: (mtime, size)} for the universes now present"""
+        stamps = {}
+        for path in find_universes(self.paths):
+            path = os.path.abspath(path)
+            stamp = _stamp(path)
+            if stamp is not None:
+                stamps[path] = stamp
+        return stamps
+
+    def poll(self):
+        """document the universes that changed since the last poll and
+        return their results"""
+        results = []
+        stamps = self.scan()
+        for path in sorted(set(self.stamps) - set(stamps)):
+            del self.stamps[path]
+            self.universes.pop(path, None)
+            results.append({'path': path, 'status': 'removed',
+                'outputs': {}, 'timings': {}, 'error': None})
+        template_stamp = self._template_stamp()
+        rerender = template_stamp != self.template_stamp
+        self.template_stamp = template_stamp
+        for path in sorted(stamps):
+            if stamps[path] != self.stamps.get(path):
+                results.append(self.update(path, stamps[path]))
+            elif rerender and path in self.universes:
+                results.append(self.render(path, ('manifest',)))
+        if self.progress is not None:
+            for result in results:
+                self.progress(result)
+        return results
+
+    def update(self, path, stamp=None):
+        """parse the universe at path again and rewrite its outputs"""
+        result = {'path': path, 'status': 'ok', 'outputs': {},
+            'timings': {}, 'error': None}
+        start = time.perf_counter()
+        # remember the file even if it can't be parsed, so a half-written
+        # universe is retried when it next changes rather than every poll
+        self.stamps[path] = stamp or _stamp(path)
+        try:
+            universe = Reader(path).universe
+        except Exception as error:
+            result['status'] = 'error'
+            result['error'] = '%s: %s' % (type(error).__name__, error)
+            result['phase'] = 'parse'
+            result['traceback'] = traceback.format_exc()
+            result['timings']['total'] = time.perf_counter() - start
+            return result
+        result['timings']['parse'] = time.perf_counter() - start
+        self.universes[path] = universe
+        rendered = self.render(path, self.outputs)
+        rendered['timings'].update(result['timings'])
+        rendered['timings']['total'] = time.perf_counter() - start
+        return rendered
+
+    def render(self, path, outputs):
+        """write outputs of the universe at path from the parsed copy in
+        memory"""
+        result = {'path': path, 'status': 'ok', 'outputs': {},
+            'timings': {}, 'error': None}
+        start = time.perf_counter()
+        universe = self.universes[path]
+        files = output_paths(path, outputs, self.output_dir, self.root)
+        output = None
+        try:
+            for output in outputs:
+                phase_start = time.perf_counter()
+                write_output(universe, output, files[output], self.template)
+                result['outputs'][output] = files[output]
+                result['timings'][output] = time.perf_counter() - phase_start
+        except Exception as error:
+            result['status'] = 'error'
+            result['error'] = '%s: %s' % (type(error).__name__, error)
+            result['phase'] = output
+            result['traceback'] = traceback.format_exc()
+        result['timings']['total'] = time.perf_counter() - start
+        return result
+
+    def wait(self):
+        """sleep until the next poll is due: with inotify, until something
+        changes, otherwise for interval seconds"""
+        if self.notifier is None:
+            time.sleep(self.interval)
+            return
+        added, missing = self._watch_directories()
+        if added:
+            # a change made before the new watches existed sends no event,
+            # so poll again now that they do
+            return
+        # block until something changes, then give the writer a moment to
+        # finish before the next scan; a directory that couldn't be
+        # watched is only seen by polling every interval
+        timeout = int(self.interval * 1000) if missing else None
+        if self.notifier.read(timeout=timeout):
+            time.sleep(0.1)
+            self.notifier.read(timeout=0)
+
+    def run(self, polls=None):
+        """poll for changes until interrupted (or polls times)"""
+        count = 0
+        while polls is None or count < polls:
+            if count:
+                self.wait()
+            self.poll()
+            count += 1
+
+    def close(self):
+        """release the inotify handle, if any"""
+        if self.notifier is not None:
+            self.notifier.close()
+            self.notifier = None
@@ -9,17 +9,44 @@ Copyright (c) 2009 David Peckham. All rights reserved.
 Enhanced by Sanjay Sharma (indoos@gmail.com) 2025-10-17.
 """
 
+import asyncio
+import concurrent.futures
 import datetime
+import gc
+import io
+import json
 import os
+import random
+import shutil
 import sys
+import tempfile
+import threading
+import time
 import unittest
+import urllib.error
+import urllib.request
+import weakref
 
 # Add the local pyunv directory to the path so tests use the enhanced version
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from pyunv.universe import Universe
+from pyunv.universe import Universe, ColumnCatalog, Table
 from pyunv.reader import Reader
 from pyunv.manifest import Manifest
+from pyunv.cache import ParseCache
+from pyunv.sections import SectionIndex, DirectSectionIndex
+from pyunv import records
+from pyunv import snapshot
+from pyunv import batch
+from pyunv import manifest
+from pyunv.watch import Watcher
+from pyunv.server import UniverseCache, make_server
+from pyunv import aio
+from pyunv.tracing import Tracer, PrintTracer
+from pyunv import benchmark
+from pyunv import synthetic
+from pyunv import inventory
+from pyunv.sqlscan import scan_sql
 
 
 class ReaderTests(unittest.TestCase):
@@ -185,7 +212,7 @@ class SampleUniverseEFashion(unittest.TestCase):
         self.assertEqual(self.universe.statistics['tables'], 4)
             
     def test_validation_errors_count(self):
-        self.assertEqual(len(self.universe.validation_errors), 40)
+        self.assertEqual(len(self.universe.validation_errors), 39)
             
     def test_cross_references_count(self):
         self.assertEqual(len(self.universe.cross_references), 29)
@@ -233,9 +260,6 @@ class SampleUniverseUnivers5(unittest.TestCase):
         Manifest(self.universe).save(open(self.filename+'.txt', 'w'))
         
 
-if __name__ == '__main__':
-    unittest.main()
-
 
 # Additional test class for enhanced analysis features
 class EnhancedAnalysisTests(unittest.TestCase):
@@ -369,3 +393,1647 @@ class EnhancedAnalysisTests(unittest.TestCase):
         self.assertTrue(hasattr(self.universe, 'lov_definitions'))
         self.assertTrue(hasattr(self.universe, 'stored_procedure_parameters'))
 
+
+
+class UniverseComparison(object):
+    """Helpers to read the test universes and compare two readings"""
+
+    filenames = ['tests/universes/universe_xir2.unv',
+        'tests/universes/eFashion.unv',
+        'tests/universes/Univers5.unv']
+
+    def read(self, filename, **kwargs):
+        with open(filename, 'rb') as f:
+            return Reader(f, **kwargs).universe
+
+    def assertUniversesEqual(self, expected, actual):
+        self.assertEqual(vars(expected.parameters), vars(actual.parameters))
+        self.assertEqual(expected.custom_parameters, actual.custom_parameters)
+        self.assertEqual(expected.statistics, actual.statistics)
+        self.assertEqual([t.fullname for t in expected.tables],
+            [t.fullname for t in actual.tables])
+        self.assertEqual([(c.id_, c.fullname, c.datatype) for c in expected.columns],
+            [(c.id_, c.fullname, c.datatype) for c in actual.columns])
+        self.assertEqual([j.statement for j in expected.joins],
+            [j.statement for j in actual.joins])
+        self.assertEqual([o.select_sql for o in expected.object_map.values()],
+            [o.select_sql for o in actual.object_map.values()])
+        self.assertEqual(expected.graphical_info, actual.graphical_info)
+        self.assertEqual(len(expected.validation_errors),
+            len(actual.validation_errors))
+
+
+class MappedEngineTests(UniverseComparison, unittest.TestCase):
+    """Test that the mmap decoding engine matches the file engine"""
+
+    def test_mmap_engine_matches_file_engine(self):
+        for filename in self.filenames:
+            self.assertUniversesEqual(self.read(filename),
+                self.read(filename, engine='mmap'))
+
+    def test_unknown_engine(self):
+        with open(self.filenames[0], 'rb') as f:
+            self.assertRaises(ValueError, Reader, f, engine='turbo')
+
+
+class SectionIndexTests(unittest.TestCase):
+    """Test the single-pass section marker index"""
+
+    markers = ('Objects;', 'Tables;', 'Dot_Tables;', 'Links;')
+
+    def test_sections_sorted_with_bounds(self):
+        contents = b'PK\x00Tables;abcd\x00Objects;efgh'
+        index = SectionIndex(contents, self.markers)
+        self.assertEqual([s.name for s in index], ['Tables;', 'Objects;'])
+        tables = index['Tables;']
+        self.assertEqual(contents[tables.start:tables.end], b'abcd')
+        objects = index.get('Objects;')
+        self.assertEqual(contents[objects.start:objects.end], b'efgh')
+
+    def test_missing_marker(self):
+        index = SectionIndex(b'\x00Tables;abcd', self.markers)
+        self.assertNotIn('Links;', index)
+        self.assertNotIn('Links;', index.offsets)
+        self.assertIsNone(index.get('Links;'))
+
+    def test_nested_marker_names(self):
+        contents = b'\x00Dot_Tables;' + b'x' * 30 + b'\x00Tables;yy'
+        index = SectionIndex(contents, self.markers)
+        self.assertEqual(index.offsets['Dot_Tables;'], 12)
+        self.assertEqual(index.offsets['Tables;'], 50)
+
+    def test_false_marker(self):
+        contents = (b'\x00Objects;' + b'x' * 5 + b'Objects;' + b'y' * 30 +
+            b'\x00Objects;real')
+        index = SectionIndex(contents, self.markers)
+        self.assertEqual(index.occurrences['Objects;'], [0, 52])
+        section = index['Objects;']
+        self.assertEqual(contents[section.start:section.end], b'real')
+
+    def test_direct_index_matches(self):
+        contents = (b'\x00Objects;' + b'x' * 5 + b'Objects;' + b'y' * 30 +
+            b'\x00Objects;real\x00Dot_Tables;' + b'z' * 30 + b'\x00Tables;')
+        for data in [contents] + [open(f, 'rb').read()
+                for f in MappedEngineTests.filenames]:
+            self.assertEqual(DirectSectionIndex(data, self.markers).offsets,
+                SectionIndex(data, self.markers).offsets)
+        direct = DirectSectionIndex(contents, self.markers)
+        self.assertEqual(contents[direct.offsets['Objects;']:][:4], b'real')
+
+    def test_reader_sections(self):
+        with open('tests/universes/universe_xir2.unv', 'rb') as f:
+            reader = Reader(f)
+        starts = [s.start for s in reader.sections]
+        self.assertEqual(starts, sorted(starts))
+        self.assertEqual(reader.sections['Objects;'].start,
+            reader.content_offsets['Objects;'])
+
+
+class LazyReaderTests(unittest.TestCase):
+    """Test on-demand section decoding and analysis"""
+
+    def setUp(self):
+        super(LazyReaderTests, self).setUp()
+        self.filename = 'tests/universes/eFashion.unv'
+        with open(self.filename, 'rb') as f:
+            self.reader = Reader(f, lazy=True)
+        self.universe = self.reader.universe
+
+    def tearDown(self):
+        super(LazyReaderTests, self).tearDown()
+        self.reader.close()
+
+    def test_nothing_loaded_up_front(self):
+        self.assertIn('parameters', self.universe.pending)
+        self.assertIn('graphical_info', self.universe.pending)
+        self.assertIn('cross_references', self.universe.pending)
+
+    def test_load_on_access(self):
+        self.assertEqual(self.universe.parameters.universe_name, 'eFashion')
+        self.assertEqual(self.universe.statistics['objects'], 41)
+        self.assertNotIn('classes', self.universe.pending)
+        self.assertIn('graphical_info', self.universe.pending)
+        self.assertIn('validation_errors', self.universe.pending)
+
+    def test_analysis_on_access(self):
+        self.assertEqual(len(self.universe.validation_errors), 39)
+        self.assertEqual(len(self.universe.cross_references), 29)
+        self.assertIn('context_incompatibilities', self.universe.pending)
+
+    def test_failed_load_stays_pending(self):
+        self.reader.close()
+        for attempt in range(2):
+            self.assertRaises(ValueError, getattr, self.universe, 'tables')
+        self.assertIn('tables', self.universe.pending)
+        universe = Universe()
+        calls = []
+
+        def load():
+            calls.append(None)
+            universe.tables = ['table']
+            if len(calls) == 1:
+                raise OSError('truncated section')
+        universe.defer(('tables', 'joins'), load)
+        self.assertRaises(OSError, getattr, universe, 'joins')
+        self.assertEqual(universe.pending, ['joins', 'tables'])
+        self.assertEqual(universe.tables, ['table'])
+        self.assertEqual(universe.joins, [])
+        self.assertEqual((universe.pending, len(calls)), ([], 2))
+
+    def test_matches_eager_reader(self):
+        with open(self.filename, 'rb') as f:
+            eager = Reader(f).universe
+        self.assertEqual(eager.graphical_info, self.universe.graphical_info)
+        self.assertEqual([(c.fullname, c.datatype) for c in eager.columns],
+            [(c.fullname, c.datatype) for c in self.universe.columns])
+        self.assertEqual(eager.database_tables, self.universe.database_tables)
+        self.assertEqual(eager.context_incompatibilities,
+            self.universe.context_incompatibilities)
+        self.assertEqual(eager.stored_procedure_parameters,
+            self.universe.stored_procedure_parameters)
+
+
+class SelectiveReaderTests(unittest.TestCase):
+    """Test reading a whitelist of sections and analyses"""
+
+    filename = 'tests/universes/eFashion.unv'
+
+    def read(self, **kwargs):
+        with open(self.filename, 'rb') as f:
+            return Reader(f, **kwargs)
+
+    def test_inventory_sections(self):
+        reader = self.read(sections=('Parameters', 'Objects', 'Tables',
+            'Joins', 'Contexts'), analyses=())
+        universe = reader.universe
+        self.assertEqual(universe.parameters.universe_name, 'eFashion')
+        self.assertEqual(universe.statistics['objects'], 41)
+        self.assertEqual(universe.statistics['joins'], 9)
+        self.assertEqual(universe.columns, [])
+        self.assertIsNone(universe.graphical_info)
+        self.assertEqual(universe.cross_references, {})
+        self.assertEqual(universe.validation_errors, [])
+
+    def test_analysis_reads_its_sections(self):
+        reader = self.read(sections=('Parameters',),
+            analyses=('cross_references',))
+        self.assertEqual(reader.selected_sections,
+            set(('Parameters;', 'Objects;', 'Tables;', 'Joins;')))
+        self.assertEqual(len(reader.universe.cross_references), 29)
+        self.assertEqual(reader.universe.dependency_graph, {})
+
+    def test_each_analysis_alone(self):
+        full = self.read().universe
+        for name, outputs, _, _, _ in Reader._analyses:
+            universe = self.read(sections=('Parameters',),
+                analyses=(name,)).universe
+            for output in outputs:
+                self.assertEqual(getattr(universe, output),
+                    getattr(full, output), '%s.%s' % (name, output))
+
+    def test_analysis_dependencies(self):
+        reader = self.read(sections=(), analyses=('context_details',))
+        self.assertEqual(reader.analyses,
+            set(('context_details', 'schema_details')))
+        self.assertIn('Columns;', reader.selected_sections)
+        self.assertEqual(len(reader.universe.context_details), 2)
+
+    def test_columns_need_tables(self):
+        reader = self.read(sections=('Columns Id;',), analyses=())
+        self.assertIn('Tables;', reader.selected_sections)
+        self.assertTrue(any(c.parent for c in reader.universe.columns))
+
+    def test_lazy_selection(self):
+        reader = self.read(lazy=True, sections=('Parameters',), analyses=())
+        self.assertEqual(reader.universe.pending, ['parameters'])
+        reader.close()
+
+    def test_unknown_names(self):
+        self.assertRaises(ValueError, self.read, sections=('Nonsense',))
+        self.assertRaises(ValueError, self.read, analyses=('nonsense',))
+
+
+class ArchiveMemberTests(unittest.TestCase):
+    """Test reading UNW_Storage and ResourceHeader members in place"""
+
+    filename = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        'universes', 'Univers5.unv')
+
+    def read(self, **kwargs):
+        cwd = os.getcwd()
+        tmp = tempfile.mkdtemp()
+        try:
+            os.chdir(tmp)
+            with open(self.filename, 'rb') as f:
+                reader = Reader(f, **kwargs)
+            self.assertEqual(os.listdir(tmp), [])
+        finally:
+            os.chdir(cwd)
+            os.rmdir(tmp)
+        return reader
+
+    def test_members_read_without_extracting(self):
+        universe = self.read(sections=('UNW_Storage', 'ResourceHeader'),
+            analyses=()).universe
+        self.assertEqual(universe.unw_connection_info['connection_name'],
+            'sqltest')
+        self.assertEqual(universe.resource_descriptor['universe_name'],
+            'Univers5')
+
+    def test_stored_procedures_from_tables_member(self):
+        for engine in Reader._engines:
+            universe = self.read(engine=engine,
+                analyses=('stored_procedures',)).universe
+            self.assertIn('GetEmployeesByDeptAndSalary;1',
+                universe.stored_procedure_parameters)
+
+    def test_lazy_reader_keeps_archive_open(self):
+        reader = self.read(lazy=True, sections=('UNW_Storage',), analyses=())
+        self.assertEqual(reader.universe.unw_connection_info['connection_id'],
+            5057)
+        reader.close()
+        self.assertIsNone(reader.archive)
+
+
+class SourceTests(UniverseComparison, unittest.TestCase):
+    """Test reading universes from paths and in-memory contents"""
+
+    def sources(self, filename):
+        with open(filename, 'rb') as f:
+            data = f.read()
+        return [filename, data, bytearray(data), memoryview(data),
+            io.BytesIO(data)]
+
+    def test_sources_match_file(self):
+        for filename in self.filenames:
+            expected = self.read(filename)
+            for source in self.sources(filename):
+                self.assertUniversesEqual(expected,
+                    Reader(source).universe)
+
+    def test_archive_members_from_bytes(self):
+        for source in self.sources(self.filenames[2]):
+            universe = Reader(source, analyses=('stored_procedures',),
+                sections=('UNW_Storage',)).universe
+            self.assertEqual(universe.unw_connection_info['connection_id'],
+                5057)
+            self.assertIn('GetEmployeesByDeptAndSalary;1',
+                universe.stored_procedure_parameters)
+
+    def test_lazy_reader_from_bytes(self):
+        with open(self.filenames[1], 'rb') as f:
+            reader = Reader(f.read(), lazy=True)
+        self.assertEqual(reader.universe.parameters.universe_name, 'eFashion')
+        reader.close()
+
+
+class RecordLayoutTests(unittest.TestCase):
+    """Test the precompiled record layouts against the documented records"""
+
+    def test_layout_sizes(self):
+        self.assertEqual(records.TABLE.head.size, 4 + 7 + 12)
+        self.assertEqual(records.TABLE.tail.size, 4 + 9 + 1)
+        self.assertEqual(records.OBJECT.tail.size, 2 + 1 + 55)
+        self.assertEqual(records.JOIN.head.size, 4 + 20)
+        self.assertEqual(records.JOIN.term_count.size, 8 + 4)
+        self.assertEqual(records.CLASS.object_count.size, 7 + 4)
+        self.assertEqual(records.COLUMN_ATTRIBUTES.tail.size, 1 + 10)
+
+    def test_records_table(self):
+        self.assertIs(records.RECORDS['table'], records.TABLE)
+        self.assertEqual(records.TABLE.tail.unpack(
+            b'\x05\x00\x00\x00' + b'\x00' * 9 + b'\x01'), (5, True))
+
+    def test_id_array(self):
+        self.assertIs(records.id_array(3), records.id_array(3))
+        self.assertEqual(records.id_array(2).unpack(b'\x01\x00\x00\x00'
+            b'\x02\x00\x00\x00'), (1, 2))
+
+
+class ColumnCatalogTests(unittest.TestCase):
+    """Test the columnar column catalog"""
+
+    def setUp(self):
+        with open('tests/universes/eFashion.unv', 'rb') as f:
+            self.universe = Reader(f, sections=('Columns',),
+                analyses=()).universe
+        self.catalog = self.universe.columns
+
+    def test_columns_created_on_demand(self):
+        self.assertIsInstance(self.catalog, ColumnCatalog)
+        created = lambda: [c for c in self.catalog._columns if c is not None]
+        self.assertEqual(created(), [])
+        column = self.catalog[0]
+        self.assertIs(self.catalog[0], column)
+        self.assertEqual(column.id_, self.catalog.ids[0])
+        self.assertEqual(len(created()), 1)
+
+    def test_sorted_by_id(self):
+        self.assertEqual(list(self.catalog.ids), sorted(self.catalog.ids))
+
+    def test_find_and_attributes(self):
+        row = self.catalog.find(self.catalog.table_ids[0],
+            self.catalog.names[0])
+        self.assertIsNotNone(row)
+        column = self.catalog[row]
+        self.assertEqual(column.datatype, self.catalog.datatype(row))
+        self.assertIn(column.datatype, ('Numeric', 'String', 'Date'))
+        self.assertIsNone(self.catalog.find(0, 'no such column'))
+
+    def test_set_attributes_updates_columns(self):
+        catalog = ColumnCatalog()
+        catalog.append(2, 1, 'b')
+        catalog.append(1, 1, 'a')
+        catalog.sort()
+        self.assertEqual(catalog.names, ['a', 'b'])
+        self.assertIsNone(catalog[1].datatype)
+        catalog.set_attributes(catalog.find(1, 'b'), 0x03, b'\x01')
+        self.assertEqual(catalog[1].datatype, 'String')
+        self.assertEqual(catalog[1].metadata, b'\x01')
+        self.assertEqual(ColumnCatalog(), [])
+
+
+class ParseCacheTests(UniverseComparison, unittest.TestCase):
+    """Test the on-disk parse cache"""
+
+    def setUp(self):
+        super(ParseCacheTests, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(ParseCacheTests, self).tearDown()
+
+    def manifest(self, universe):
+        out = io.StringIO()
+        Manifest(universe).save(out)
+        return out.getvalue()
+
+    def test_warm_read_matches_reader(self):
+        for key in ParseCache.keys:
+            cache = ParseCache(self.directory, key=key)
+            for filename in self.filenames:
+                cold = cache.read(filename)
+                warm = cache.read(filename)
+                self.assertUniversesEqual(self.read(filename), warm)
+                self.assertEqual(self.manifest(cold), self.manifest(warm))
+            self.assertEqual(cache.misses, len(self.filenames))
+            self.assertEqual(cache.hits, len(self.filenames))
+
+    def test_options_are_part_of_the_key(self):
+        cache = ParseCache(self.directory)
+        filename = self.filenames[1]
+        self.assertNotEqual(cache.key_for(filename),
+            cache.key_for(filename, analyses=()))
+        universe = cache.read(filename, sections=('Parameters',),
+            analyses=(), lazy=True)
+        self.assertEqual(universe.pending, [])
+        self.assertEqual(universe.tables, [])
+        self.assertEqual(len(cache.read(filename).tables), 10)
+
+    def test_profile_and_tracer_are_rejected(self):
+        cache = ParseCache(self.directory)
+        filename = self.filenames[1]
+        self.assertRaises(ValueError, cache.read, filename, profile=True)
+        self.assertRaises(ValueError, cache.read, filename,
+            tracer=RecordingTracer())
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_string_options(self):
+        cache = ParseCache(self.directory)
+        filename = self.filenames[0]
+        self.assertEqual(cache.key_for(filename, sections='Tables'),
+            cache.key_for(filename, sections=['Tables']))
+        self.assertNotEqual(cache.key_for(filename, sections='Tables'),
+            cache.key_for(filename, sections='Tablse'))
+
+    def test_other_version_is_a_miss(self):
+        cache = ParseCache(self.directory)
+        cache.read(self.filenames[0])
+        other = ParseCache(self.directory)
+        other.version = '0.0.0/0'
+        self.assertIsNone(other.get(cache.key_for(self.filenames[0])))
+
+    def test_corrupt_entry_is_a_miss(self):
+        cache = ParseCache(self.directory)
+        filename = self.filenames[0]
+        key = cache.key_for(filename)
+        cache.read(filename)
+        path = cache.entries()[0][2]
+        with open(path, 'rb') as f:
+            data = f.read()
+        rng = random.Random(3)
+        for i in range(50):
+            damaged = bytearray(data)
+            if i % 2:
+                del damaged[rng.randrange(len(damaged) // 2, len(damaged)):]
+            else:
+                header = data.index(b'\n') + 1
+                for j in range(3):
+                    damaged[rng.randrange(header, len(damaged))] ^= \
+                        1 << rng.randrange(8)
+            with open(path, 'wb') as f:
+                f.write(damaged)
+            misses = cache.misses
+            if cache.get(key) is None:
+                self.assertEqual(cache.misses, misses + 1)
+                self.assertFalse(os.path.exists(path))
+        self.assertGreater(cache.misses, 25)
+        self.assertUniversesEqual(self.read(filename), cache.read(filename))
+
+    def test_lru_eviction(self):
+        cache = ParseCache(self.directory)
+        for filename in self.filenames:
+            cache.read(filename)
+        entries = cache.entries()
+        self.assertEqual(len(entries), 3)
+        # touch the oldest entry, then shrink the cache to two entries
+        oldest = entries[0][2]
+        time.sleep(0.01)
+        os.utime(oldest)
+        cache.max_size = cache.size() - min(size for _, size, _ in entries)
+        cache.evict()
+        paths = [path for _, _, path in cache.entries()]
+        self.assertIn(oldest, paths)
+        self.assertNotIn(entries[1][2], paths)
+
+    def test_unknown_key(self):
+        self.assertRaises(ValueError, ParseCache, self.directory, key='name')
+
+
+
+class SnapshotTests(UniverseComparison, unittest.TestCase):
+    """Test the binary universe snapshot format"""
+
+    def test_round_trip(self):
+        for filename in self.filenames:
+            expected = self.read(filename)
+            universe = snapshot.loads(snapshot.dumps(expected))
+            self.assertUniversesEqual(expected, universe)
+            self.assertEqual(expected.cross_references,
+                universe.cross_references)
+            self.assertEqual(expected.parameters.created_date,
+                universe.parameters.created_date)
+
+    def test_graph_is_rebuilt(self):
+        universe = snapshot.loads(snapshot.dumps(self.read(self.filenames[1])))
+        for c in universe.classes:
+            self.assertIs(c.universe, universe)
+            for o in c.objects:
+                self.assertIs(o.parent, c)
+                self.assertIs(universe.object_map[o.id_], o)
+        tables = set(id(t) for t in universe.tables)
+        for id_, t in universe.table_map.items():
+            self.assertEqual(t.id_, id_)
+            self.assertIn(id(t), tables)
+        column = universe.columns[0]
+        self.assertIs(column.parent, universe.table_map[column.parent.id_])
+
+    def test_lazy_universe(self):
+        with open(self.filenames[1], 'rb') as f:
+            reader = Reader(f, lazy=True)
+        universe = snapshot.loads(snapshot.dumps(reader.universe))
+        reader.close()
+        self.assertUniversesEqual(self.read(self.filenames[1]), universe)
+
+    def test_not_a_snapshot(self):
+        self.assertRaises(snapshot.SnapshotError, snapshot.loads, b'PK\x03')
+        data = bytearray(snapshot.dumps(Universe()))
+        data[len(snapshot.MAGIC)] += 1
+        self.assertRaises(snapshot.SnapshotError, snapshot.loads, bytes(data))
+
+    def test_corrupt_snapshot(self):
+        data = snapshot.dumps(self.read(self.filenames[1]))
+        for size in range(0, len(data), len(data) // 40):
+            self.assertRaises(snapshot.SnapshotError, snapshot.loads,
+                data[:size])
+        rng = random.Random(10)
+        for i in range(200):
+            damaged = bytearray(data)
+            for j in range(3):
+                damaged[rng.randrange(len(damaged))] = rng.randrange(256)
+            try:
+                snapshot.loads(bytes(damaged))
+            except snapshot.SnapshotError:
+                pass
+
+    def test_objects_have_sql_caches(self):
+        expected = self.read(self.filenames[1])
+        universe = snapshot.loads(snapshot.dumps(expected))
+        parsed = expected.object_map[188]
+        loaded = universe.object_map[188]
+        self.assertEqual(list(vars(parsed)), list(vars(loaded)))
+        self.assertIsNone(loaded._select_references)
+        self.assertEqual(loaded.select_sql, parsed.select_sql)
+
+    def test_plain_values_without_marshal(self):
+        universe = Universe()
+        universe.audit_info = {'when': datetime.date(2009, 9, 1),
+            'ids': (1, 2), 'flags': set([True])}
+        copy = snapshot.loads(snapshot.dumps(universe))
+        self.assertEqual(copy.audit_info, universe.audit_info)
+
+
+def document_or_crash(path, *args, document=batch.document_universe):
+    """batch.document_universe, but the worker dies on crash.unv"""
+    if path.endswith('crash.unv'):
+        os._exit(1)
+    return document(path, *args)
+
+
+class BatchTests(unittest.TestCase):
+    """Test documenting a directory of universes in parallel"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.universes = os.path.join(self.directory, 'universes')
+        os.makedirs(os.path.join(self.universes, 'archive'))
+        for name in ('universe_xir2.unv', 'eFashion.unv'):
+            shutil.copy(os.path.join('tests/universes', name),
+                self.universes)
+        shutil.copy('tests/universes/Univers5.unv',
+            os.path.join(self.universes, 'archive'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_find_universes(self):
+        found = batch.find_universes([self.universes])
+        self.assertEqual([os.path.relpath(p, self.universes) for p in found],
+            [os.path.join('archive', 'Univers5.unv'), 'eFashion.unv',
+            'universe_xir2.unv'])
+        pattern = os.path.join(self.universes, '*.unv')
+        self.assertEqual(len(batch.find_universes([pattern, pattern])), 2)
+
+    def test_outputs_next_to_universes(self):
+        summary = batch.run_batch([self.universes], workers=1)
+        self.assertEqual(summary['succeeded'], 3)
+        for result in summary['results']:
+            self.assertEqual(result['outputs'],
+                {'manifest': result['path'] + '.txt'})
+            self.assertTrue(os.path.exists(result['path'] + '.txt'))
+
+    def test_parallel_batch_matches_manifest(self):
+        output_dir = os.path.join(self.directory, 'docs')
+        summary_path = os.path.join(output_dir, 'summary.json')
+        summary = batch.run_batch([self.universes], workers=2,
+            outputs=('manifest', 'csv'), output_dir=output_dir,
+            summary_path=summary_path)
+        self.assertEqual((summary['universes'], summary['failed']), (3, 0))
+        filename = os.path.join(output_dir, 'archive', 'Univers5.unv.txt')
+        self.assertTrue(os.path.exists(filename))
+        self.assertTrue(os.path.exists(os.path.join(output_dir,
+            'eFashion.unv.csv')))
+        with open('tests/universes/eFashion.unv', 'rb') as f:
+            expected = io.StringIO()
+            Manifest(Reader(f).universe).save(expected)
+        with open(os.path.join(output_dir, 'eFashion.unv.txt')) as f:
+            self.assertEqual(f.read(), expected.getvalue())
+        with open(summary_path) as f:
+            self.assertEqual(json.load(f)['succeeded'], 3)
+
+    def test_failures_are_isolated(self):
+        with open(os.path.join(self.universes, 'broken.unv'), 'wb') as f:
+            f.write(b'not a universe')
+        seen = []
+        summary = batch.run_batch([self.universes], workers=2,
+            output_dir=os.path.join(self.directory, 'docs'),
+            progress=seen.append)
+        self.assertEqual(len(seen), 4)
+        self.assertEqual((summary['succeeded'], summary['failed']), (3, 1))
+        failed = [r for r in summary['results'] if r['status'] == 'error']
+        self.assertTrue(failed[0]['path'].endswith('broken.unv'))
+        self.assertEqual(failed[0]['phase'], 'parse')
+        self.assertTrue(failed[0]['error'])
+
+    def test_worker_crash_is_isolated(self):
+        with open(os.path.join(self.universes, 'crash.unv'), 'wb') as f:
+            f.write(b'')
+        original = batch.document_universe
+        batch.document_universe = document_or_crash
+        try:
+            summary = batch.run_batch([self.universes], workers=2,
+                output_dir=os.path.join(self.directory, 'docs'))
+        finally:
+            batch.document_universe = original
+        self.assertEqual((summary['succeeded'], summary['failed']), (3, 1))
+        failed = [r for r in summary['results'] if r['status'] == 'error']
+        self.assertTrue(failed[0]['path'].endswith('crash.unv'))
+        self.assertEqual(failed[0]['phase'], 'worker')
+
+    def test_unknown_output(self):
+        self.assertRaises(ValueError, batch.run_batch, [self.universes],
+            outputs=('pdf',))
+
+
+class TemplateCacheTests(unittest.TestCase):
+    """Test that manifest templates are compiled once"""
+
+    def test_template_is_reused_until_it_changes(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'name.mako')
+            with open(filename, 'w') as f:
+                f.write('${universe.parameters.universe_name}')
+            template = manifest.get_template(filename)
+            self.assertIs(manifest.get_template(filename), template)
+            with open(filename, 'w') as f:
+                f.write('name: ${universe.parameters.universe_name}')
+            os.utime(filename, ns=(0, 0))
+            self.assertIsNot(manifest.get_template(filename), template)
+            with open('tests/universes/eFashion.unv', 'rb') as f:
+                universe = Reader(f).universe
+            out = io.StringIO()
+            Manifest(universe, filename).save(out)
+            self.assertEqual(out.getvalue(), 'name: eFashion')
+        finally:
+            shutil.rmtree(directory)
+
+
+class WatcherTests(unittest.TestCase):
+    """Test re-documenting universes as they change"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.universes = os.path.join(self.directory, 'universes')
+        os.makedirs(self.universes)
+        for name in ('universe_xir2.unv', 'eFashion.unv'):
+            shutil.copy(os.path.join('tests/universes', name),
+                self.universes)
+        self.watcher = Watcher([self.universes], outputs=('manifest', 'csv'),
+            output_dir=os.path.join(self.directory, 'docs'), notify=False)
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.abspath(os.path.join(self.universes, name))
+
+    def test_only_changed_universes_are_documented(self):
+        results = self.watcher.poll()
+        self.assertEqual([r['status'] for r in results], ['ok', 'ok'])
+        self.assertEqual(len(self.watcher.universes), 2)
+        manifest_file = os.path.join(self.directory, 'docs',
+            'eFashion.unv.txt')
+        self.assertTrue(os.path.exists(manifest_file))
+        self.assertEqual(self.watcher.poll(), [])
+
+        target = self.path('eFashion.unv')
+        shutil.copy('tests/universes/Univers5.unv', target)
+        os.utime(target, ns=(0, 0))
+        before = self.watcher.universes[self.path('universe_xir2.unv')]
+        results = self.watcher.poll()
+        self.assertEqual([r['path'] for r in results], [target])
+        self.assertEqual(sorted(results[0]['outputs']), ['csv', 'manifest'])
+        self.assertIs(self.watcher.universes[self.path('universe_xir2.unv')],
+            before)
+        self.assertEqual(self.watcher.universes[target].parameters.universe_name,
+            'Univers5')
+
+        os.remove(target)
+        results = self.watcher.poll()
+        self.assertEqual([(r['path'], r['status']) for r in results],
+            [(target, 'removed')])
+        self.assertNotIn(target, self.watcher.universes)
+
+    def test_broken_universe_is_retried_on_change(self):
+        self.watcher.poll()
+        target = self.path('eFashion.unv')
+        universe = self.watcher.universes[target]
+        with open(target, 'wb') as f:
+            f.write(b'half written')
+        results = self.watcher.poll()
+        self.assertEqual(results[0]['status'], 'error')
+        self.assertIs(self.watcher.universes[target], universe)
+        self.assertEqual(self.watcher.poll(), [])
+        shutil.copy('tests/universes/eFashion.unv', target)
+        self.assertEqual([r['status'] for r in self.watcher.poll()], ['ok'])
+
+    def test_template_change_rerenders_manifests(self):
+        template = os.path.join(self.directory, 'name.mako')
+        with open(template, 'w') as f:
+            f.write('${universe.parameters.universe_name}')
+        watcher = Watcher([self.universes], template=template, notify=False)
+        self.assertEqual(len(watcher.poll()), 2)
+        with open(template, 'w') as f:
+            f.write('name: ${universe.parameters.universe_name}')
+        os.utime(template, ns=(0, 0))
+        results = watcher.poll()
+        self.assertEqual([sorted(r['outputs']) for r in results],
+            [['manifest'], ['manifest']])
+        self.assertNotIn('parse', results[0]['timings'])
+        with open(self.path('eFashion.unv') + '.txt') as f:
+            self.assertEqual(f.read(), 'name: eFashion')
+
+    def test_notifier_blocks_until_a_change(self):
+        notifier = FakeNotifier()
+        self.watcher.notifier = notifier
+        # the first wait adds the watches and returns at once
+        self.watcher.wait()
+        self.assertIn(self.universes, notifier.watched)
+        self.assertEqual(notifier.timeouts, [])
+        self.watcher.wait()
+        self.assertEqual(notifier.timeouts, [None])
+        # a pattern whose directory doesn't exist yet needs polling
+        self.watcher.paths.append(os.path.join(self.directory, 'new',
+            '*.unv'))
+        self.watcher.wait()
+        self.assertEqual(notifier.timeouts, [None, 1000])
+
+
+class FakeNotifier(object):
+    """Stands in for inotify_simple.INotify; nothing ever changes"""
+
+    def __init__(self):
+        self.watched = []
+        self.timeouts = []
+
+    def add_watch(self, directory, mask):
+        if not os.path.isdir(directory):
+            raise OSError('no such directory')
+        self.watched.append(directory)
+        return len(self.watched)
+
+    def read(self, timeout=None):
+        self.timeouts.append(timeout)
+        return []
+
+    def close(self):
+        pass
+
+
+
+class ServerTests(unittest.TestCase):
+    """Test serving universe metadata as JSON"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = make_server('tests/universes', port=0)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.start()
+        cls.base = 'http://127.0.0.1:%d' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.thread.join()
+
+    def get(self, path):
+        with urllib.request.urlopen(self.base + path) as response:
+            self.assertEqual(response.headers['Content-Type'],
+                'application/json; charset=utf-8')
+            return json.load(response)
+
+    def assertNotFound(self, path):
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            urllib.request.urlopen(self.base + path)
+        self.assertEqual(cm.exception.code, 404)
+        cm.exception.close()
+
+    def test_universe_list(self):
+        self.assertIn('eFashion.unv', self.get('/universes'))
+
+    def test_universe_documents(self):
+        document = self.get('/universes/eFashion.unv')
+        self.assertEqual(document['parameters']['universe_name'], 'eFashion')
+        objects = self.get('/universes/eFashion.unv/objects')
+        with open('tests/universes/eFashion.unv', 'rb') as f:
+            universe = Reader(f).universe
+        self.assertEqual(document['statistics'], universe.statistics)
+        expected = [o for o in universe.object_map.values()
+            if o.id_ in set(item['id'] for item in objects)]
+        self.assertEqual(dict((o['id'], o['select_sql']) for o in objects),
+            dict((o.id_, o.select_sql) for o in expected))
+        self.assertEqual(len(self.get('/universes/eFashion.unv/joins')), 9)
+        self.assertEqual(len(self.get('/universes/eFashion.unv/validation')),
+            len(universe.validation_errors))
+        self.assertEqual(len(self.get('/universes/eFashion.unv/classes')), 5)
+
+    def test_universes_are_parsed_once(self):
+        self.get('/universes/universe_xir2.unv/tables')
+        misses = self.server.cache.misses
+        self.get('/universes/universe_xir2.unv/joins')
+        self.get('/universes/universe_xir2.unv')
+        self.assertEqual(self.server.cache.misses, misses)
+
+    def test_not_found(self):
+        self.assertNotFound('/')
+        self.assertNotFound('/universes/missing.unv')
+        self.assertNotFound('/universes/eFashion.unv/bogus')
+        self.assertNotFound('/universes/..%2Ftest_reader.py%2F.unv')
+        self.assertNotFound('/universes/..%2Funiverses%2FeFashion.unv')
+
+
+class UniverseCacheTests(unittest.TestCase):
+    """Test the least recently used cache of parsed universes"""
+
+    def test_lru_and_invalidation(self):
+        directory = tempfile.mkdtemp()
+        try:
+            paths = []
+            for name in ('eFashion.unv', 'universe_xir2.unv'):
+                shutil.copy(os.path.join('tests/universes', name), directory)
+                paths.append(os.path.join(directory, name))
+            cache = UniverseCache(max_entries=1)
+            universe = cache.get(paths[0])[0]
+            self.assertIs(cache.get(paths[0])[0], universe)
+            cache.get(paths[1])
+            self.assertEqual(len(cache.entries), 1)
+            self.assertIsNot(cache.get(paths[0])[0], universe)
+            self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+            universe = cache.get(paths[0])[0]
+            shutil.copy('tests/universes/Univers5.unv', paths[0])
+            os.utime(paths[0], ns=(0, 0))
+            changed = cache.get(paths[0])[0]
+            self.assertIsNot(changed, universe)
+            self.assertEqual(changed.parameters.universe_name, 'Univers5')
+            self.assertEqual(len(cache.entries), 1)
+        finally:
+            shutil.rmtree(directory)
+
+
+class AsyncReaderTests(UniverseComparison, unittest.TestCase):
+    """Test parsing universes from asyncio code"""
+
+    def setUp(self):
+        self.read_function = aio._read
+
+    def tearDown(self):
+        aio._read = self.read_function
+
+    def test_read_universe(self):
+        async def main():
+            with open(self.filenames[2], 'rb') as f:
+                data = f.read()
+            return await asyncio.gather(*[aio.read_universe(f)
+                for f in self.filenames[:2] + [data]])
+        universes = asyncio.run(main())
+        for filename, universe in zip(self.filenames, universes):
+            self.assertUniversesEqual(self.read(filename), universe)
+
+    def test_process_pool(self):
+        reader = aio.AsyncReader(max_concurrency=2, processes=True)
+        try:
+            universe = asyncio.run(reader.read(self.filenames[1]))
+            self.assertUniversesEqual(self.read(self.filenames[1]), universe)
+            self.assertRaises(TypeError, asyncio.run,
+                reader.read(open(self.filenames[1], 'rb')))
+        finally:
+            reader.close()
+
+    def test_concurrency_is_bounded(self):
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def read(source, options):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            return source
+        aio._read = read
+        reader = aio.AsyncReader(
+            executor=concurrent.futures.ThreadPoolExecutor(8),
+            max_concurrency=2)
+
+        async def main():
+            return await asyncio.gather(*[reader.read(i) for i in range(6)])
+        try:
+            self.assertEqual(asyncio.run(main()), list(range(6)))
+        finally:
+            reader.executor.shutdown()
+        self.assertEqual(running[1], 2)
+
+    def test_cancel_waiting_read(self):
+        started = []
+        release = threading.Event()
+
+        def read(source, options):
+            started.append(source)
+            release.wait(5)
+            return source
+        aio._read = read
+        reader = aio.AsyncReader(max_concurrency=1)
+
+        async def main():
+            first = asyncio.ensure_future(reader.read('first'))
+            second = asyncio.ensure_future(reader.read('second'))
+            await asyncio.sleep(0.05)
+            second.cancel()
+            release.set()
+            with self.assertRaises(asyncio.CancelledError):
+                await second
+            self.assertEqual(await first, 'first')
+            # the slot is free again
+            self.assertEqual(await reader.read('third'), 'third')
+        try:
+            asyncio.run(main())
+        finally:
+            reader.close()
+        self.assertEqual(started, ['first', 'third'])
+
+
+class ParseProfileTests(UniverseComparison, unittest.TestCase):
+    """Test the per-phase parse profile"""
+
+    def test_profile_matches_unprofiled_reader(self):
+        for filename in self.filenames:
+            universe = self.read(filename, profile=True)
+            self.assertUniversesEqual(self.read(filename), universe)
+        self.assertIsNone(self.read(self.filenames[0]).parse_profile)
+
+    def test_phases(self):
+        for engine in Reader._engines:
+            profile = self.read(self.filenames[1], engine=engine,
+                profile=True).parse_profile
+            names = [p['name'] for p in profile.phases]
+            self.assertEqual(names[0], 'find_content_offsets')
+            for name in ('Parameters;', 'Tables;', 'Columns;', 'Objects;',
+                    'perform_cross_reference_analysis',
+                    '_extract_schema_details', '_extract_lov_definitions'):
+                self.assertIn(name, names)
+            tables = profile.phase('Tables;')
+            self.assertEqual(tables['kind'], 'section')
+            self.assertGreater(tables['bytes'], 0)
+            self.assertGreater(tables['reads'], 0)
+            self.assertGreater(tables['wall_time'], 0)
+            self.assertEqual(profile.phase('_extract_join_details')['depth'],
+                1)
+            totals = profile.totals()
+            self.assertEqual(totals['bytes'], sum(p['bytes']
+                for p in profile.phases if p['depth'] == 0))
+            self.assertEqual(len(profile.format().splitlines()),
+                len(profile.phases) + 2)
+            json.dumps(profile.as_dict())
+
+    def test_lazy_profile(self):
+        with open(self.filenames[1], 'rb') as f:
+            reader = Reader(f, lazy=True, profile=True)
+        profile = reader.universe.parse_profile
+        self.assertEqual([p['name'] for p in profile.phases],
+            ['find_content_offsets', 'open_archive'])
+        reader.universe.joins
+        self.assertEqual(profile.phases[-1]['name'], 'Joins;')
+        reader.close()
+
+    def test_snapshot_leaves_out_profile(self):
+        universe = self.read(self.filenames[1], profile=True)
+        self.assertIsNone(snapshot.loads(snapshot.dumps(universe)).parse_profile)
+
+
+class RecordingTracer(Tracer):
+
+    def __init__(self):
+        super(RecordingTracer, self).__init__()
+        self.calls = []
+
+    def start(self, name, kind):
+        self.calls.append(('start', name, kind))
+
+    def end(self, name, kind, error=None):
+        self.calls.append(('end', name, kind, error))
+
+    def event(self, name, fields):
+        self.calls.append(('event', name, fields))
+
+
+class TracerTests(UniverseComparison, unittest.TestCase):
+    """Test the reader's tracing hooks"""
+
+    def test_reader_is_quiet_by_default(self):
+        out = io.StringIO()
+        saved, sys.stdout = sys.stdout, out
+        try:
+            for filename in self.filenames:
+                self.read(filename)
+        finally:
+            sys.stdout = saved
+        self.assertEqual(out.getvalue(), '')
+
+    def test_spans_nest(self):
+        tracer = RecordingTracer()
+        universe = self.read(self.filenames[1], tracer=tracer)
+        self.assertUniversesEqual(self.read(self.filenames[1]), universe)
+        stack = []
+        for call in tracer.calls:
+            if call[0] == 'start':
+                stack.append(call[1])
+            elif call[0] == 'end':
+                self.assertEqual(stack.pop(), call[1])
+                self.assertIsNone(call[3])
+        self.assertEqual(stack, [])
+        started = [c[1] for c in tracer.calls if c[0] == 'start']
+        self.assertEqual(started[0], 'find_content_offsets')
+        self.assertIn('Objects;', started)
+        self.assertIn('_extract_join_details', started)
+
+    def test_events(self):
+        tracer = RecordingTracer()
+        universe = self.read(self.filenames[1], tracer=tracer)
+        events = [c for c in tracer.calls if c[0] == 'event']
+        tables = [e[2] for e in events if e[1] == 'derived_table']
+        self.assertEqual([t['table_id'] for t in tables],
+            [t.id_ for t in universe.tables])
+        connection = [e[2] for e in events if e[1] == 'connection_info']
+        self.assertEqual(connection[0]['connection_name'], 'efashion-webi')
+        counts = [e[2] for e in events if e[1] == 'enhanced_analysis'][0]
+        self.assertEqual(counts['lov_definitions'],
+            len(universe.lov_definitions))
+
+    def test_profile_and_tracer_together(self):
+        tracer = RecordingTracer()
+        universe = self.read(self.filenames[0], tracer=tracer, profile=True)
+        started = [c[1] for c in tracer.calls if c[0] == 'start']
+        self.assertEqual(started,
+            [p['name'] for p in universe.parse_profile.phases])
+
+    def test_error_ends_span(self):
+        tracer = RecordingTracer()
+        with open(self.filenames[1], 'rb') as f:
+            reader = Reader(f, lazy=True, tracer=tracer)
+        reader.close()
+        self.assertRaises(Exception, getattr, reader.universe, 'tables')
+        self.assertEqual(tracer.calls[-1][:3], ('end', 'Tables;', 'section'))
+        self.assertIsNotNone(tracer.calls[-1][3])
+
+    def test_print_tracer(self):
+        out = io.StringIO()
+        self.read(self.filenames[1], tracer=PrintTracer(out))
+        lines = out.getvalue().splitlines()
+        self.assertIn('Extracting Prompts Information:', lines)
+        self.assertIn('Table: Calendar_year_lookup | ID: 19 | SQL: '
+            '<no virtual table>', lines)
+
+
+class BenchmarkTests(unittest.TestCase):
+    """Test the benchmark harness"""
+
+    def test_run(self):
+        results = benchmark.run('tests/universes', scales=(1,), repeat=1)
+        self.assertIn('eFashion.unv', results['cases'])
+        case = results['cases']['synthetic_x1']
+        for name in benchmark.MEASUREMENTS + ('total',):
+            self.assertGreater(case[name], 0)
+        self.assertEqual(case['tables'], synthetic.REFERENCE['tables'] +
+            synthetic.REFERENCE['aliases'] +
+            synthetic.REFERENCE['derived_tables'])
+        self.assertEqual(case['objects'], synthetic.REFERENCE['classes'] *
+            synthetic.REFERENCE['objects_per_class'])
+        self.assertEqual(benchmark.compare(results, results), [])
+        self.assertEqual(len(benchmark.format_results(results).splitlines()),
+            len(results['cases']) + 1)
+
+    def test_compare(self):
+        baseline = {'cases': {'a': {'parse': 0.1, 'analysis': 0.001,
+            'peak_memory': 10 * 1024 * 1024}, 'b': {'parse': 0.1}}}
+        results = {'cases': {'a': {'parse': 0.2, 'analysis': 0.002,
+            'peak_memory': 10 * 1024 * 1024}, 'c': {'parse': 9.0}}}
+        regressions = benchmark.compare(results, baseline)
+        # analysis doubled, but by less than the noise threshold
+        self.assertEqual([(r['case'], r['measurement']) for r in regressions],
+            [('a', 'parse')])
+        self.assertAlmostEqual(regressions[0]['ratio'], 2.0)
+        self.assertEqual(benchmark.compare(results, baseline, tolerance=1.5),
+            [])
+
+
+class SyntheticTests(unittest.TestCase):
+    """Test that synthetic universes read back as they were written"""
+
+    arguments = {'tables': 5, 'aliases': 3, 'derived_tables': 2,
+        'columns_per_table': 4, 'classes': 7, 'depth': 3,
+        'objects_per_class': 8, 'conditions_per_class': 2, 'joins': 12,
+        'contexts': 3, 'links': 2, 'hierarchies': 4, 'name': 'Round trip'}
+
+    def read(self, **kwargs):
+        return Reader(synthetic.generate(**self.arguments),
+            **kwargs).universe
+
+    def test_round_trip(self):
+        universe = self.read()
+        self.assertEqual(universe.parameters.universe_name, 'Round trip')
+        self.assertEqual(universe.custom_parameters,
+            {'GENERATOR': 'pyunv.synthetic'})
+        self.assertEqual(universe.statistics, {'tables': 7, 'aliases': 3,
+            'classes': 7, 'objects': 56, 'conditions': 14, 'joins': 12,
+            'contexts': 3})
+        self.assertEqual([t.name for t in universe.tables if t.is_alias],
+            ['Alias_1', 'Alias_2', 'Alias_3'])
+        self.assertEqual(universe.table_map[9].fullname,
+            'dbo.Alias_2 (alias for dbo.Table_2)')
+        self.assertEqual([v.select for v in universe.virtual_tables],
+            ['SELECT col_0, col_1, col_2, col_3 FROM Table_1',
+            'SELECT col_0, col_1, col_2, col_3 FROM Table_2'])
+        self.assertEqual(len(universe.columns), 10 * 4)
+        self.assertEqual(universe.joins[0].statement,
+            'Table_1.col_0=Table_2.col_0')
+        self.assertEqual([len(c.joins) for c in universe.contexts], [4, 4, 4])
+        self.assertEqual([l.linked_universe for l in universe.links],
+            ['Linked_1.unv', 'Linked_2.unv'])
+        self.assertEqual(universe.hierarchies[1].levels, [9, 10, 11])
+        self.assertEqual(universe.validation_errors, [])
+
+    def test_nesting(self):
+        universe = self.read()
+        self.assertEqual([c.name for c in universe.classes],
+            ['Class 1', 'Class 4', 'Class 7'])
+        chain = [universe.classes[0]]
+        while chain[-1].subclasses:
+            chain.extend(chain[-1].subclasses)
+        self.assertEqual([c.name for c in chain],
+            ['Class 1', 'Class 2', 'Class 3'])
+        self.assertEqual(universe.object_map[12].parent.name, 'Class 2')
+
+    def test_object_sql(self):
+        universe = self.read()
+        obj = universe.object_map[4]
+        self.assertEqual(obj.select, '\x035.col_3')
+        self.assertEqual(obj.select_sql, 'Table_5.col_3')
+        self.assertEqual(obj.where_sql, 'Table_5.col_0 IS NOT NULL')
+        self.assertIsNone(universe.object_map[1].where)
+        condition = universe.classes[0].conditions[0]
+        self.assertEqual(condition.id_, 57)
+        self.assertEqual(condition.where_sql, 'Alias_1.col_0 > 0')
+
+    def test_engines_and_snapshot(self):
+        expected = self.read()
+        MappedEngineTests.assertUniversesEqual(self, expected,
+            self.read(engine='mmap'))
+        MappedEngineTests.assertUniversesEqual(self, expected,
+            snapshot.loads(snapshot.dumps(expected)))
+
+    def test_limits(self):
+        self.assertRaises(ValueError, synthetic.generate, tables=9000,
+            aliases=1000)
+        self.assertRaises(ValueError, synthetic.generate, tables=0,
+            aliases=1)
+        self.assertRaises(ValueError, synthetic.generate, depth=0)
+
+    def test_command_line(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'big.unv')
+        self.assertEqual(synthetic.main(['synthetic', '--scale', '2',
+            '--links', '1', path]), 0)
+        universe = Reader(path).universe
+        self.assertEqual(universe.parameters.universe_name, 'Synthetic x2')
+        self.assertEqual(universe.statistics['tables'],
+            2 * (synthetic.REFERENCE['tables'] +
+            synthetic.REFERENCE['derived_tables']))
+        self.assertEqual(len(universe.links), 1)
+        self.assertEqual(synthetic.main(['synthetic', '--depth', 'x', path]),
+            2)
+
+
+class InventoryTests(unittest.TestCase):
+    """Test the header-only universe inventory"""
+
+    def test_matches_reader(self):
+        for filename in MappedEngineTests.filenames:
+            row = inventory.scan_inventory(filename)
+            universe = Reader(filename).universe
+            parameters = universe.parameters
+            self.assertEqual(row['path'], filename)
+            self.assertEqual((row['universe_name'], row['revision'],
+                row['created_date'], row['modified_date'],
+                row['dbms_engine'], row['network_layer']),
+                (parameters.universe_name, parameters.revision,
+                parameters.created_date, parameters.modified_date,
+                parameters.dbms_engine, parameters.network_layer))
+            self.assertEqual((row['tables'], row['virtual_tables'],
+                row['columns'], row['joins'], row['contexts'],
+                row['root_classes']), (len(universe.tables),
+                len(universe.virtual_tables), len(universe.columns),
+                len(universe.joins), len(universe.contexts),
+                len(universe.classes)))
+            self.assertIsNone(row['error'])
+
+    def test_synthetic_counts(self):
+        row = inventory.scan_inventory(synthetic.generate(
+            **SyntheticTests.arguments))
+        statistics = Reader(synthetic.generate(
+            **SyntheticTests.arguments)).universe.statistics
+        self.assertIsNone(row['path'])
+        self.assertEqual(row['universe_name'], 'Round trip')
+        self.assertEqual(row['tables'],
+            statistics['tables'] + statistics['aliases'])
+        for name in ('classes', 'objects', 'conditions', 'joins',
+                'contexts'):
+            self.assertEqual(row[name], statistics[name])
+        self.assertEqual((row['max_table_id'], row['links'],
+            row['hierarchies'], row['root_classes']), (10, 2, 4, 3))
+
+    def test_missing_sections(self):
+        row = inventory.scan_inventory(b'\x00' * 64)
+        self.assertEqual(set(row.values()), set([None]))
+
+    def test_write_inventory(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        broken = os.path.join(directory, 'broken.unv')
+        with open(broken, 'wb') as f:
+            f.write(b'\x00Parameters;\x00')
+        rows = list(inventory.scan_inventories(['tests/universes',
+            broken]))
+        self.assertEqual(len(rows), 9)
+        errors = dict((row['path'], row['error']) for row in rows
+            if row['error'])
+        self.assertEqual(list(errors), [broken])
+        self.assertTrue(errors[broken].startswith('error: '), errors)
+        out = io.StringIO()
+        self.assertEqual(inventory.write_inventory(rows, out), 9)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], ','.join(inventory.FIELDS))
+        self.assertIn('tests/universes/eFashion.unv,eFashion,eFashion,128,'
+            '2025-09-01,2025-09-22,MS Access 2007,ODBC,10,40,0,79,9,2,,,29,5,'
+            '509,17,', lines)
+
+
+class SqlExpansionTests(unittest.TestCase):
+    """Test the cached expansion of object and condition SQL"""
+
+    def setUp(self):
+        self.universe = Reader(synthetic.generate(
+            **SyntheticTests.arguments)).universe
+        self.obj = self.universe.object_map[4]
+
+    def test_cached_until_sql_changes(self):
+        select = self.obj.select_sql
+        self.assertEqual(select, 'Table_5.col_3')
+        self.assertIs(self.obj.select_sql, select)
+        self.obj.select = '\x032.col_1'
+        self.assertEqual(self.obj.select_sql, 'Table_2.col_1')
+        self.obj.where = None
+        self.assertIsNone(self.obj.where_sql)
+
+    def test_invalidated_when_maps_change(self):
+        self.assertEqual(self.obj.where_sql, 'Table_5.col_0 IS NOT NULL')
+        self.universe.table_map = {}
+        self.assertEqual(self.obj.where_sql,
+            'UnknownTable_5.col_0 IS NOT NULL')
+        self.universe.build_table_map()
+        self.assertEqual(self.obj.where_sql, 'Table_5.col_0 IS NOT NULL')
+        self.universe.table_map[5].name = 'Renamed'
+        self.assertEqual(self.obj.where_sql, 'Table_5.col_0 IS NOT NULL')
+        self.universe.invalidate_sql()
+        self.assertEqual(self.obj.where_sql, 'Renamed.col_0 IS NOT NULL')
+
+    def test_single_pass(self):
+        self.obj.select = 'sum(\x033.col_1) + \x021 - \x02999 + \x0377'
+        self.assertEqual(self.obj.select_sql, 'sum(Table_3.col_1) + '
+            'Class 1.Object 1 - UnknownObject_999 + UnknownTable_77')
+        plain = 'count(*)'
+        self.assertIs(self.obj.expand_sql(plain), plain)
+        self.assertIsNone(self.obj.expand_sql(''))
+
+    def test_lazy_and_snapshot(self):
+        data = synthetic.generate(**SyntheticTests.arguments)
+        lazy = Reader(data, lazy=True).universe
+        obj = lazy.object_map[4]
+        self.assertEqual(obj.select_sql, 'Table_5.col_3')
+        self.assertNotIn('tables', lazy.pending)
+        self.assertIs(obj.select_sql, obj.select_sql)
+        self.universe.invalidate_sql()
+        data = snapshot.dumps(self.universe)
+        self.assertNotIn(b'sql_generation', data)
+        loaded = snapshot.loads(data)
+        self.assertEqual(loaded.object_map[4].select_sql, 'Table_5.col_3')
+
+
+class UniverseIndexTests(unittest.TestCase):
+    """Test the name and id indexes on Universe"""
+
+    def setUp(self):
+        self.universe = Reader(synthetic.generate(
+            **SyntheticTests.arguments)).universe
+
+    def test_table_names(self):
+        tables = self.universe.table_name_map
+        self.assertIs(tables['Table_2'], self.universe.table_map[2])
+        self.assertIs(tables['dbo.Alias_1'], self.universe.table_map[8])
+        self.assertTrue(tables['Alias_1'].is_alias)
+        self.assertNotIn('Missing', tables)
+        duplicate = Table(self.universe, 99, 0, 'Table_2', 'dbo')
+        self.universe.tables = self.universe.tables + [duplicate]
+        self.assertIs(self.universe.table_name_map['Table_2'],
+            self.universe.table_map[2])
+
+    def test_objects_classes_contexts_joins(self):
+        u = self.universe
+        self.assertIs(u.object_name_map['Class 2.Object 12'],
+            u.object_map[12])
+        self.assertIs(u.class_path_map['Class 1\\Class 2\\Class 3'],
+            u.classes[0].subclasses[0].subclasses[0])
+        self.assertIs(u.class_path_map['Class 7'], u.classes[2])
+        self.assertEqual(len(u.class_path_map), 7)
+        self.assertEqual(u.context_map[2].name, 'Context 2')
+        self.assertEqual(u.join_map[12].statement,
+            'Table_2.col_0=Table_3.col_0')
+
+    def test_invalidation(self):
+        u = self.universe
+        self.assertIn(3, u.context_map)
+        u.contexts = u.contexts[:1]
+        self.assertEqual(list(u.context_map), [1])
+        table = u.table_name_map['Table_3']
+        table.name = 'Renamed'
+        self.assertIs(u.table_name_map['Table_3'], table)
+        u.reindex()
+        self.assertNotIn('Table_3', u.table_name_map)
+        self.assertIs(u.table_name_map['Renamed'], table)
+        self.assertEqual(u.object_map[2].select_sql, 'Renamed.col_1')
+
+    def test_lazy_and_snapshot(self):
+        data = synthetic.generate(**SyntheticTests.arguments)
+        lazy = Reader(data, lazy=True).universe
+        self.assertEqual(len(lazy.table_name_map), 20)
+        self.assertEqual(len(lazy.class_path_map), 7)
+        self.assertNotIn(b'_indexes', snapshot.dumps(lazy))
+        loaded = snapshot.loads(snapshot.dumps(lazy))
+        self.assertEqual(sorted(loaded.table_name_map),
+            sorted(lazy.table_name_map))
+
+    def test_analyses_use_indexes(self):
+        u = self.universe
+        self.assertEqual(u.cross_references['obj_4_table_5']['table_name'],
+            'Table_5')
+        self.assertEqual(len([r for r in u.cross_references.values()
+            if r['type'] == 'join_table']), 2 * len(u.joins))
+        # the synthetic contexts share no joins, so every object used in
+        # more than one context is reported once per pair
+        self.assertTrue(u.context_incompatibilities)
+        for incompatibility in u.context_incompatibilities:
+            obj = u.object_map[incompatibility['object_id']]
+            self.assertEqual(incompatibility['object_name'], obj.name)
+            self.assertEqual(incompatibility['context1_name'],
+                u.context_map[incompatibility['context1_id']].name)
+
+
+class SqlScanTests(unittest.TestCase):
+    """Test the SQL reference scanner and the cached reference profiles"""
+
+    def test_scan(self):
+        refs = scan_sql("sum(\x033.col_1) + \x021 -- Other.x\n"
+            "WHERE dbo.Orders.id = \"My Table\".id AND x IN "
+            "@Prompt('Pick a.b', 'A', {'x'}) AND \x033.col_2 = 'it''s'")
+        self.assertEqual(refs.table_refs, (3, 'dbo.Orders', 'My Table'))
+        self.assertEqual(refs.object_refs, (1,))
+        self.assertEqual(refs.functions, ('Prompt',))
+        self.assertEqual(refs.prompts, ("'Pick a.b', 'A', {'x'}",))
+        self.assertEqual(refs.literals, ('Pick a.b', 'A', 'x', "it's"))
+        self.assertEqual(scan_sql(None).table_refs, ())
+
+    def test_aggregate_aware(self):
+        refs = scan_sql("@Aggregate_Aware(sum(Agg.x), sum(f(Facts.x, 'a,b'))"
+            ") + Other.y")
+        self.assertEqual(refs.table_refs, ('Agg', 'Facts', 'Other'))
+        self.assertEqual([a.table_refs for a in refs.aggregate_alternatives],
+            [('Agg',), ('Facts',)])
+        self.assertEqual(scan_sql('sum(Facts.x)').aggregate_alternatives, ())
+
+    def test_cached_references(self):
+        universe = Reader(synthetic.generate(
+            **SyntheticTests.arguments)).universe
+        obj = universe.object_map[4]
+        references = obj.select_references
+        self.assertEqual(references.table_refs, (5,))
+        self.assertEqual(references.table_names(universe), ('Table_5',))
+        self.assertIs(obj.select_references, references)
+        obj.select = '\x032.col_1 + \x0399.col_1'
+        self.assertEqual(obj.select_references.table_names(universe),
+            ('Table_2', 'UnknownTable_99'))
+        self.assertEqual(obj.where_references.table_refs, (5,))
+
+    def test_universe_not_kept(self):
+        universe = Reader('tests/universes/Univers5.unv').universe
+        self.assertEqual(scan_sql(None).table_names(universe), ())
+        self.assertIsNone(scan_sql('').__dict__['_names'])
+        references = scan_sql('Customers.name')
+        self.assertEqual(references.table_names(universe), ('Customers',))
+        alive = weakref.ref(universe)
+        del universe
+        gc.collect()
+        self.assertIsNone(alive())
+
+    def test_schema_qualified_tables(self):
+        universe = Reader('tests/universes/universe_xir2.unv').universe
+        self.assertEqual(universe.validation_errors, [])
+        self.assertIn('obj_2_table_5', universe.cross_references)
+
+
+class AnalysisRegistryTests(unittest.TestCase):
+    """Test registering custom analyses"""
+
+    filename = 'tests/universes/eFashion.unv'
+
+    def setUp(self):
+        def count_tables(reader):
+            u = reader.universe
+            u.context_table_counts = dict((i, len(c['tables_involved']))
+                for i, c in u.context_details.items())
+
+        class CustomReader(Reader):
+            pass
+
+        CustomReader.register_analysis('context_table_counts',
+            count_tables, outputs=('context_table_counts',),
+            requires=('context_details',))
+        self.Reader = CustomReader
+
+    def test_registered_analysis(self):
+        self.assertNotIn('context_table_counts',
+            [a[0] for a in Reader._analyses])
+        universe = self.Reader(self.filename).universe
+        self.assertEqual(sorted(universe.context_table_counts), [45, 46])
+
+    def test_only_what_is_requested(self):
+        reader = self.Reader(self.filename, sections=(),
+            analyses=('context_table_counts',))
+        self.assertEqual(reader.analyses, set(('context_table_counts',
+            'context_details', 'schema_details')))
+        self.assertEqual(reader.universe.cross_references, {})
+        self.assertEqual(len(reader.universe.context_table_counts), 2)
+
+    def test_lazy(self):
+        with open(self.filename, 'rb') as f:
+            reader = self.Reader(f, lazy=True)
+        self.assertIn('context_table_counts', reader.universe.pending)
+        self.assertEqual(len(reader.universe.context_table_counts), 2)
+        reader.close()
+
+    def test_bad_registrations(self):
+        self.assertRaises(ValueError, self.Reader.register_analysis,
+            'validation', 'perform_validation_checks')
+        self.assertRaises(ValueError, self.Reader.register_analysis,
+            'other', 'perform_validation_checks', requires=('nonsense',))
+
+    def test_shared_objects(self):
+        universe = Reader(self.filename, analyses=()).universe
+        objects = universe.all_objects
+        self.assertEqual(len(objects), 41)
+        self.assertIs(universe.all_objects, objects)
+        self.assertEqual(objects[0].id_, universe.classes[0].objects[0].id_)
+
+
+class ContextIncompatibilityTests(unittest.TestCase):
+    """Test the context incompatibility analysis"""
+
+    def test_matches_pairwise_check(self):
+        reader = Reader(synthetic.generate(tables=4, joins=12, contexts=6,
+            objects_per_class=8))
+        universe = reader.universe
+        details = universe.context_details
+        # contexts 1 and 2 share a join; the others share none
+        details[1]['joins'].append(details[2]['joins'][0])
+        reader._analyze_context_incompatibilities()
+        contexts_by_table = {}
+        for context_id, info in details.items():
+            for table_id in info['tables_involved']:
+                name = universe.database_tables[table_id]['name']
+                contexts_by_table.setdefault(name, set()).add(context_id)
+        expected = []
+        for obj in universe.all_objects:
+            contexts = set()
+            for name in obj.select_references.table_names(universe):
+                contexts.update(contexts_by_table.get(name, ()))
+            contexts = sorted(contexts)
+            for i, ctx1 in enumerate(contexts):
+                for ctx2 in contexts[i+1:]:
+                    if not set(details[ctx1]['joins']) & \
+                            set(details[ctx2]['joins']):
+                        expected.append((obj.id_, ctx1, ctx2))
+        found = [(i['object_id'], i['context1_id'], i['context2_id'])
+            for i in universe.context_incompatibilities]
+        self.assertTrue(found)
+        self.assertEqual(found, expected)
+
+    def test_efashion(self):
+        universe = Reader('tests/universes/eFashion.unv').universe
+        pairs = set((i['context1_id'], i['context2_id'])
+            for i in universe.context_incompatibilities)
+        self.assertEqual(pairs, set([(45, 46)]))
+
+
+class JoinGraphTests(unittest.TestCase):
+    """Test join path resolution"""
+
+    def setUp(self):
+        # six tables joined in a ring: join n links tables n and n+1, and
+        # join 6 links table 6 back to table 1; context 1 has the odd
+        # joins and context 2 the even ones
+        self.universe = Reader(synthetic.generate(tables=6, joins=6,
+            contexts=2), analyses=()).universe
+        self.graph = self.universe.join_graph
+
+    def test_shortest_path(self):
+        self.assertEqual(self.graph.path([1, 3]), (1, 2))
+        self.assertEqual(self.graph.path([3, 1]), (1, 2))
+        self.assertEqual(self.graph.path(['Table_1', 'Table_5']), (6, 5))
+        self.assertEqual(self.graph.path([1, 2, 4]), (1, 2, 3))
+        self.assertEqual(self.graph.path([4]), ())
+        self.assertEqual(self.graph.neighbours(1), [(2, 1), (6, 6)])
+
+    def test_context(self):
+        self.assertEqual(self.graph.path([1, 2], 1), (1,))
+        self.assertEqual(self.graph.path([1, 6], 'Context 2'), (6,))
+        self.assertIsNone(self.graph.path([1, 3], 1))
+        self.assertRaises(ValueError, self.graph.path, [1, 2], 'Nonsense')
+        self.assertRaises(ValueError, self.graph.path, [1, 99])
+
+    def test_memoized(self):
+        self.graph.path([1, 4])
+        self.assertIn((frozenset((0, 3)), None), self.graph._paths)
+        self.graph._paths[(frozenset((0, 3)), None)] = 'cached'
+        self.assertEqual(self.graph.path([4, 1]), 'cached')
+        self.assertIs(self.universe.join_graph, self.graph)
+        self.universe.joins = self.universe.joins[:3]
+        self.assertIsNone(self.universe.join_graph.path([1, 4], 2))
+        self.assertEqual(self.universe.join_graph.path([1, 4]), (1, 2, 3))
+
+    def test_objects(self):
+        objects = [self.universe.object_map[i] for i in (1, 2)]
+        tables = [r.table_refs for o in objects
+            for r in (o.select_references, o.where_references)]
+        self.assertEqual(tables, [(2,), (), (3,), ()])
+        result = self.graph.path_for_objects(objects)
+        self.assertEqual(result.joins, (2,))
+        self.assertEqual(result.tables, (2, 3))
+        self.assertEqual(result.unresolved, ())
+        self.assertIsNone(self.graph.path_for_objects(objects, 1).joins)
+
+    def test_unresolved(self):
+        obj = self.universe.object_map[1]
+        obj.where = 'Missing_table.x = \x0399.col_1 AND \x034.col_1 = 1'
+        result = self.graph.path_for_objects([obj])
+        self.assertEqual(result.joins, (2, 3))
+        self.assertEqual(result.tables, (2, 4))
+        self.assertEqual(result.unresolved, ('Missing_table', 99))
+        self.assertRaises(ValueError, self.graph.path, ['Missing_table'])
+
+    def test_aggregate_aware(self):
+        obj = self.universe.object_map[1]
+        obj.select = ('@aggregate_aware(sum(\x035.col_1), '
+            'sum(\x032.col_1))')
+        objects = [obj, self.universe.object_map[2]]
+        # table 5 is the first choice, but context 2 can't join it to 3
+        result = self.graph.path_for_objects(objects)
+        self.assertEqual(result.tables, (3, 5))
+        result = self.graph.path_for_objects(objects, 2)
+        self.assertEqual(result.joins, (2,))
+        self.assertEqual(result.tables, (2, 3))
+
+    def test_efashion(self):
+        universe = Reader('tests/universes/eFashion.unv').universe
+        graph = universe.join_graph
+        for obj in universe.all_objects:
+            result = graph.path_for_objects([obj])
+            self.assertTrue(set(result.tables) <= set(graph.table_ids))
+        discount = [o for o in universe.all_objects
+            if o.name == 'Discount'][0]
+        self.assertIn('Article_lookup',
+            graph.path_for_objects([discount]).unresolved)
+
+    def test_universe(self):
+        graph = Reader('tests/universes/universe_xir2.unv').universe.join_graph
+        self.assertEqual(graph.path(['public.barcode', 'public.customer']),
+            (9, 13, 15, 12))
+        self.assertEqual(graph.path(['public.orderline', 'public.customer'],
+            'CustomerOrder'), (12, 15))
+        self.assertIsNone(graph.path(['public.barcode', 'public.customer'],
+            'CustomerOrder'))
+
+
+class ReaderCleanupTests(unittest.TestCase):
+    """Test that a reader that fails closes what it opened"""
+
+    def setUp(self):
+        with open('tests/universes/eFashion.unv', 'rb') as f:
+            data = f.read()
+        fd, self.path = tempfile.mkstemp(suffix='.unv')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data[:len(data) // 2])
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    @unittest.skipUnless(os.path.isdir('/proc/self/fd'),
+        'needs /proc/self/fd')
+    def test_truncated_universe(self):
+        for engine in Reader._engines:
+            before = len(os.listdir('/proc/self/fd'))
+            try:
+                Reader(self.path, engine=engine)
+            except Exception:
+                # the traceback still refers to the reader here
+                self.assertEqual(len(os.listdir('/proc/self/fd')), before)
+            else:
+                self.fail('a truncated universe was read')
+
+
+if __name__ == '__main__':
+    unittest.main()